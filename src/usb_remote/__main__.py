@@ -1,27 +1,21 @@
 """Interface for ``python -m usb_remote``."""
 
+# Command modules and their heavy dependencies (pydantic, pyudev, pyusb) are
+# imported inside each command so that startup only pays for what it uses.
+
 import logging
+import threading
 from collections.abc import Sequence
-from enum import Enum
-from typing import Annotated
+from enum import Enum, StrEnum
+from typing import TYPE_CHECKING, Annotated, Literal
 
 import typer
 
-from usb_remote.port import Port
-
 from . import __version__
-from .client import attach_device, detach_device, find_device, list_devices
-from .client_service import ClientService
-from .config import (
-    Defaults,
-    discover_config_path,
-    get_config,
-    save_servers,
-)
-from .server import CommandServer
-from .service import install_systemd_service, uninstall_systemd_service
-from .usbdevice import get_devices
-from .utility import get_host_list
+
+if TYPE_CHECKING:
+    from .client_api import ClientDeviceResponse
+    from .usbdevice import UsbDevice
 
 __all__ = ["main"]
 
@@ -38,6 +32,13 @@ class ServiceType(str, Enum):
     CLIENT = "client"
 
 
+class IdleState(StrEnum):
+    """What the server does with bound devices that no client is using."""
+
+    BOUND = "bound"
+    RELEASED = "released"
+
+
 def version_callback(value: bool) -> None:
     """Output version and exit."""
     if value:
@@ -78,9 +79,63 @@ def common_options(
 
 
 @app.command()
-def ports() -> None:
+def ports(
+    watch: bool = typer.Option(
+        False,
+        "--watch",
+        "-w",
+        help="Keep running and report ports and their devices as they change",
+    ),
+    as_json: bool = typer.Option(
+        False, "--json", help="Print each port or change as a line of JSON"
+    ),
+) -> None:
     """List the local usbip ports in use."""
+    from .client_api import PortEvent
+    from .port import Port, PortTable
+
+    # changes are reported from the udev observer and port table threads
+    output_lock = threading.Lock()
+
+    def report(event: str, port: Port, local_devices: list[str]) -> None:
+        if as_json:
+            line = PortEvent.model_validate(
+                {
+                    "event": event,
+                    "port": port.port_number,
+                    "server": port.server,
+                    "remote_busid": port.remote_busid,
+                    "description": port.description,
+                    "local_devices": local_devices,
+                }
+            ).model_dump_json()
+        else:
+            devices = ", ".join(local_devices) if local_devices else "none"
+            line = (
+                f"{event.capitalize()}: port {port.port_number} "
+                f"busid {port.remote_busid} from {port.server}, "
+                f"local devices: {devices}"
+            )
+        with output_lock:
+            typer.echo(line)
+
+    if watch:
+        # the table reports each port in use as a "port" event when started
+        table = PortTable(on_change=report)
+        table.start()
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            table.stop()
+        return
+
     ports = Port.list_ports()
+    if as_json:
+        for port in ports:
+            report("port", port, port.local_devices)
+        return
     if not ports:
         typer.echo("No local usbip ports in use.")
         return
@@ -92,8 +147,25 @@ def ports() -> None:
 @app.command()
 def server(
     ctx: typer.Context,
+    beacon: str | None = typer.Option(
+        None,
+        "--beacon",
+        help="Broadcast or multicast address to announce this server on",
+    ),
+    idle_state: IdleState | None = typer.Option(
+        None,
+        "--idle-state",
+        help="Keep devices no client is using bound to usbip, or release them",
+    ),
+    idle_timeout: float | None = typer.Option(
+        None,
+        "--idle-timeout",
+        help="Seconds an unused device stays bound before it is released",
+    ),
 ) -> None:
     """Start the USB sharing server."""
+    from .server import CommandServer
+
     debug = ctx.obj.get("debug", False)
     log_level = logging.DEBUG if debug else logging.INFO
 
@@ -105,7 +177,11 @@ def server(
         f"Starting server {__version__} with log level: "
         f"{logging.getLevelName(log_level)}"
     )
-    server = CommandServer()
+    server = CommandServer(
+        beacon_address=beacon,
+        idle_state=idle_state.value if idle_state else None,
+        idle_timeout=idle_timeout,
+    )
     server.start()
 
 
@@ -114,6 +190,8 @@ def client_service_command(
     ctx: typer.Context,
 ) -> None:
     """Start the USB client service that accepts socket commands."""
+    from .client_service import ClientService
+
     debug = ctx.obj.get("debug", False)
     log_level = logging.DEBUG if debug else logging.INFO
 
@@ -129,6 +207,50 @@ def client_service_command(
     service.start()
 
 
+@app.command()
+def registry(
+    ctx: typer.Context,
+    beacon: str | None = typer.Option(
+        None,
+        "--beacon",
+        help="Address to listen for server beacons on (default: beacon_address)",
+    ),
+) -> None:
+    """Start a registry that answers list and find for all servers."""
+    from .registry import Registry
+
+    if not ctx.obj.get("debug", False):
+        setup_logging(logging.INFO)
+
+    logger.info(f"Starting registry {__version__}")
+    registry = Registry(beacon_address=beacon)
+    registry.start()
+
+
+@app.command()
+def helper(
+    ctx: typer.Context,
+    group: str | None = typer.Option(
+        None,
+        "--group",
+        "-g",
+        help="Group whose members may use the helper (default: root only)",
+    ),
+) -> None:
+    """Start the privileged helper that runs usbip commands as root."""
+    from .helper import PrivilegedHelper
+
+    if not ctx.obj.get("debug", False):
+        setup_logging(logging.INFO)
+
+    logger.info(f"Starting privileged helper {__version__}")
+    helper = PrivilegedHelper(group=group)
+    try:
+        helper.start()
+    finally:
+        helper.stop()
+
+
 @app.command(name="list")
 def list_command(
     local: bool = typer.Option(
@@ -140,19 +262,60 @@ def list_command(
     host: str | None = typer.Option(
         None, "--host", "-H", help="Server hostname or IP address"
     ),
+    rescan: bool = typer.Option(
+        False, "--rescan", help="Rescan server_ranges instead of using the cache"
+    ),
+    exported: bool = typer.Option(
+        False,
+        "--exported",
+        "-e",
+        help="Also ask usbipd on each server which devices are already exported",
+    ),
 ) -> None:
     """List the available USB devices from configured server(s)."""
     if local:
+        from .usbdevice import get_devices
+
         logger.debug("Listing local USB devices")
         devices = get_devices()
         for device in devices:
             typer.echo(device)
     else:
-        servers = get_host_list(host)
-
-        logger.debug(f"Listing remote USB devices on hosts: {servers}")
-
-        results = list_devices(server_hosts=servers)
+        from .api import ListRequest
+        from .client import list_devices, registry_list_devices
+        from .client_api import (
+            ClientDeviceRequest,
+            ClientListResponse,
+            send_client_request,
+        )
+        from .config import get_config
+        from .utility import probe_host_list
+
+        # the client service does not query usbipd
+        forwarded = (
+            None
+            if exported
+            else send_client_request(
+                ClientDeviceRequest(
+                    command="list", host=host, rescan=rescan, config=get_config()
+                )
+            )
+        )
+        if forwarded is not None:
+            assert isinstance(forwarded, ClientListResponse)
+            results = forwarded.data
+        else:
+            # the registry does not query usbipd either
+            results = None if host or rescan or exported else registry_list_devices()
+        if results is None:
+            request = ListRequest().model_dump_json().encode("utf-8")
+            servers, probed = probe_host_list(host, rescan, request)
+
+            logger.debug(f"Listing remote USB devices on hosts: {servers}")
+
+            results = list_devices(
+                server_hosts=servers, probed=probed, exported=exported
+            )
 
         for server, devices in results.items():
             typer.echo(f"\n=== {server} ===")
@@ -163,6 +326,92 @@ def list_command(
                 typer.echo("No devices")
 
 
+def _find_device(
+    host: str | None,
+    rescan: bool,
+    id: str | None,
+    bus: str | None,
+    desc: str | None,
+    serial: str | None,
+    first: bool,
+    timings: dict[str, float] | None = None,
+) -> tuple["UsbDevice", str]:
+    """Find a device from the registry, or by asking the servers if there is none."""
+    from .api import DeviceRequest, find_command
+    from .client import find_device, registry_find_device
+    from .utility import probe_host_list, timed
+
+    if host is None and not rescan:
+        with timed(timings, "registry"):
+            found = registry_find_device(
+                id=id, bus=bus, desc=desc, serial=serial, first=first
+            )
+        if found is not None:
+            return found
+
+    request = DeviceRequest(
+        command=find_command, id=id, bus=bus, desc=desc, first=first, serial=serial
+    )
+    with timed(timings, "discovery"):
+        servers, probed = probe_host_list(
+            host, rescan, request.model_dump_json().encode("utf-8")
+        )
+    with timed(timings, "find"):
+        return find_device(
+            server_hosts=servers,
+            id=id,
+            bus=bus,
+            desc=desc,
+            first=first,
+            serial=serial,
+            probed=probed,
+        )
+
+
+def _echo_timings(timings: dict[str, float] | None) -> None:
+    """Print how long each phase of an attach took."""
+    if not timings:
+        return
+    typer.echo("\nTimings:")
+    for phase, seconds in timings.items():
+        typer.echo(f"  {phase:<14}{seconds * 1000:8.1f} ms")
+    typer.echo(f"  {'total':<14}{sum(timings.values()) * 1000:8.1f} ms")
+
+
+def _forward_device_command(
+    command: Literal["attach", "detach", "find"],
+    host: str | None,
+    rescan: bool,
+    id: str | None,
+    bus: str | None,
+    desc: str | None,
+    serial: str | None,
+    first: bool,
+) -> "ClientDeviceResponse | None":
+    """Send a device command to a running client service, None if there is none."""
+    from .client_api import (
+        ClientDeviceRequest,
+        ClientDeviceResponse,
+        send_client_request,
+    )
+    from .config import get_config
+
+    request = ClientDeviceRequest(
+        command=command,
+        id=id,
+        bus=bus,
+        desc=desc,
+        first=first,
+        serial=serial,
+        host=host,
+        rescan=rescan,
+        config=get_config(),
+    )
+    response = send_client_request(request)
+    assert response is None or isinstance(response, ClientDeviceResponse)
+    return response
+
+
 @app.command()
 def attach(
     id: str | None = typer.Option(None, "--id", "-d", help="Device ID e.g. 0bda:5400"),
@@ -175,32 +424,55 @@ def attach(
     host: str | None = typer.Option(
         None, "--host", "-H", help="Server hostname or IP address"
     ),
+    rescan: bool = typer.Option(
+        False, "--rescan", help="Rescan server_ranges instead of using the cache"
+    ),
     bus: str | None = typer.Option(
         None, "--bus", "-b", help="Device bus ID e.g. 1-2.3.4"
     ),
     first: bool = typer.Option(
         False, "--first", "-f", help="Attach the first match if multiple found"
     ),
+    show_timings: bool = typer.Option(
+        False, "--timings", help="Show how long each phase of the attach took"
+    ),
 ) -> None:
     """Attach a USB device from a server."""
-
-    device, server = find_device(
-        server_hosts=get_host_list(host),
-        id=id,
-        bus=bus,
-        desc=desc,
-        first=first,
-        serial=serial,
+    forwarded = _forward_device_command(
+        "attach", host, rescan, id, bus, desc, serial, first
     )
-    attach_device(device.bus_id, server)
+    if forwarded is not None:
+        typer.echo(f"Attached to device on {forwarded.server}:\n{forwarded.data}")
+        if forwarded.local_devices:
+            typer.echo(f"\nLocal devices: {', '.join(forwarded.local_devices)}")
+        else:
+            typer.echo("Local device files not found (may still be initializing)")
+        if show_timings:
+            _echo_timings(forwarded.timings)
+        return
+
+    from .client import attach_device
+    from .port import Port
+    from .utility import timed
+
+    timings: dict[str, float] = {}
+    device, server = _find_device(host, rescan, id, bus, desc, serial, first, timings)
+    attach_device(device.bus_id, server, timings=timings)
     # discover the local port for the attached device
-    local_port = Port.get_port_by_remote_busid(device.bus_id, server, retries=20)
+    with timed(timings, "port"):
+        local_port = Port.wait_for_port(device.bus_id, server)
+    if local_port:
+        with timed(timings, "settle"):
+            # the device files are found once they settle, then cached
+            _ = local_port.local_devices
 
     typer.echo(f"Attached to device on {server}:\n{device}")
     if local_port:
         typer.echo(f"\nLocal port: {local_port}")
     else:
         typer.echo("Local device files not found (may still be initializing)")
+    if show_timings:
+        _echo_timings(timings)
 
 
 @app.command()
@@ -215,6 +487,9 @@ def detach(
     host: str | None = typer.Option(
         None, "--host", "-H", help="Server hostname or IP address"
     ),
+    rescan: bool = typer.Option(
+        False, "--rescan", help="Rescan server_ranges instead of using the cache"
+    ),
     bus: str | None = typer.Option(
         None, "--bus", "-b", help="Device bus ID e.g. 1-2.3.4"
     ),
@@ -223,15 +498,16 @@ def detach(
     ),
 ) -> None:
     """Detach a USB device from a server."""
-
-    device, server = find_device(
-        server_hosts=get_host_list(host),
-        id=id,
-        bus=bus,
-        desc=desc,
-        first=first,
-        serial=serial,
+    forwarded = _forward_device_command(
+        "detach", host, rescan, id, bus, desc, serial, first
     )
+    if forwarded is not None:
+        typer.echo(f"Detached from device on {forwarded.server}:\n{forwarded.data}")
+        return
+
+    from .client import detach_device
+
+    device, server = _find_device(host, rescan, id, bus, desc, serial, first)
     detach_device(device.bus_id, server)
 
     typer.echo(f"Detached from device on {server}:\n{device}")
@@ -249,6 +525,9 @@ def find(
     host: str | None = typer.Option(
         None, "--host", "-H", help="Server hostname or IP address"
     ),
+    rescan: bool = typer.Option(
+        False, "--rescan", help="Rescan server_ranges instead of using the cache"
+    ),
     bus: str | None = typer.Option(
         None, "--bus", "-b", help="Device bus ID e.g. 1-2.3.4"
     ),
@@ -257,15 +536,14 @@ def find(
     ),
 ) -> None:
     """Find a USB device on a server."""
-
-    device, server = find_device(
-        server_hosts=get_host_list(host),
-        id=id,
-        bus=bus,
-        desc=desc,
-        first=first,
-        serial=serial,
+    forwarded = _forward_device_command(
+        "find", host, rescan, id, bus, desc, serial, first
     )
+    if forwarded is not None:
+        typer.echo(f"Found device on {forwarded.server}:\n{forwarded.data}")
+        return
+
+    device, server = _find_device(host, rescan, id, bus, desc, serial, first)
 
     typer.echo(f"Found device on {server}:\n{device}")
 
@@ -289,6 +567,8 @@ def install_service(
     ),
 ) -> None:
     """Install usb-remote service as a systemd service (defaults to system service)."""
+    from .service import install_systemd_service
+
     try:
         install_systemd_service(
             user=user, system_wide=not user_service, service_type=service_type.value
@@ -311,6 +591,8 @@ def uninstall_service(
     ),
 ) -> None:
     """Uninstall usb-remote systemd service (defaults to system service)."""
+    from .service import uninstall_systemd_service
+
     try:
         uninstall_systemd_service(
             system_wide=not user_service, service_type=service_type.value
@@ -323,6 +605,8 @@ def uninstall_service(
 @config_app.command(name="show")
 def config_show() -> None:
     """Show current configuration."""
+    from .config import Defaults, discover_config_path, get_config
+
     config_path = discover_config_path()
 
     if config_path is None:
@@ -341,7 +625,9 @@ def config_add_server(
     server: str = typer.Argument(..., help="Server hostname or IP address"),
 ) -> None:
     """Add a server to the configuration."""
-    config = get_config()
+    from .config import Defaults, discover_config_path, get_config, save_servers
+
+    config = get_config().model_copy(deep=True)
 
     if server in config.servers:
         typer.echo(f"Server '{server}' is already in the configuration.", err=True)
@@ -359,13 +645,15 @@ def config_remove_server(
     server: str = typer.Argument(..., help="Server hostname or IP address"),
 ) -> None:
     """Remove a server from the configuration."""
+    from .config import discover_config_path, get_config, save_servers
+
     config_path = discover_config_path()
 
     if config_path is None:
         typer.echo("No configuration file found.", err=True)
         raise typer.Exit(1)
 
-    config = get_config()
+    config = get_config().model_copy(deep=True)
 
     if server not in config.servers:
         typer.echo(f"Server '{server}' is not in the configuration.", err=True)
@@ -381,11 +669,13 @@ def config_set_timeout(
     timeout: float = typer.Argument(..., help="Connection timeout in seconds"),
 ) -> None:
     """Set the connection timeout."""
+    from .config import Defaults, discover_config_path, get_config
+
     if timeout <= 0:
         typer.echo("Timeout must be greater than 0.", err=True)
         raise typer.Exit(1)
 
-    config = get_config()
+    config = get_config().model_copy(deep=True)
     config.timeout = timeout
     config.to_file()
 
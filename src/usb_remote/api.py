@@ -22,12 +22,13 @@ class ListRequest(StrictBaseModel):
 find_command = "find"
 attach_command = "attach"
 detach_command = "detach"
+renew_command = "renew"
 
 
 class DeviceRequest(StrictBaseModel):
-    """Request to find/attach/detach a USB device."""
+    """Request to find/attach/detach a USB device, or renew the lease of one."""
 
-    command: Literal["find", "attach", "detach"]
+    command: Literal["find", "attach", "detach", "renew"]
     id: str | None = None
     bus: str | None = None
     serial: str | None = None
@@ -49,13 +50,40 @@ class DeviceResponse(StrictBaseModel):
     data: UsbDevice
 
 
+class RegistryListResponse(StrictBaseModel):
+    """Response from a registry containing the devices of each server."""
+
+    status: Literal["success"]
+    data: dict[str, list[UsbDevice]]
+
+
+class RegistryDeviceResponse(StrictBaseModel):
+    """Response from a registry to a find request."""
+
+    status: Literal["success"]
+    data: UsbDevice
+    server: str
+
+
 error_response = "error"
 not_found_response = "not_found"
 multiple_matches_response = "multiple_matches"
+busy_response = "busy"
 
 
 class ErrorResponse(StrictBaseModel):
     """Error response."""
 
-    status: Literal["error", "not_found", "multiple_matches"]
+    status: Literal["error", "not_found", "multiple_matches", "busy"]
     message: str
+
+
+class ServerBeacon(StrictBaseModel):
+    """Periodic UDP announcement of a running server."""
+
+    command: Literal["beacon"] = "beacon"
+    host: str
+    port: int
+    version: str
+    generation: int
+    interval: float
@@ -0,0 +1,244 @@
+"""UDP announcement beacons for discovering servers without scanning."""
+
+import ipaddress
+import logging
+import socket
+import struct
+import threading
+import time
+from collections.abc import Callable
+
+from pydantic import ValidationError
+
+from . import __version__
+from .api import ServerBeacon
+from .config import Defaults
+
+logger = logging.getLogger(__name__)
+
+# A server is considered gone after missing this many beacon intervals
+BEACON_MISSED_LIMIT = 3
+
+
+def _is_multicast(address: str) -> bool:
+    """True if address is an IP multicast group."""
+    try:
+        return ipaddress.ip_address(address).is_multicast
+    except ValueError:
+        return False
+
+
+class BeaconSender:
+    """Periodically announce a server over UDP broadcast or multicast."""
+
+    def __init__(
+        self,
+        address: str,
+        server_port: int,
+        generation: Callable[[], int],
+        host: str | None = None,
+        beacon_port: int = Defaults.BEACON_PORT,
+        interval: float = Defaults.BEACON_INTERVAL,
+    ):
+        """
+        Initialize the beacon sender.
+
+        Args:
+            address: Broadcast address (e.g. 192.168.2.255), multicast group
+                (e.g. 239.255.50.55) or unicast address to send beacons to.
+            server_port: The CommandServer port to advertise.
+            generation: Callable returning the server's inventory generation.
+            host: Host name to advertise. Defaults to this machine's hostname.
+            beacon_port: UDP port to send beacons to.
+            interval: Seconds between beacons.
+        """
+        self.address = address
+        self.server_port = server_port
+        self.generation = generation
+        self.host = host or socket.gethostname()
+        self.beacon_port = beacon_port
+        self.interval = interval
+        self.sock: socket.socket | None = None
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def send(self) -> None:
+        """Send a single beacon."""
+        assert self.sock is not None, "BeaconSender not started"
+        beacon = ServerBeacon(
+            host=self.host,
+            port=self.server_port,
+            version=__version__,
+            generation=self.generation(),
+            interval=self.interval,
+        )
+        self.sock.sendto(
+            beacon.model_dump_json().encode("utf-8"), (self.address, self.beacon_port)
+        )
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.send()
+            except OSError as e:
+                logger.warning(f"Failed to send beacon to {self.address}: {e}")
+            self._stop.wait(self.interval)
+
+    def start(self) -> None:
+        """Start sending beacons in a background thread."""
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if _is_multicast(self.address):
+            self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+        else:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="beacon-sender", daemon=True
+        )
+        self._thread.start()
+        logger.info(
+            f"Sending beacons to {self.address}:{self.beacon_port} "
+            f"every {self.interval}s"
+        )
+
+    def stop(self) -> None:
+        """Stop sending beacons."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=1)
+        if self.sock:
+            self.sock.close()
+
+
+class BeaconListener:
+    """Collect live servers from the beacons they send."""
+
+    def __init__(
+        self,
+        address: str = "",
+        beacon_port: int = Defaults.BEACON_PORT,
+        on_generation_change: Callable[[str, int], None] | None = None,
+        server_port: int = Defaults.SERVER_PORT,
+        on_server_up: Callable[[str], None] | None = None,
+    ):
+        """
+        Initialize the beacon listener.
+
+        Args:
+            address: Multicast group to join, or a broadcast/unicast address
+                (or "") to listen on all interfaces.
+            beacon_port: UDP port to listen on.
+            on_generation_change: Called with (server, generation) when a known
+                server announces a new inventory generation.
+            server_port: The port clients connect to servers on. Servers that
+                advertise another port cannot be reached and are ignored.
+            on_server_up: Called with server when it is first discovered, when
+                it sends beacons again after they expired, and when it has
+                restarted (its inventory generation went backwards).
+        """
+        self.address = address
+        self.beacon_port = beacon_port
+        self.server_port = server_port
+        self.on_generation_change = on_generation_change
+        self.on_server_up = on_server_up
+        self.sock: socket.socket | None = None
+        self.running = False
+        # server address -> (last beacon received, time it expires)
+        self._servers: dict[str, tuple[ServerBeacon, float]] = {}
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    def live_servers(self) -> list[str]:
+        """Return the servers whose beacons have not expired, oldest first."""
+        now = time.monotonic()
+        with self._lock:
+            return [
+                server
+                for server, (_, expires) in self._servers.items()
+                if expires > now
+            ]
+
+    def generation(self, server: str) -> int | None:
+        """Return the last inventory generation announced by server."""
+        with self._lock:
+            entry = self._servers.get(server)
+        return entry[0].generation if entry else None
+
+    def handle_beacon(self, data: bytes, server: str) -> None:
+        """Record a beacon received from server."""
+        try:
+            beacon = ServerBeacon.model_validate_json(data)
+        except ValidationError as e:
+            logger.debug(f"Ignoring invalid beacon from {server}: {e}")
+            return
+
+        if beacon.port != self.server_port:
+            logger.debug(
+                f"Ignoring server {beacon.host} at {server}:{beacon.port}, "
+                f"clients connect to servers on port {self.server_port}"
+            )
+            return
+
+        now = time.monotonic()
+        expires = now + beacon.interval * BEACON_MISSED_LIMIT
+        with self._lock:
+            previous = self._servers.get(server)
+            self._servers[server] = (beacon, expires)
+
+        # a server restarting begins again from its first inventory generation
+        up = (
+            previous is None
+            or previous[1] <= now
+            or previous[0].generation > beacon.generation
+        )
+        if previous is None:
+            logger.info(f"Discovered server {beacon.host} at {server}:{beacon.port}")
+        elif up:
+            logger.info(f"Server {beacon.host} at {server}:{beacon.port} is back")
+        if previous is not None and previous[0].generation != beacon.generation:
+            logger.debug(f"Server {server} inventory now at {beacon.generation}")
+            if self.on_generation_change:
+                self.on_generation_change(server, beacon.generation)
+        if up and self.on_server_up:
+            self.on_server_up(server)
+
+    def _run(self) -> None:
+        assert self.sock is not None
+        while self.running:
+            try:
+                data, (server, _) = self.sock.recvfrom(1024)
+            except TimeoutError:
+                continue
+            except OSError:
+                logger.debug("Beacon listener socket closed")
+                break
+            self.handle_beacon(data, server)
+
+    def start(self) -> None:
+        """Start listening for beacons in a background thread."""
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        # wake periodically so that stop() is noticed
+        self.sock.settimeout(0.5)
+        self.sock.bind(("", self.beacon_port))
+        if _is_multicast(self.address):
+            membership = struct.pack(
+                "4s4s", socket.inet_aton(self.address), socket.inet_aton("0.0.0.0")
+            )
+            self.sock.setsockopt(
+                socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership
+            )
+        self.running = True
+        self._thread = threading.Thread(
+            target=self._run, name="beacon-listener", daemon=True
+        )
+        self._thread.start()
+        logger.info(f"Listening for server beacons on port {self.beacon_port}")
+
+    def stop(self) -> None:
+        """Stop listening for beacons."""
+        self.running = False
+        if self._thread:
+            self._thread.join(timeout=1)
+        if self.sock:
+            self.sock.close()
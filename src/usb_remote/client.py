@@ -1,5 +1,6 @@
 import logging
 import socket
+from typing import TYPE_CHECKING, NoReturn
 
 from pydantic import TypeAdapter
 
@@ -9,17 +10,33 @@ from .api import (
     ErrorResponse,
     ListRequest,
     ListResponse,
+    RegistryDeviceResponse,
+    RegistryListResponse,
     attach_command,
     detach_command,
     find_command,
+    renew_command,
 )
-from .config import get_server_port, get_timeout
-from .port import Port
-from .usbdevice import DeviceNotFoundError, MultipleDevicesError, UsbDevice
-from .utility import run_command
+from .config import get_registry, get_server_port, get_timeout
+from .usbdevice import (
+    DeviceBusyError,
+    DeviceNotFoundError,
+    MultipleDevicesError,
+    UsbDevice,
+)
+from .usbip import UsbipError, list_exported
+from .utility import run_command, timed
+
+if TYPE_CHECKING:
+    from .port import Port, PortTable
 
 logger = logging.getLogger(__name__)
 
+_response_adapter = TypeAdapter(ListResponse | DeviceResponse | ErrorResponse)
+_registry_response_adapter = TypeAdapter(
+    RegistryListResponse | RegistryDeviceResponse | ErrorResponse
+)
+
 # Will be fetched from config when needed
 SERVER_PORT = None
 # Default connection timeout in seconds
@@ -68,24 +85,7 @@ def send_request(
 
             response = sock.recv(4096).decode("utf-8")
             logger.debug(f"Received response from server: {response}")
-            # Parse response using TypeAdapter to handle union types
-            response_adapter = TypeAdapter(
-                ListResponse | DeviceResponse | ErrorResponse
-            )
-            decoded = response_adapter.validate_json(response)
-
-            if isinstance(decoded, ErrorResponse):
-                match decoded.status:
-                    case "not_found":
-                        logger.debug(f"Device not found: {decoded.message}")
-                        raise DeviceNotFoundError(f"{decoded.message}")
-                    case "multiple_matches":
-                        logger.debug(f"Multiple matches: {decoded.message}")
-                        raise MultipleDevicesError(f"{decoded.message}")
-                    case "error":
-                        logger.debug(f"Server returned error: {decoded.message}")
-                        raise RuntimeError(f"Server error: {decoded.message}")
-
+            decoded = decode_response(response)
             logger.debug(f"Request successful: {request.command}")
             return decoded
 
@@ -95,9 +95,118 @@ def send_request(
         raise TimeoutError(msg) from e
 
 
+def decode_response(response: str | bytes) -> ListResponse | DeviceResponse:
+    """
+    Decode a server response, raising the matching exception for errors.
+
+    Args:
+        response: The raw JSON response from the server
+
+    Returns:
+        The decoded success response
+
+    Raises:
+        DeviceNotFoundError: If the server found no matching device
+        MultipleDevicesError: If the server found more than one matching device
+        DeviceBusyError: If another client holds the lease of the device
+        RuntimeError: If the server returned any other error
+    """
+    # Parse response using TypeAdapter to handle union types
+    decoded = _response_adapter.validate_json(response)
+
+    if isinstance(decoded, ErrorResponse):
+        _raise_error(decoded)
+
+    return decoded
+
+
+def _raise_error(error: ErrorResponse) -> NoReturn:
+    """Raise the exception matching an error response."""
+    match error.status:
+        case "not_found":
+            logger.debug(f"Device not found: {error.message}")
+            raise DeviceNotFoundError(f"{error.message}")
+        case "multiple_matches":
+            logger.debug(f"Multiple matches: {error.message}")
+            raise MultipleDevicesError(f"{error.message}")
+        case "busy":
+            logger.debug(f"Device busy: {error.message}")
+            raise DeviceBusyError(f"{error.message}")
+        case "error":
+            logger.debug(f"Server returned error: {error.message}")
+            raise RuntimeError(f"Server error: {error.message}")
+
+
+def send_registry_request(
+    request: ListRequest | DeviceRequest,
+    registry: tuple[str, int],
+    timeout: float | None = None,
+) -> RegistryListResponse | RegistryDeviceResponse:
+    """
+    Send a list or find request to a registry and return the response.
+
+    Args:
+        request: The request object to send
+        registry: The registry hostname or IP address, and port
+        timeout: Connection timeout in seconds. If None, uses configured timeout.
+
+    Returns:
+        The response object from the registry
+
+    Raises:
+        DeviceNotFoundError: If no server has a matching device
+        MultipleDevicesError: If more than one device matched
+        RuntimeError: If the registry returned any other error
+        OSError: If connection fails or times out
+    """
+    host, port = registry
+    logger.debug(f"Connecting to registry at {host}:{port}")
+    with socket.create_connection((host, port), timeout or get_timeout()) as sock:
+        sock.sendall(request.model_dump_json().encode("utf-8"))
+        # the devices of a fleet do not fit in one read
+        chunks = []
+        while chunk := sock.recv(65536):
+            chunks.append(chunk)
+
+    decoded = _registry_response_adapter.validate_json(b"".join(chunks))
+    if isinstance(decoded, ErrorResponse):
+        _raise_error(decoded)
+    return decoded
+
+
+def _get_response(
+    request: ListRequest | DeviceRequest,
+    server_host: str,
+    probed: dict[str, bytes] | None,
+    timeout: float | None = None,
+) -> ListResponse | DeviceResponse:
+    """Use a response already received while probing, or send the request."""
+    if probed and server_host in probed:
+        logger.debug(f"Using response from {server_host} received during scan")
+        return decode_response(probed[server_host])
+    return send_request(request, server_host, timeout=timeout)
+
+
+def _merge_exported(
+    devices: list[UsbDevice], exported: list[UsbDevice]
+) -> list[UsbDevice]:
+    """Mark the devices that usbipd exports, adding any the server did not list."""
+    by_bus_id = {device.bus_id: device for device in devices}
+    for exported_device in exported:
+        device = by_bus_id.get(exported_device.bus_id)
+        if device is None:
+            devices.append(exported_device)
+        else:
+            device.exported = True
+            device.interface_classes = exported_device.interface_classes
+    return devices
+
+
 def list_devices(
     server_hosts: list[str],
     timeout: float | None = None,
+    probed: dict[str, bytes] | None = None,
+    exported: bool = False,
 ) -> dict[str, list[UsbDevice]]:
     """
     Request list of available USB devices from server(s).
@@ -106,6 +215,11 @@ def list_devices(
         server_hosts: Single server hostname/IP or list of server hostnames/IPs
         server_port: Server port number
         timeout: Connection timeout in seconds. If None, uses configured timeout.
+        probed: Responses to a ListRequest already received from some servers
+            while scanning, see utility.probe_host_list
+        exported: Also ask usbipd on each server which devices it exports, and
+            mark them as exported. This lists the exported devices of servers
+            whose usb-remote server is not running.
 
     Returns:
         If server_hosts is a string: List of UsbDevice instances
@@ -119,7 +233,7 @@ def list_devices(
     for server in server_hosts:
         try:
             request = ListRequest()
-            response = send_request(request, server, timeout=timeout)
+            response = _get_response(request, server, probed, timeout)
             assert isinstance(response, ListResponse)
             results[server] = response.data
             logger.debug(f"Server {server}: {len(response.data)} devices")
@@ -129,84 +243,245 @@ def list_devices(
             logger.warning(f"Failed to query server {server}: {e}")
             results[server] = []
 
+        if exported:
+            try:
+                usbipd_devices = list_exported(server, timeout=timeout or get_timeout())
+            except (OSError, UsbipError) as e:
+                logger.debug(f"Failed to query usbipd on {server}: {e}")
+                continue
+            results[server] = _merge_exported(
+                results.get(server, []),
+                [device.to_usb_device() for device in usbipd_devices],
+            )
+
     return results
 
 
-def detach_local_device(bus_id: str, server_host: str) -> None:
+def registry_list_devices(
+    timeout: float | None = None,
+) -> dict[str, list[UsbDevice]] | None:
+    """
+    Request the devices of every server from the configured registry.
+
+    Args:
+        timeout: Connection timeout in seconds. If None, uses configured timeout.
+
+    Returns:
+        Dictionary mapping server name to list of UsbDevice instances, or None
+        if no registry is configured or it cannot be reached, in which case the
+        caller asks the servers itself.
+    """
+    registry = get_registry()
+    if registry is None:
+        return None
+    try:
+        response = send_registry_request(ListRequest(), registry, timeout)
+    except (OSError, RuntimeError, ValueError) as e:
+        logger.warning(f"Registry {registry[0]} unavailable, asking servers: {e}")
+        return None
+    assert isinstance(response, RegistryListResponse)
+    logger.debug(f"Registry {registry[0]}: {len(response.data)} servers")
+    return response.data
+
+
+def registry_find_device(
+    id: str | None = None,
+    bus: str | None = None,
+    desc: str | None = None,
+    serial: str | None = None,
+    first: bool = False,
+) -> tuple[UsbDevice, str] | None:
+    """
+    Request to find a USB device on any server from the configured registry.
+
+    Args:
+        id: The device ID in the format "vendor:product"
+        bus: The bus ID of the device
+        desc: A substring of or pattern for the device description
+        serial: The serial number of the device
+        first: Return the first match instead of raising on multiple matches
+
+    Returns:
+        The UsbDevice and the host where it was found, or None if no registry
+        is configured or it cannot be reached.
+
+    Raises:
+        DeviceNotFoundError: If no server has a matching device
+        MultipleDevicesError: If more than one device matched and first is False
+    """
+    registry = get_registry()
+    if registry is None:
+        return None
+    request = DeviceRequest(
+        command=find_command, id=id, bus=bus, desc=desc, serial=serial, first=first
+    )
+    try:
+        response = send_registry_request(request, registry)
+    except (OSError, RuntimeError, ValueError) as e:
+        logger.warning(f"Registry {registry[0]} unavailable, asking servers: {e}")
+        return None
+    assert isinstance(response, RegistryDeviceResponse)
+    logger.debug(f"Registry found {response.data.description} on {response.server}")
+    return response.data, response.server
+
+
+def detach_local_device(
+    bus_id: str, server_host: str, ports: "PortTable | None" = None
+) -> None:
     """
     Find a local usbip port by remote bus ID and server, then detach it.
 
     Args:
         bus_id: The remote bus ID of the device to detach
         server_host: The server hostname or IP address
+        ports: A live PortTable to look the port up in, instead of listing ports
     """
+    # imported here as pyudev is only needed when changing local ports
+    from .port import Port, vhci_available, vhci_detach
+
     try:
-        port = Port.get_port_by_remote_busid(bus_id, server_host)
+        port = (
+            ports.find(bus_id, server_host)
+            if ports is not None
+            else Port.get_port_by_remote_busid(bus_id, server_host)
+        )
         if port is not None:
             logger.info(f"Found local port {port.port} for device {bus_id}, detaching")
-            run_command(["sudo", "usbip", "detach", "-p", port.port])
+            if vhci_available():
+                vhci_detach(port.port_number)
+            else:
+                run_command(["sudo", "usbip", "detach", "-p", port.port])
     except Exception as e:
         print(e)
         logger.warning(f"Failed to detach device {bus_id} locally: {e}")
 
 
-def attach_device(bus_id: str, server_host: str) -> None:
+def reconcile_server(
+    server_host: str, ports: "PortTable | None" = None
+) -> list["Port"]:
+    """
+    Detach all the local ports of devices a server no longer exports.
+
+    Args:
+        server_host: Server hostname or IP address
+        ports: A live PortTable to take the ports in use from, instead of listing
+            ports
+
+    Returns:
+        The local ports that were detached
+    """
+    # imported here as pyudev is only needed when changing local ports
+    from .port import reconcile_ports
+
+    try:
+        exported = list_exported(server_host, timeout=get_timeout())
+    except (OSError, UsbipError) as e:
+        # an unreachable server says nothing about which ports are stale
+        logger.debug(f"Cannot reconcile ports of {server_host}: {e}")
+        return []
+
+    return reconcile_ports(
+        server_host,
+        {device.busid for device in exported},
+        ports.ports() if ports is not None else None,
+    )
+
+
+def attach_device(
+    bus_id: str,
+    server_host: str,
+    ports: "PortTable | None" = None,
+    timings: dict[str, float] | None = None,
+) -> None:
     """
     Attach a USB device by bus ID from a specific server.
 
     Args:
         bus_id: The bus ID of the device to attach
         server_host: Server hostname or IP address
-        timeout: Connection timeout in seconds. If None, uses configured timeout.
+        ports: A live PortTable to look up local ports in, instead of listing ports
+        timings: Updated with the seconds taken to detach a stale local port
+            ("stale_detach"), bind the device on the server ("bind") and
+            attach it locally ("attach")
     """
+    # imported here as pyudev is only needed when changing local ports
+    from .port import vhci_attach, vhci_available
 
     # occasionally if a remote server has been restarted, the local port
     # may still be attached even though the remote device is gone -
     # try to detach it first to be safe
-    detach_local_device(bus_id, server_host)
+    with timed(timings, "stale_detach"):
+        detach_local_device(bus_id, server_host, ports)
 
     logger.debug(f"Asking remote {server_host} to bind {bus_id} to usbip")
     request = DeviceRequest(
         command=attach_command,
         bus=bus_id,
     )
-    send_request(request, server_host)
+    with timed(timings, "bind"):
+        send_request(request, server_host)
 
     logger.info(f"Attaching device {bus_id} from {server_host} to local system")
-    run_command(
-        [
-            "sudo",
-            "usbip",
-            "attach",
-            "-r",
-            server_host,
-            "-b",
-            bus_id,
-        ]
-    )
+    with timed(timings, "attach"):
+        if vhci_available():
+            vhci_attach(server_host, bus_id, timeout=get_timeout())
+        else:
+            run_command(
+                [
+                    "sudo",
+                    "usbip",
+                    "attach",
+                    "-r",
+                    server_host,
+                    "-b",
+                    bus_id,
+                ]
+            )
 
 
-def detach_device(bus_id: str, server_host: str) -> None:
+def detach_device(
+    bus_id: str, server_host: str, ports: "PortTable | None" = None
+) -> None:
     """
     Detach a USB device by bus ID from a specific server.
 
     Args:
         bus_id: The bus ID of the device to detach
         server_host: Server hostname or IP address
-        timeout: Connection timeout in seconds. If None, uses configured timeout.
+        ports: A live PortTable to look up local ports in, instead of listing ports
     """
-    detach_local_device(bus_id, server_host)
+    detach_local_device(bus_id, server_host, ports)
 
     logger.debug(f"Asking remote {server_host} to unbind {bus_id} from usbip")
     request = DeviceRequest(
         command=detach_command,
         bus=bus_id,
     )
-    send_request(request, server_host)
+    try:
+        send_request(request, server_host)
+    except DeviceBusyError as e:
+        # another client has attached the device since, leave it bound for them
+        logger.warning(f"Not unbinding {bus_id} on {server_host}: {e}")
+        return
 
     logger.info(f"Device detached: {server_host}:{bus_id}")
 
 
+def renew_lease(bus_id: str, server_host: str) -> None:
+    """
+    Renew this client's lease of a device it has attached.
+
+    Args:
+        bus_id: The bus ID of the device
+        server_host: Server hostname or IP address
+
+    Raises:
+        DeviceBusyError: If another client has taken the device
+    """
+    logger.debug(f"Renewing lease of {bus_id} on {server_host}")
+    send_request(DeviceRequest(command=renew_command, bus=bus_id), server_host)
+
+
 def find_device(
     server_hosts: list[str],
     id: str | None = None,
@@ -214,6 +489,7 @@ def find_device(
     desc: str | None = None,
     serial: str | None = None,
     first: bool = False,
+    probed: dict[str, bytes] | None = None,
 ) -> tuple[UsbDevice, str]:
     """
     Request to find a USB device from server(s). Will only return
@@ -226,6 +502,8 @@ def find_device(
         args: AttachRequest with device search criteria
         server_hosts: list of server hostnames/IPs
         timeout: Connection timeout in seconds. If None, uses configured timeout.
+        probed: Responses to the equivalent find DeviceRequest already received
+            from some servers while scanning, see utility.probe_host_list
 
     Returns:
         The UsbDevice and the host where device was found
@@ -253,7 +531,7 @@ def find_device(
     for server in server_hosts:
         try:
             logger.debug(f"Trying server {server}")
-            response = send_request(request, server)
+            response = _get_response(request, server, probed)
             assert isinstance(response, DeviceResponse)
             matches.append((response.data, server))
             logger.debug(f"Match found on {server}: {response.data.description}")
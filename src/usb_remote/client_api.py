@@ -1,13 +1,26 @@
 """Pydantic models for client service socket communication."""
 
+import logging
 import os
+import socket
+from pathlib import Path
 from typing import Literal
 
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, TypeAdapter
 
-from usb_remote.config import Defaults, Environment
+from usb_remote.config import Defaults, Environment, UsbRemoteConfig
 
-from .usbdevice import UsbDevice
+from .usbdevice import (
+    DeviceBusyError,
+    DeviceNotFoundError,
+    MultipleDevicesError,
+    UsbDevice,
+)
+
+logger = logging.getLogger(__name__)
+
+# How long the CLI waits for the client service to complete a request
+CLIENT_SERVICE_TIMEOUT = 60.0
 
 
 def get_client_socket_path() -> str:
@@ -23,6 +36,29 @@ def get_client_socket_path() -> str:
     return socket_path
 
 
+def find_client_socket() -> str | None:
+    """Find the socket of a running client service.
+
+    Returns:
+        Path to the client socket if USB_REMOTE_CLIENT_SOCKET is set and exists,
+        otherwise the first of the user or system default sockets that exists,
+        or None if no client service socket is found or USB_REMOTE_NO_CLIENT_SERVICE
+        is set.
+    """
+    if os.environ.get(Environment.USB_REMOTE_NO_CLIENT_SERVICE):
+        return None
+    socket_path = os.environ.get(Environment.USB_REMOTE_CLIENT_SOCKET)
+    candidates = (
+        [socket_path]
+        if socket_path
+        else [Defaults.CLIENT_SOCKET, Defaults.SYSTEM_CLIENT_SOCKET]
+    )
+    for candidate in candidates:
+        if Path(candidate).is_socket():
+            return candidate
+    return None
+
+
 class StrictBaseModel(BaseModel):
     """Base model with strict validation - no extra fields allowed."""
 
@@ -31,18 +67,23 @@ class StrictBaseModel(BaseModel):
 
 attach_command = "attach"
 detach_command = "detach"
+find_command = "find"
+list_command = "list"
 
 
 class ClientDeviceRequest(StrictBaseModel):
-    """Request to attach/detach a USB device via client service."""
+    """Request to list, find, attach or detach USB devices via client service."""
 
-    command: Literal["attach", "detach"]
+    command: Literal["attach", "detach", "find", "list"]
     id: str | None = None
     bus: str | None = None
     serial: str | None = None
     desc: str | None = None
     first: bool = False
     host: str | None = None
+    rescan: bool = False
+    # the caller's config, the service declines requests if its servers differ
+    config: UsbRemoteConfig | None = None
 
 
 class ClientDeviceResponse(StrictBaseModel):
@@ -52,15 +93,106 @@ class ClientDeviceResponse(StrictBaseModel):
     data: UsbDevice
     server: str
     local_devices: list[str] = []
+    # seconds taken by each phase of an attach, in the order they ran
+    timings: dict[str, float] | None = None
+
+
+class ClientListResponse(StrictBaseModel):
+    """Response to client list request."""
+
+    status: Literal["success"]
+    data: dict[str, list[UsbDevice]]
+
+
+class PortEvent(StrictBaseModel):
+    """A local port, or a change to one, as reported by 'ports --json'."""
+
+    event: Literal["port", "attached", "detached", "devices"]
+    port: int
+    server: str
+    remote_busid: str
+    description: str
+    local_devices: list[str] = []
 
 
 error_response = "error"
 not_found_response = "not_found"
 multiple_matches_response = "multiple_matches"
+config_mismatch_response = "config_mismatch"
+busy_response = "busy"
 
 
 class ClientErrorResponse(StrictBaseModel):
     """Error response from client service."""
 
-    status: Literal["error", "not_found", "multiple_matches"]
+    status: Literal["error", "not_found", "multiple_matches", "config_mismatch", "busy"]
     message: str
+
+
+_response_adapter = TypeAdapter(
+    ClientListResponse | ClientDeviceResponse | ClientErrorResponse
+)
+
+
+def send_client_request(
+    request: ClientDeviceRequest, socket_path: str | None = None
+) -> ClientListResponse | ClientDeviceResponse | None:
+    """
+    Forward a request to a running client service.
+
+    Args:
+        request: The request to send.
+        socket_path: Path to the client service socket. If None, uses
+            find_client_socket().
+
+    Returns:
+        The client service response, or None if no client service is running
+        or its config uses other servers than request.config, so that the
+        caller can fall back to talking to the servers directly.
+
+    Raises:
+        DeviceNotFoundError: If the client service found no matching device
+        MultipleDevicesError: If multiple devices match and first not set
+        DeviceBusyError: If the device is leased to another client
+        RuntimeError: For other errors reported by the client service
+    """
+    socket_path = socket_path or find_client_socket()
+    if socket_path is None:
+        return None
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(CLIENT_SERVICE_TIMEOUT)
+        try:
+            sock.connect(socket_path)
+        except OSError as e:
+            # a stale socket file or one we may not use, talk to servers directly
+            logger.debug(f"Client service at {socket_path} unavailable: {e}")
+            return None
+
+        logger.debug(f"Forwarding {request.command} request to {socket_path}")
+        sock.sendall(request.model_dump_json().encode("utf-8"))
+
+        chunks = []
+        while chunk := sock.recv(65536):
+            chunks.append(chunk)
+            if chunk.endswith(b"\n"):
+                break
+
+    response = _response_adapter.validate_json(b"".join(chunks))
+    if isinstance(response, ClientErrorResponse):
+        if response.status == config_mismatch_response:
+            logger.info(
+                f"Not using the client service at {socket_path}: {response.message}"
+            )
+            return None
+        if response.status == not_found_response:
+            raise DeviceNotFoundError(response.message)
+        if response.status == multiple_matches_response:
+            raise MultipleDevicesError(response.message)
+        if response.status == busy_response:
+            raise DeviceBusyError(response.message)
+        raise RuntimeError(response.message)
+    logger.info(
+        f"{request.command.capitalize()} handled by the client service at {socket_path}"
+    )
+    return response
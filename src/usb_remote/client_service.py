@@ -3,27 +3,51 @@
 import logging
 import socket
 import threading
+from concurrent.futures import Future
 from pathlib import Path
 from typing import Literal
 
 from pydantic import TypeAdapter, ValidationError
 
-from .client import attach_device, detach_device, find_device
+from .beacon import BeaconListener
+from .client import (
+    attach_device,
+    detach_device,
+    find_device,
+    list_devices,
+    reconcile_server,
+    registry_find_device,
+    registry_list_devices,
+    renew_lease,
+)
 from .client_api import (
     ClientDeviceRequest,
     ClientDeviceResponse,
     ClientErrorResponse,
+    ClientListResponse,
+    busy_response,
+    config_mismatch_response,
     error_response,
     get_client_socket_path,
     multiple_matches_response,
     not_found_response,
 )
-from .port import Port
-from .usbdevice import DeviceNotFoundError, MultipleDevicesError
-from .utility import get_host_list
+from .config import get_beacon_address, get_config, get_server_port
+from .port import Port, PortTable
+from .usbdevice import (
+    DeviceBusyError,
+    DeviceNotFoundError,
+    MultipleDevicesError,
+    UsbDevice,
+)
+from .utility import get_host_list, timed
 
 logger = logging.getLogger(__name__)
 
+# Seconds between renewals of the server leases of attached devices, well
+# within the servers' lease time
+LEASE_RENEW_INTERVAL = 120.0
+
 
 class ClientService:
     """Service that runs a Unix socket server to accept attach/detach commands."""
@@ -41,10 +65,133 @@ class ClientService:
         self.socket_path = socket_path or get_client_socket_path()
         self.unix_socket = None
         self.running = False
+        self.beacons: BeaconListener | None = None
+        # live table of the local ports, while the service is running
+        self.ports: PortTable | None = None
+        # in-flight (command, server, bus_id) operations and per-device locks
+        self._flights: dict[tuple[str, str, str], Future[ClientDeviceResponse]] = {}
+        self._device_locks: dict[tuple[str, str], threading.Lock] = {}
+        self._flights_lock = threading.Lock()
+        # server -> (beacon generation, devices) of servers that send beacons
+        self._inventories: dict[str, tuple[int, list[UsbDevice]]] = {}
+        self._inventories_lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def get_host_list(self, host: str | None, rescan: bool = False) -> list[str]:
+        """Get the configured servers plus any announced by beacons."""
+        server_hosts = get_host_list(host, rescan)
+        if host is None and self.beacons is not None:
+            for server in self.beacons.live_servers():
+                if server not in server_hosts:
+                    server_hosts.append(server)
+        return server_hosts
+
+    def handle_list_command(self, args: ClientDeviceRequest) -> ClientListResponse:
+        """
+        Handle list command.
+
+        Args:
+            args: ClientDeviceRequest with the list command and optional host
+
+        Returns:
+            ClientListResponse with the devices on each server
+        """
+        if args.host is None and not args.rescan:
+            registered = registry_list_devices()
+            if registered is not None:
+                return ClientListResponse(status="success", data=registered)
+
+        server_hosts = self.get_host_list(args.host, args.rescan)
+        data: dict[str, list[UsbDevice]] = {}
+        stale = []
+        for server in server_hosts:
+            cached = self._cached_inventory(server)
+            if cached is None:
+                stale.append(server)
+            else:
+                data[server] = cached
+
+        # read the generations before listing, a change during it is seen next time
+        generations = {server: self._beacon_generation(server) for server in stale}
+        listed = list_devices(stale) if stale else {}
+        with self._inventories_lock:
+            for server, devices in listed.items():
+                generation = generations[server]
+                # an empty list may be a failure to reach the server
+                if generation is not None and devices:
+                    self._inventories[server] = (generation, devices)
+        data.update(listed)
+
+        return ClientListResponse(
+            status="success",
+            data={server: data[server] for server in server_hosts if server in data},
+        )
+
+    def _beacon_generation(self, server: str) -> int | None:
+        """The inventory generation server last announced, if it sends beacons."""
+        return self.beacons.generation(server) if self.beacons else None
+
+    def _cached_inventory(self, server: str) -> list[UsbDevice] | None:
+        """The devices of server, if listed since its inventory last changed."""
+        generation = self._beacon_generation(server)
+        with self._inventories_lock:
+            cached = self._inventories.get(server)
+        if generation is None or cached is None or cached[0] != generation:
+            return None
+        logger.debug(f"Using cached inventory of {server} at {generation}")
+        return cached[1]
+
+    def _invalidate_inventory(self, server: str, generation: int) -> None:
+        """Forget the cached devices of a server that announced a change."""
+        with self._inventories_lock:
+            if self._inventories.pop(server, None) is not None:
+                logger.debug(f"Inventory of {server} changed to {generation}")
+
+    def reconcile(self, server: str) -> list[Port]:
+        """
+        Detach all the local ports of devices server no longer exports.
+
+        Args:
+            server: The server hostname or IP address
+
+        Returns:
+            The local ports that were detached
+        """
+        try:
+            stale = reconcile_server(server, self.ports)
+        except Exception as e:
+            logger.warning(f"Failed to reconcile ports of {server}: {e}")
+            return []
+        if stale:
+            logger.info(f"Detached {len(stale)} stale ports of {server}")
+        return stale
+
+    def _server_up(self, server: str) -> None:
+        """Reconcile the ports of a server that came back, off the beacon thread."""
+        threading.Thread(
+            target=self.reconcile, args=(server,), name="reconcile", daemon=True
+        ).start()
+
+    def renew_leases(self) -> None:
+        """Renew the server leases of the devices attached to local ports."""
+        if self.ports is None:
+            return
+        for port in self.ports.ports():
+            try:
+                renew_lease(port.remote_busid, port.server)
+            except DeviceBusyError as e:
+                logger.warning(f"Lost the lease of {port.remote_busid}: {e}")
+            except Exception as e:
+                logger.debug(f"Failed to renew lease of {port.remote_busid}: {e}")
+
+    def _renew_leases_periodically(self) -> None:
+        """Keep the leases of attached devices from expiring until stopped."""
+        while not self._stopped.wait(LEASE_RENEW_INTERVAL):
+            self.renew_leases()
 
     def handle_device_command(self, args: ClientDeviceRequest) -> ClientDeviceResponse:
         """
-        Handle attach or detach command.
+        Handle find, attach or detach command.
 
         Args:
             args: ClientDeviceRequest with command and device criteria
@@ -57,30 +204,100 @@ class ClientService:
             MultipleDevicesError: If multiple devices match and first not set
             RuntimeError: For other errors
         """
-        server_hosts = get_host_list(args.host)
-
-        # First find the device
-        device, server = find_device(
-            server_hosts=server_hosts,
-            id=args.id,
-            bus=args.bus,
-            desc=args.desc,
-            first=args.first,
-            serial=args.serial,
-        )
+        timings: dict[str, float] = {}
+        # First find the device, from the registry if there is one
+        found = None
+        if args.host is None and not args.rescan:
+            with timed(timings, "registry"):
+                found = registry_find_device(
+                    id=args.id,
+                    bus=args.bus,
+                    desc=args.desc,
+                    serial=args.serial,
+                    first=args.first,
+                )
+        if found is None:
+            with timed(timings, "discovery"):
+                server_hosts = self.get_host_list(args.host, args.rescan)
+            with timed(timings, "find"):
+                found = find_device(
+                    server_hosts=server_hosts,
+                    id=args.id,
+                    bus=args.bus,
+                    desc=args.desc,
+                    first=args.first,
+                    serial=args.serial,
+                )
+        device, server = found
+
+        if args.command == "find":
+            return ClientDeviceResponse(status="success", data=device, server=server)
+
+        # Concurrent identical requests for the same device share one operation
+        key = (args.command, server, device.bus_id)
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if flight is None:
+                flight = self._flights[key] = Future()
+        if not leader:
+            logger.info(f"Joining {args.command} of {device.bus_id} already running")
+            return flight.result()
+
+        try:
+            with self._device_lock(server, device.bus_id):
+                response = self._run_device_command(
+                    args.command, device, server, timings
+                )
+        except Exception as e:
+            flight.set_exception(e)
+            raise
+        else:
+            flight.set_result(response)
+            return response
+        finally:
+            with self._flights_lock:
+                del self._flights[key]
 
-        # Then perform the requested action
+    def _device_lock(self, server: str, bus_id: str) -> threading.Lock:
+        """Get the lock that serializes operations on one remote device."""
+        with self._flights_lock:
+            return self._device_locks.setdefault((server, bus_id), threading.Lock())
+
+    def _run_device_command(
+        self,
+        command: str,
+        device: UsbDevice,
+        server: str,
+        timings: dict[str, float] | None = None,
+    ) -> ClientDeviceResponse:
+        """Perform an attach or detach of a device that has been found.
+
+        The seconds taken by each phase of an attach are added to timings and
+        returned in the response.
+        """
         local_devices = []
-        match args.command:
+        match command:
             case "attach":
                 logger.info(f"Attaching device {device.bus_id} from {server}")
-                attach_device(device.bus_id, server)
-                # Discover the local port for the attached device
-                local_port = Port.get_port_by_remote_busid(
-                    device.bus_id, server, retries=20
-                )
+                attach_device(device.bus_id, server, self.ports, timings)
+                # Discover the local port for the attached device, and its
+                # device files as udev creates them
+                if self.ports is not None:
+                    with timed(timings, "port"):
+                        local_port = self.ports.wait_for(device.bus_id, server)
+                    if local_port:
+                        with timed(timings, "settle"):
+                            local_devices = self.ports.wait_for_devices(
+                                local_port.port_number
+                            )
+                else:
+                    with timed(timings, "port"):
+                        local_port = Port.wait_for_port(device.bus_id, server)
+                    if local_port:
+                        with timed(timings, "settle"):
+                            local_devices = local_port.local_devices
                 if local_port:
-                    local_devices = local_port.local_devices
                     logger.info(
                         f"Device attached on local port {local_port.port} "
                         f"with devices: {local_devices}"
@@ -91,16 +308,20 @@ class ClientService:
                     )
             case "detach":
                 logger.info(f"Detaching device {device.bus_id} from {server}")
-                detach_device(device.bus_id, server)
+                detach_device(device.bus_id, server, self.ports)
 
         return ClientDeviceResponse(
-            status="success", data=device, server=server, local_devices=local_devices
+            status="success",
+            data=device,
+            server=server,
+            local_devices=local_devices,
+            timings=timings if command == "attach" else None,
         )
 
     def _send_response(
         self,
         client_socket: socket.socket,
-        response: ClientDeviceResponse | ClientErrorResponse,
+        response: ClientListResponse | ClientDeviceResponse | ClientErrorResponse,
     ):
         """Send a JSON response to the client."""
         client_socket.sendall(response.model_dump_json().encode("utf-8") + b"\n")
@@ -108,7 +329,9 @@ class ClientService:
     def _send_error_response(
         self,
         client_socket: socket.socket,
-        status: Literal["error", "not_found", "multiple_matches"],
+        status: Literal[
+            "error", "not_found", "multiple_matches", "config_mismatch", "busy"
+        ],
         message: str,
     ):
         """Send an error response to the client."""
@@ -140,8 +363,22 @@ class ClientService:
                 f"{request.command.capitalize()} request from {address}: {request}"
             )
 
-            # Handle the device command
-            response = self.handle_device_command(request)
+            # the caller would get other answers than from its own servers
+            if request.config is not None and not request.config.same_servers(
+                get_config(), request.host
+            ):
+                self._send_error_response(
+                    client_socket,
+                    config_mismatch_response,
+                    "the client service is configured with other servers",
+                )
+                return
+
+            # Handle the list or device command
+            if request.command == "list":
+                response = self.handle_list_command(request)
+            else:
+                response = self.handle_device_command(request)
             self._send_response(client_socket, response)
 
         except DeviceNotFoundError as e:
@@ -150,6 +387,9 @@ class ClientService:
         except MultipleDevicesError as e:
             logger.warning(f"Multiple devices matched for client {address}: {e}")
             self._send_error_response(client_socket, multiple_matches_response, str(e))
+        except DeviceBusyError as e:
+            logger.warning(f"Device busy for client {address}: {e}")
+            self._send_error_response(client_socket, busy_response, str(e))
         except Exception as e:
             logger.error(f"Error handling client {address}: {e}")
             self._send_error_response(client_socket, error_response, str(e))
@@ -173,6 +413,22 @@ class ClientService:
 
         logger.info(f"Client service listening on {self.socket_path}")
 
+        self.ports = PortTable()
+        self.ports.start()
+        threading.Thread(
+            target=self._renew_leases_periodically, name="lease-renewer", daemon=True
+        ).start()
+
+        beacon_address = get_beacon_address()
+        if beacon_address:
+            self.beacons = BeaconListener(
+                beacon_address,
+                on_generation_change=self._invalidate_inventory,
+                server_port=get_server_port(),
+                on_server_up=self._server_up,
+            )
+            self.beacons.start()
+
         while self.running:
             try:
                 client_socket, address = self.unix_socket.accept()
@@ -189,6 +445,11 @@ class ClientService:
         """Stop the client service."""
         logger.info("Stopping client service")
         self.running = False
+        self._stopped.set()
+        if self.beacons:
+            self.beacons.stop()
+        if self.ports:
+            self.ports.stop()
         if self.unix_socket:
             self.unix_socket.close()
 
@@ -2,6 +2,7 @@
 
 import logging
 import os
+import threading
 from enum import StrEnum
 from pathlib import Path
 
@@ -14,17 +15,34 @@ logger = logging.getLogger(__name__)
 class Defaults:
     """Default configuration values."""
 
+    BEACON_INTERVAL = 5.0
+    BEACON_PORT = 5056
+    CACHE_PATH = Path.home() / ".cache" / "usb-remote" / "servers.json"
     CLIENT_SOCKET = "/tmp/usb-remote-client.sock"
     CONFIG_PATH = Path.home() / ".config" / "usb-remote" / "usb-remote.config"
+    DISCOVERY_TTL = 300.0
+    HELPER_SOCKET = "/run/usb-remote-helper/usb-remote-helper.sock"
+    IDLE_STATE = "released"
+    IDLE_TIMEOUT = 300.0
+    REGISTRY_POLL_INTERVAL = 30.0
+    REGISTRY_PORT = 5057
     SERVER_PORT = 5055
+    SYSTEM_CLIENT_SOCKET = "/run/usb-remote-client/usb-remote-client.sock"
     TIMEOUT = 2.0
 
 
 class Environment(StrEnum):
     """Environment Variables that may override Defaults above."""
 
+    USB_REMOTE_BEACON_ADDRESS = "USB_REMOTE_BEACON_ADDRESS"
+    USB_REMOTE_CACHE_PATH = "USB_REMOTE_CACHE_PATH"
     USB_REMOTE_CLIENT_SOCKET = "USB_REMOTE_CLIENT_SOCKET"
     USB_REMOTE_CONFIG_PATH = "USB_REMOTE_CONFIG_PATH"
+    USB_REMOTE_HELPER_SOCKET = "USB_REMOTE_HELPER_SOCKET"
+    USB_REMOTE_IDLE_STATE = "USB_REMOTE_IDLE_STATE"
+    USB_REMOTE_IDLE_TIMEOUT = "USB_REMOTE_IDLE_TIMEOUT"
+    USB_REMOTE_NO_CLIENT_SERVICE = "USB_REMOTE_NO_CLIENT_SERVICE"
+    USB_REMOTE_REGISTRY_PORT = "USB_REMOTE_REGISTRY_PORT"
     USB_REMOTE_SERVER_PORT = "USB_REMOTE_SERVER_PORT"
 
 
@@ -35,6 +53,10 @@ class UsbRemoteConfig(BaseModel):
     server_ranges: list[str] = Field(default_factory=list)
     timeout: float = Field(default=Defaults.TIMEOUT, gt=0)
     server_port: int = Field(default=Defaults.SERVER_PORT)
+    discovery_ttl: float = Field(default=Defaults.DISCOVERY_TTL, ge=0)
+    beacon_address: str | None = None
+    registry: str | None = None
+    registry_port: int = Field(default=Defaults.REGISTRY_PORT)
     model_config = ConfigDict(extra="forbid")
 
     def __str__(self) -> str:
@@ -48,7 +70,29 @@ class UsbRemoteConfig(BaseModel):
             f"  server_ranges:\n"
             f"{do_list_format(self.server_ranges)}\n"
             f"  timeout={self.timeout}\n"
-            f"  server_port={self.server_port}"
+            f"  server_port={self.server_port}\n"
+            f"  discovery_ttl={self.discovery_ttl}\n"
+            f"  beacon_address={self.beacon_address}\n"
+            f"  registry={self.registry}\n"
+            f"  registry_port={self.registry_port}"
+        )
+
+    def same_servers(self, other: "UsbRemoteConfig", host: str | None) -> bool:
+        """
+        True if both configs contact the same servers for a command.
+
+        Args:
+            other: The config to compare with.
+            host: The single server given to the command, if any, in which case
+                the configured servers are not used.
+        """
+        if self.server_port != other.server_port:
+            return False
+        return host is not None or (
+            self.servers == other.servers
+            and self.server_ranges == other.server_ranges
+            and (self.registry, self.registry_port)
+            == (other.registry, other.registry_port)
         )
 
     @classmethod
@@ -102,6 +146,8 @@ class UsbRemoteConfig(BaseModel):
         except Exception as e:
             logger.error(f"Error writing config file {config_path}: {e}")
             raise
+        finally:
+            _clear_config_cache()
 
 
 def discover_config_path() -> Path | None:
@@ -142,12 +188,33 @@ def discover_config_path() -> Path | None:
     return None
 
 
+# (path, modification key) of the file that produced the cached config
+_ConfigKey = tuple[Path | None, tuple[int, int] | None]
+
+_config_cache: tuple[_ConfigKey, UsbRemoteConfig] | None = None
+_config_lock = threading.Lock()
+
+
+def _config_key(config_path: Path | None) -> _ConfigKey:
+    """Identify a config file version by its path, mtime and size."""
+    if config_path is None:
+        return None, None
+    try:
+        stat = config_path.stat()
+    except OSError:
+        return config_path, None
+    return config_path, (stat.st_mtime_ns, stat.st_size)
+
+
 def get_config() -> UsbRemoteConfig:
     """
     Load configuration from file.
 
-    Args:
-        config_path: Path to config file. If None, discovers using:
+    The loaded configuration is cached for the whole process and only re-read
+    when the discovered config file changes path, modification time or size.
+    The returned snapshot is shared, so copy it before making changes.
+
+    Config file discovery:
             1. USB_REMOTE_CONFIG environment variable
             2. .usb-remote.config in current directory
             3. ~/.config/usb_remote/usb-remote.config (default)
@@ -155,13 +222,42 @@ def get_config() -> UsbRemoteConfig:
     Returns:
         UsbRemoteConfig instance with values from file or defaults.
     """
+    global _config_cache
+
     config_path = discover_config_path()
+    key = _config_key(config_path)
 
-    if config_path is None:
-        logger.debug("No config file found, using defaults")
-        return UsbRemoteConfig()
+    with _config_lock:
+        if _config_cache is not None and _config_cache[0] == key:
+            return _config_cache[1]
+
+        if config_path is None:
+            logger.debug("No config file found, using defaults")
+            config = UsbRemoteConfig()
+        else:
+            config = UsbRemoteConfig.from_file(config_path)
+
+        _config_cache = (key, config)
+        return config
 
-    return UsbRemoteConfig.from_file(config_path)
+
+def _clear_config_cache() -> None:
+    """Discard the cached configuration."""
+    global _config_cache
+
+    with _config_lock:
+        _config_cache = None
+
+
+def reload_config() -> UsbRemoteConfig:
+    """
+    Discard the cached configuration and load it again.
+
+    Returns:
+        The freshly loaded UsbRemoteConfig.
+    """
+    _clear_config_cache()
+    return get_config()
 
 
 def get_servers(config_path: Path | None = None) -> list[str]:
@@ -176,7 +272,7 @@ def get_servers(config_path: Path | None = None) -> list[str]:
     """
     config = get_config()
     logger.debug(f"Loaded {len(config.servers)} servers from config")
-    return config.servers
+    return list(config.servers)
 
 
 def get_server_ranges() -> list[str]:
@@ -184,12 +280,12 @@ def get_server_ranges() -> list[str]:
     Read list of server IP ranges from config file.
 
     Returns:
-        List of IP ranges (e.g., ['192.168.1.30-192.168.1.40']).
+        List of IP ranges (e.g., ['192.168.1.30-40', '10.20.0.0/22']).
         Returns empty list if not configured.
     """
     config = get_config()
     logger.debug(f"Loaded {len(config.server_ranges)} server ranges from config")
-    return config.server_ranges
+    return list(config.server_ranges)
 
 
 def get_timeout() -> float:
@@ -218,6 +314,43 @@ def get_server_port() -> int:
     return config.server_port
 
 
+def get_discovery_ttl() -> float:
+    """
+    Read the discovery cache time-to-live from config file.
+
+    Returns:
+        Seconds for which scanned server_ranges results are reused.
+        0 disables the discovery cache.
+    """
+    config = get_config()
+    return config.discovery_ttl
+
+
+def get_beacon_address() -> str | None:
+    """
+    Read the server beacon address to listen on from config file.
+
+    Returns:
+        Broadcast or multicast address that servers announce themselves on,
+        or None if beacon discovery is disabled.
+    """
+    config = get_config()
+    return config.beacon_address
+
+
+def get_registry() -> tuple[str, int] | None:
+    """
+    Read the registry to ask for the devices of all servers from config file.
+
+    Returns:
+        The registry host and port, or None if no registry is configured.
+    """
+    config = get_config()
+    if config.registry is None:
+        return None
+    return config.registry, config.registry_port
+
+
 def save_servers(servers: list[str]) -> None:
     """
     Save list of server addresses to config file.
@@ -227,6 +360,6 @@ def save_servers(servers: list[str]) -> None:
         config_path: Path to config file. If None, uses default location.
     """
     # Load existing config to preserve other settings
-    config = get_config()
+    config = get_config().model_copy(deep=True)
     config.servers = servers
     config.to_file()
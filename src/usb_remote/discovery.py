@@ -0,0 +1,107 @@
+"""Persistent cache of servers discovered by scanning server_ranges."""
+
+import logging
+import os
+import time
+from pathlib import Path
+
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
+
+from usb_remote.config import Defaults, Environment
+
+logger = logging.getLogger(__name__)
+
+# Consecutive scans a server may miss before it is removed from the cache
+MAX_MISSED_SCANS = 3
+
+
+def get_cache_path() -> Path:
+    """Get the discovery cache path from the environment variable or default.
+
+    Returns:
+        Path to the discovery cache file.
+    """
+    cache_path = os.environ.get(Environment.USB_REMOTE_CACHE_PATH)
+    return Path(cache_path).expanduser() if cache_path else Defaults.CACHE_PATH
+
+
+class DiscoveryCache(BaseModel):
+    """Servers that have responded to recent scans of server_ranges."""
+
+    ranges: list[str] = Field(default_factory=list)
+    port: int = Defaults.SERVER_PORT
+    scanned_at: float = 0.0
+    # server address -> time it last responded to a scan
+    servers: dict[str, float] = Field(default_factory=dict)
+    # server address -> consecutive scans it has not responded to
+    missed: dict[str, int] = Field(default_factory=dict)
+    model_config = ConfigDict(extra="forbid")
+
+    def matches(self, ranges: list[str], port: int) -> bool:
+        """True if this cache was built by scanning the given ranges and port."""
+        return self.ranges == ranges and self.port == port
+
+    def is_fresh(self, ttl: float) -> bool:
+        """True if the last scan was less than ttl seconds ago."""
+        return time.time() - self.scanned_at < ttl
+
+    def update(self, ranges: list[str], port: int, responsive: list[str]) -> None:
+        """
+        Record the result of a new scan.
+
+        Responsive servers are merged with those already cached, so that one
+        dropped probe does not hide a live server. A server is removed once it
+        has missed MAX_MISSED_SCANS scans in a row, and addresses that never
+        responded are never cached.
+        """
+        now = time.time()
+        if not self.matches(ranges, port):
+            self.servers, self.missed = {}, {}
+        self.ranges = list(ranges)
+        self.port = port
+        self.scanned_at = now
+
+        for server in self.servers.keys() - set(responsive):
+            self.missed[server] = self.missed.get(server, 0) + 1
+            if self.missed[server] >= MAX_MISSED_SCANS:
+                logger.debug(f"Forgetting {server}, missed {MAX_MISSED_SCANS} scans")
+                del self.servers[server], self.missed[server]
+        for server in responsive:
+            self.servers[server] = now
+            self.missed.pop(server, None)
+
+    @classmethod
+    def from_file(cls, cache_path: Path) -> "DiscoveryCache":
+        """
+        Load the discovery cache from a JSON file.
+
+        Args:
+            cache_path: Path to the cache file.
+
+        Returns:
+            DiscoveryCache from the file, or an empty cache if it is missing
+            or unreadable.
+        """
+        try:
+            return cls.model_validate_json(cache_path.read_text())
+        except FileNotFoundError:
+            logger.debug(f"Discovery cache not found: {cache_path}")
+        except (OSError, ValidationError) as e:
+            logger.warning(f"Ignoring unreadable discovery cache {cache_path}: {e}")
+        return cls()
+
+    def to_file(self, cache_path: Path) -> None:
+        """
+        Atomically save the discovery cache to a JSON file.
+
+        Args:
+            cache_path: Path to the cache file.
+        """
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = cache_path.with_name(f".{cache_path.name}.{os.getpid()}")
+            tmp_path.write_text(self.model_dump_json())
+            os.replace(tmp_path, cache_path)
+            logger.debug(f"Saved discovery cache to {cache_path}")
+        except OSError as e:
+            logger.warning(f"Failed to write discovery cache {cache_path}: {e}")
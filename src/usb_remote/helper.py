@@ -0,0 +1,263 @@
+"""Privileged helper that runs usbip commands as root for unprivileged callers.
+
+Starting sudo for each usbip command costs a fork and exec plus sudo's policy
+and PAM checks. A helper running as root accepts a narrow set of validated
+usbip commands on a Unix socket instead. Callers fall back to sudo when no
+helper is running.
+"""
+
+import grp
+import logging
+import os
+import socket
+import subprocess
+import threading
+from pathlib import Path
+from typing import Literal
+
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, model_validator
+
+from .config import Defaults, Environment
+
+logger = logging.getLogger(__name__)
+
+# Maximum seconds a usbip command run by the helper may take
+HELPER_COMMAND_TIMEOUT = 30.0
+
+# the usbip options that carry each field of a HelperRequest
+_OPTIONS = {"-b": "busid", "-r": "host", "-p": "port"}
+
+
+class StrictBaseModel(BaseModel):
+    """Base model with strict validation - no extra fields allowed."""
+
+    model_config = ConfigDict(extra="forbid")
+
+
+class HelperRequest(StrictBaseModel):
+    """A usbip command for the privileged helper to run."""
+
+    command: Literal["bind", "unbind", "attach", "detach", "port"]
+    # the patterns reject anything usbip could read as an option
+    busid: str | None = Field(default=None, pattern=r"^\d+-\d+(\.\d+)*$")
+    host: str | None = Field(default=None, pattern=r"^[A-Za-z0-9][A-Za-z0-9.:-]*$")
+    port: int | None = Field(default=None, ge=0, le=999)
+
+    @model_validator(mode="after")
+    def _check_arguments(self) -> "HelperRequest":
+        required = {
+            "bind": {"busid"},
+            "unbind": {"busid"},
+            "attach": {"host", "busid"},
+            "detach": {"port"},
+            "port": set(),
+        }[self.command]
+        given = {name for name in _OPTIONS.values() if getattr(self, name) is not None}
+        if given != required:
+            raise ValueError(
+                f"usbip {self.command} takes {sorted(required) or 'no arguments'}"
+            )
+        return self
+
+    @classmethod
+    def from_usbip_args(cls, args: list[str]) -> "HelperRequest | None":
+        """
+        Make the request for a usbip command line.
+
+        Args:
+            args: The arguments to usbip, e.g. ["bind", "-b", "1-1.1"]
+
+        Returns:
+            The request, or None if the helper does not run this command.
+        """
+        if not args or len(args) % 2 != 1:
+            return None
+        fields: dict[str, str] = {}
+        for option, value in zip(args[1::2], args[2::2], strict=True):
+            if option not in _OPTIONS:
+                return None
+            fields[_OPTIONS[option]] = value
+        try:
+            return cls.model_validate({"command": args[0], **fields})
+        except ValidationError:
+            return None
+
+    def usbip_args(self) -> list[str]:
+        """The arguments to usbip that run this request."""
+        match self.command:
+            case "bind" | "unbind":
+                return [self.command, "-b", str(self.busid)]
+            case "attach":
+                return ["attach", "-r", str(self.host), "-b", str(self.busid)]
+            case "detach":
+                return ["detach", "-p", str(self.port)]
+            case "port":
+                return ["port"]
+
+
+class HelperResponse(StrictBaseModel):
+    """The result of a usbip command run by the privileged helper."""
+
+    status: Literal["success", "error"]
+    returncode: int = 0
+    stdout: str = ""
+    stderr: str = ""
+
+
+def get_helper_socket_path() -> str:
+    """Get the helper socket path from the environment variable or default."""
+    return os.environ.get(Environment.USB_REMOTE_HELPER_SOCKET, Defaults.HELPER_SOCKET)
+
+
+def run_helper(args: list[str]) -> subprocess.CompletedProcess | None:
+    """
+    Run a usbip command through the privileged helper.
+
+    Args:
+        args: The arguments to usbip, e.g. ["detach", "-p", "00"]
+
+    Returns:
+        The completed command, or None if no helper is running or it does not
+        run this command, so that the caller runs it with sudo instead.
+
+    Raises:
+        RuntimeError: If the helper accepted the command but gave no result
+    """
+    socket_path = get_helper_socket_path()
+    if not Path(socket_path).is_socket():
+        return None
+    request = HelperRequest.from_usbip_args(args)
+    if request is None:
+        logger.debug(f"The privileged helper does not run usbip {' '.join(args)}")
+        return None
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(HELPER_COMMAND_TIMEOUT + 5)
+        try:
+            sock.connect(socket_path)
+        except OSError as e:
+            # a stale socket file or one we may not use, fall back to sudo
+            logger.debug(f"Privileged helper at {socket_path} unavailable: {e}")
+            return None
+
+        try:
+            sock.sendall(request.model_dump_json().encode("utf-8") + b"\n")
+            chunks = []
+            while chunk := sock.recv(65536):
+                chunks.append(chunk)
+                if chunk.endswith(b"\n"):
+                    break
+            response = HelperResponse.model_validate_json(b"".join(chunks))
+        except (OSError, ValidationError) as e:
+            # the command may have run, so running it again with sudo is not safe
+            raise RuntimeError(f"Privileged helper failed: {e}") from e
+
+    if response.status == "error":
+        logger.warning(f"Privileged helper declined usbip {args[0]}: {response.stderr}")
+        return None
+    return subprocess.CompletedProcess(
+        ["usbip", *args], response.returncode, response.stdout, response.stderr
+    )
+
+
+class PrivilegedHelper:
+    """Service, run as root, that runs validated usbip commands for other users."""
+
+    def __init__(self, socket_path: str | None = None, group: str | None = None):
+        """
+        Initialize the privileged helper.
+
+        Args:
+            socket_path: Path to the Unix socket. If None, uses
+                get_helper_socket_path().
+            group: Group whose members may use the helper. If None, only root
+                may use it.
+        """
+        self.socket_path = socket_path or get_helper_socket_path()
+        self.group = group
+        self.unix_socket: socket.socket | None = None
+        self.running = False
+
+    def handle_request(self, data: bytes) -> HelperResponse:
+        """Validate a request and run its usbip command."""
+        try:
+            request = HelperRequest.model_validate_json(data)
+        except ValidationError as e:
+            return HelperResponse(status="error", stderr=f"Invalid request: {e}")
+
+        command = ["usbip", *request.usbip_args()]
+        logger.info(f"Running {' '.join(command)}")
+        try:
+            result = subprocess.run(
+                command,
+                capture_output=True,
+                text=True,
+                timeout=HELPER_COMMAND_TIMEOUT,
+            )
+        except (OSError, subprocess.TimeoutExpired) as e:
+            logger.error(f"Failed to run {' '.join(command)}: {e}")
+            return HelperResponse(status="success", returncode=-1, stderr=str(e))
+        return HelperResponse(
+            status="success",
+            returncode=result.returncode,
+            stdout=result.stdout,
+            stderr=result.stderr,
+        )
+
+    def handle_client(self, client_socket: socket.socket) -> None:
+        """Handle individual client connections."""
+        try:
+            chunks = []
+            while chunk := client_socket.recv(4096):
+                chunks.append(chunk)
+                if chunk.endswith(b"\n"):
+                    break
+            response = self.handle_request(b"".join(chunks))
+            client_socket.sendall(response.model_dump_json().encode("utf-8") + b"\n")
+        except OSError as e:
+            logger.error(f"Error handling helper client: {e}")
+        finally:
+            client_socket.close()
+
+    def start(self) -> None:
+        """Start the privileged helper."""
+        socket_path = Path(self.socket_path)
+        socket_path.parent.mkdir(parents=True, exist_ok=True)
+        if socket_path.exists():
+            logger.debug(f"Removing existing socket file: {self.socket_path}")
+            socket_path.unlink()
+
+        self.unix_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.unix_socket.bind(self.socket_path)
+        if self.group is not None:
+            os.chown(self.socket_path, -1, grp.getgrnam(self.group).gr_gid)
+            socket_path.chmod(0o660)
+        else:
+            socket_path.chmod(0o600)
+        self.unix_socket.listen(5)
+        self.running = True
+
+        logger.info(f"Privileged helper listening on {self.socket_path}")
+
+        while self.running:
+            try:
+                client_socket, _ = self.unix_socket.accept()
+                threading.Thread(
+                    target=self.handle_client, args=(client_socket,)
+                ).start()
+            except OSError:
+                logger.debug("Privileged helper socket closed")
+                break
+
+    def stop(self) -> None:
+        """Stop the privileged helper."""
+        logger.info("Stopping privileged helper")
+        self.running = False
+        if self.unix_socket:
+            # closing alone does not wake a thread blocked in accept()
+            try:
+                self.unix_socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self.unix_socket.close()
+        Path(self.socket_path).unlink(missing_ok=True)
@@ -2,14 +2,20 @@
 Module for working with local usbip ports.
 """
 
+import errno
 import logging
+import os
 import re
-from dataclasses import dataclass
+import threading
+import time
+from collections.abc import Callable, Collection
+from dataclasses import dataclass, field
+from functools import cached_property
 from pathlib import Path
-from time import sleep
 
 import pyudev
 
+from usb_remote.usbip import USB_SPEED_SUPER, USBIP_PORT, import_device
 from usb_remote.utility import run_command
 
 logger = logging.getLogger(__name__)
@@ -19,6 +25,205 @@ re_ports = re.compile(
     r"[pP]ort *(?P<port>\d\d)[\s\S]*?\n *(?P<description>.*)\n[\s\S]*?usbip:\/\/(?P<server>[^:]*):\d*\/(?P<remote_busid>[1-9-.]*)"  # noqa: E501
 )
 
+# vhci_hcd reports the state of every local port in sysfs status files, and
+# 'usbip attach' records the server and remote busid of each port it attaches
+VHCI_SYSFS = Path("/sys/devices/platform")
+VHCI_STATE_PATH = Path("/var/run/vhci_hcd")
+USB_SYSFS = Path("/sys/bus/usb/devices")
+# seconds without udev events before a newly attached device is settled
+SETTLE_QUIET = 0.25
+# maximum seconds to wait for a newly attached device to settle
+SETTLE_TIMEOUT = 5.0
+# maximum seconds to wait for the local port of an attached device to appear
+ATTACH_TIMEOUT = 4.0
+# seconds between checks for the port while no udev events arrive
+ATTACH_RECHECK = 0.5
+# vhci_hcd port status values for ports with no device attached
+VDEV_ST_NULL = 4
+VDEV_ST_NOTASSIGNED = 5
+# vhci_hcd port status of a port whose connection to the server has failed
+VDEV_ST_ERROR = 7
+
+# serializes choosing a free port and attaching to it within this process
+_attach_lock = threading.Lock()
+
+
+@dataclass
+class VhciPort:
+    """A local vhci_hcd port, as reported by its sysfs status line."""
+
+    port: int  # the local port number
+    hub: str  # the root hub, "hs" (USB 2) or "ss" (USB 3)
+    status: int  # the vhci_hcd device status
+    devid: int  # the remote (busnum << 16) | devnum
+    sockfd: int  # the socket the kernel uses to talk to the server, -1 if unknown
+    local_busid: str  # the busid of the device on the local system
+
+
+def read_vhci_status(include_free: bool = False) -> list[VhciPort] | None:
+    """Read the ports in use from the vhci_hcd sysfs status files.
+
+    Args:
+        include_free: Also return the ports with no device attached.
+
+    Returns:
+        The ports with a device attached, or None if vhci_hcd does not expose
+        its status in sysfs (e.g. the module is not loaded).
+    """
+    status_files = sorted(VHCI_SYSFS.glob("vhci_hcd.*/status*"))
+    if not status_files:
+        return None
+
+    ports = []
+    for status_file in status_files:
+        lines = status_file.read_text().splitlines()
+        if not lines:
+            continue
+        # kernels before 4.13 have no hub column (only USB 2 ports) and report
+        # a socket pointer rather than a file descriptor, so read the columns
+        # from the right
+        has_hub = lines[0].split()[0] == "hub"
+        for line in lines[1:]:
+            *hub, port, status, _speed, devid, sockfd, local_busid = line.split()
+            if not include_free and int(status) in (VDEV_ST_NULL, VDEV_ST_NOTASSIGNED):
+                continue
+            ports.append(
+                VhciPort(
+                    port=int(port),
+                    hub=hub[0] if has_hub else "hs",
+                    status=int(status),
+                    devid=int(devid, 16),
+                    sockfd=int(sockfd) if has_hub else -1,
+                    local_busid=local_busid,
+                )
+            )
+    return ports
+
+
+def read_vhci_record(port: int) -> tuple[str, str] | None:
+    """Read the server and remote busid that 'usbip attach' recorded for a port.
+
+    Args:
+        port: The local port number.
+
+    Returns:
+        (server, remote_busid), or None if the port has no record.
+
+    Raises:
+        PermissionError: If the records cannot be read, 'usbip attach' makes
+            them readable by root only
+    """
+    try:
+        host, _service, busid = (VHCI_STATE_PATH / f"port{port}").read_text().split()
+    except PermissionError:
+        raise
+    except (OSError, ValueError):
+        return None
+    return host, busid
+
+
+def vhci_available() -> bool:
+    """True if ports can be attached by writing to vhci_hcd sysfs directly.
+
+    This needs root, otherwise the usbip command line tool is run with sudo.
+    """
+    return os.geteuid() == 0 and (VHCI_SYSFS / "vhci_hcd.0" / "attach").exists()
+
+
+def vhci_attach(
+    host: str, busid: str, usbip_port: int = USBIP_PORT, timeout: float | None = None
+) -> int:
+    """Attach a remote device to a free local port, as 'usbip attach' does.
+
+    Args:
+        host: The server hostname or IP address
+        busid: The bus ID of the device on the server
+        usbip_port: The port of usbipd on the server
+        timeout: Connection timeout in seconds, None to block
+
+    Returns:
+        The local port number the device is attached to.
+    """
+    sock, device = import_device(host, busid, usbip_port, timeout)
+    hub = "ss" if device.speed >= USB_SPEED_SUPER else "hs"
+    try:
+        with _attach_lock:
+            free_ports = [
+                vhci_port.port
+                for vhci_port in read_vhci_status(include_free=True) or []
+                if vhci_port.status == VDEV_ST_NULL and vhci_port.hub == hub
+            ]
+            for port in free_ports:
+                try:
+                    # the kernel takes its own reference to the socket
+                    (VHCI_SYSFS / "vhci_hcd.0" / "attach").write_text(
+                        f"{port} {sock.fileno()} {device.devid} {device.speed}"
+                    )
+                    break
+                except OSError as e:
+                    # EBUSY means another process took this port first
+                    if e.errno != errno.EBUSY:
+                        raise
+                    logger.debug(f"Port {port} was taken, trying the next: {e}")
+            else:
+                raise RuntimeError(f"No free vhci_hcd {hub} port to attach {busid}")
+    finally:
+        sock.close()
+
+    # record the remote end of the port as 'usbip attach' does
+    VHCI_STATE_PATH.mkdir(mode=0o700, parents=True, exist_ok=True)
+    (VHCI_STATE_PATH / f"port{port}").write_text(f"{host} {usbip_port} {busid}\n")
+    logger.debug(f"Attached {busid} from {host} to local port {port}")
+    return port
+
+
+def vhci_detach(port: int) -> None:
+    """Detach a local port, as 'usbip detach' does.
+
+    Args:
+        port: The local port number
+    """
+    (VHCI_SYSFS / "vhci_hcd.0" / "detach").write_text(str(port))
+    (VHCI_STATE_PATH / f"port{port}").unlink(missing_ok=True)
+    logger.debug(f"Detached local port {port}")
+
+
+def _vhci_device_paths(context: pyudev.Context) -> dict[int, Path]:
+    """Map each vhci port in use to the sysfs path of its local USB device.
+
+    Args:
+        context: pyudev Context object
+
+    Returns:
+        Mapping of local port number to sysfs device path.
+    """
+    paths = {}
+    # VHCI ports map: port 0 -> devpath "1", port 1 -> devpath "2", etc.
+    for device in context.list_devices(subsystem="usb", DEVTYPE="usb_device"):
+        if "vhci_hcd" not in device.sys_path:
+            continue
+        devpath = device.attributes.get("devpath")
+        devpath = devpath.decode("utf-8").strip() if devpath else ""
+        if devpath.isdigit():
+            paths[int(devpath) - 1] = Path(device.sys_path)
+    return paths
+
+
+def _read_description(local_busid: str) -> str:
+    """Describe a local USB device from its sysfs attributes."""
+    device_path = USB_SYSFS / local_busid
+
+    def attribute(name: str) -> str:
+        try:
+            return (device_path / name).read_text().strip()
+        except OSError:
+            return "unknown"
+
+    return (
+        f"{attribute('manufacturer')} : {attribute('product')} "
+        f"({attribute('idVendor')}:{attribute('idProduct')})"
+    )
+
 
 @dataclass
 class Port:
@@ -31,102 +236,113 @@ class Port:
     server: str  # the server ip address
     description: str  # the device description (vendor and product)
     remote_busid: str  # the remote busid of the device
+    # the sysfs path of the local USB device, looked up in udev if None
+    sys_path: Path | None = field(default=None, compare=False)
 
     def __post_init__(self):
         # everything is strings from the regex, convert port to int
         self.port_number = int(self.port)
-        # list of local device files (e.g., ["/dev/ttyACM0"])
-        self.local_devices = self.get_local_devices()
 
-    def get_local_devices(self) -> list[str]:
+    @cached_property
+    def local_devices(self) -> list[str]:
+        """Local device files of this port (e.g., ["/dev/ttyACM0"]).
+
+        Finding these scans udev and waits for the device files to settle, so
+        it is only done when first accessed.
+        """
+        return self.get_local_devices()
+
+    def get_local_devices(self, settle_quiet: float = SETTLE_QUIET) -> list[str]:
         """Find local device files associated with this usbip port.
 
+        Args:
+            settle_quiet: Seconds without udev events after which the device
+                is considered settled, 0 to return the current files at once
+
         Returns:
             List of device file paths (e.g., ["/dev/ttyACM0", "/dev/hidraw0"])
         """
-        devices = []
-
         try:
             context = pyudev.Context()
-
-            # Find all USB devices under vhci_hcd controllers
-            # VHCI ports map: port 0 -> devpath "1", port 1 -> devpath "2", etc.
-            target_devpath = str(self.port_number + 1)
-
-            # Search for USB devices with subsystem 'usb' and device type 'usb_device'
-            for device in context.list_devices(subsystem="usb", DEVTYPE="usb_device"):
-                # Check if this device is under a vhci_hcd controller
-                if "vhci_hcd" in device.sys_path:
-                    # Check the devpath attribute to match our port
-                    devpath = device.attributes.get("devpath")
-                    if devpath and devpath.decode("utf-8").strip() == target_devpath:
-                        logger.debug(
-                            f"Port {self.port_number}: Found device "
-                            f"at {device.sys_path}"
-                        )
-                        found_devices = self._find_dev_files(
-                            context, Path(device.sys_path)
-                        )
-                        devices.extend(found_devices)
-                        if devices:
-                            return devices
+            sys_path = self.sys_path or _vhci_device_paths(context).get(
+                self.port_number
+            )
+            if sys_path is None:
+                return []
+            logger.debug(f"Port {self.port_number}: Found device at {sys_path}")
+            return self._find_dev_files(context, sys_path, settle_quiet)
         except Exception as e:
             logger.debug(
                 f"Error finding local devices for port {self.port_number}: {e}"
             )
-
-        return devices
+            return []
 
     def _find_dev_files(
-        self, context: pyudev.Context, sys_device_path: Path
+        self,
+        context: pyudev.Context,
+        sys_device_path: Path,
+        settle_quiet: float = SETTLE_QUIET,
+        settle_timeout: float = SETTLE_TIMEOUT,
     ) -> list[str]:
         """Find /dev files associated with a sysfs device path using pyudev.
 
+        Child devices (e.g. block devices and partitions) may still be being
+        created just after an attach, so udev events beneath the device are
+        collected until none have arrived for settle_quiet seconds.
+
         Args:
             context: pyudev Context object
             sys_device_path: Path to device in /sys/bus/usb/devices/
+            settle_quiet: Seconds without udev events after which the device
+                is considered settled
+            settle_timeout: Maximum seconds to wait for the device to settle
 
         Returns:
             List of /dev file paths
         """
-        dev_files = set()
+        dev_files: set[str] = set()
+        deadline = time.monotonic() + settle_timeout
+
+        try:
+            # start monitoring before enumerating so that no event is missed
+            monitor = pyudev.Monitor.from_netlink(context)
+            monitor.start()
+        except Exception as e:
+            logger.debug(f"Cannot monitor udev, not waiting for devices: {e}")
+            monitor = None
 
         try:
             # Create a device from the sysfs path
             base_device = pyudev.Devices.from_path(context, str(sys_device_path))
-
-            # Wait for child devices to stabilize by polling until the device count
-            # stops changing (e.g., block devices, partitions being created)
-            max_attempts = 10
-            stable_count = 0
-            previous_count = 0
-
-            for _ in range(max_attempts):
-                current_files = set()
-
-                # Get all child devices with device nodes
-                for device in context.list_devices(parent=base_device):
-                    if device.device_node:
-                        current_files.add(device.device_node)
-
-                # Also check if the base device itself has a device node
-                if base_device.device_node:
-                    current_files.add(base_device.device_node)
-
-                # Check if the count has stabilized
-                if len(current_files) == previous_count:
-                    stable_count += 1
-                    # If stable for 2 consecutive checks, we're done
-                    if stable_count >= 2:
-                        dev_files = current_files
-                        break
-                else:
-                    stable_count = 0
-                    previous_count = len(current_files)
-                    dev_files = current_files
-
-                # Small delay between polls
-                sleep(0.1)
+            devices = [base_device, *context.list_devices(parent=base_device)]
+            dev_files = {d.device_node for d in devices if d.device_node}
+
+            # a device whose youngest child was initialized by udev longer than
+            # settle_quiet ago has already settled
+            age = min(
+                (
+                    d.time_since_initialized.total_seconds() if d.is_initialized else 0
+                    for d in devices
+                ),
+                default=0,
+            )
+            last_event = time.monotonic() - age
+
+            while monitor is not None:
+                remaining = min(last_event + settle_quiet, deadline) - time.monotonic()
+                if remaining <= 0:
+                    break
+                event = monitor.poll(timeout=remaining)
+                if event is None:
+                    break
+                if not Path(event.sys_path).is_relative_to(base_device.sys_path):
+                    continue
+                last_event = time.monotonic()
+                if event.device_node:
+                    if event.action == "remove":
+                        dev_files.discard(event.device_node)
+                    else:
+                        dev_files.add(event.device_node)
 
         except Exception as e:
             logger.debug(f"Error finding dev files for {sys_device_path}: {e}")
@@ -138,9 +354,15 @@ class Port:
 
         # don't raise an exception if detach fails because the port may already
         # be detached
-        run_command(
-            ["sudo", "usbip", "detach", "-p", str(self.port_number)], check=False
-        )
+        if vhci_available():
+            try:
+                vhci_detach(self.port_number)
+            except OSError as e:
+                logger.debug(f"Failed to detach port {self.port_number}: {e}")
+        else:
+            run_command(
+                ["sudo", "usbip", "detach", "-p", str(self.port_number)], check=False
+            )
 
     def __repr__(self) -> str:
         return (
@@ -155,28 +377,78 @@ class Port:
     def list_ports() -> list["Port"]:
         """Lists the local usbip ports in use.
 
+        The ports are read from the vhci_hcd sysfs status files where possible,
+        falling back to parsing 'usbip port' output, which runs with sudo, when
+        vhci_hcd has no sysfs status or the usbip records are readable by root
+        only.
+
         Returns:
             A list of Port objects, each representing a port in use.
             Returns empty list if unable to query ports (e.g., vhci_hcd not loaded).
         """
 
         try:
+            vhci_ports = read_vhci_status()
+            if vhci_ports is not None:
+                try:
+                    return Port._list_sysfs_ports(vhci_ports)
+                except PermissionError as e:
+                    logger.debug(f"Cannot read usbip port records: {e}")
+
             result = run_command(["sudo", "usbip", "port"], check=False)
             if result.returncode != 0:
                 logger.debug(f"usbip port command failed: {result.stderr}")
                 return []
 
             output = result.stdout
-            ports: list[Port] = []
+            ports = []
             for match in re_ports.finditer(output):
-                port_info = match.groupdict()
-                ports.append(Port(**port_info))
+                ports.append(
+                    Port(
+                        port=match["port"],
+                        server=match["server"],
+                        description=match["description"],
+                        remote_busid=match["remote_busid"],
+                    )
+                )
+            if ports:
+                # one udev pass locates the devices of all the ports
+                sys_paths = _vhci_device_paths(pyudev.Context())
+                for port in ports:
+                    port.sys_path = sys_paths.get(port.port_number)
             logger.debug(f"Found {len(ports)} active usbip ports")
             return ports
         except Exception as e:
             logger.debug(f"Error listing ports: {e}")
             return []
 
+    @staticmethod
+    def _list_sysfs_ports(vhci_ports: list[VhciPort]) -> list["Port"]:
+        """Make the Ports of the vhci_hcd ports in use from their usbip records.
+
+        Raises:
+            PermissionError: If the usbip records cannot be read
+        """
+        ports: list[Port] = []
+        for vhci_port in vhci_ports:
+            record = read_vhci_record(vhci_port.port)
+            if record is None:
+                # the port is in use before usbip records its remote device
+                logger.debug(f"No usbip record for port {vhci_port.port}")
+                continue
+            server, remote_busid = record
+            ports.append(
+                Port(
+                    port=f"{vhci_port.port:02d}",
+                    server=server,
+                    description=_read_description(vhci_port.local_busid),
+                    remote_busid=remote_busid,
+                    sys_path=(USB_SYSFS / vhci_port.local_busid).resolve(),
+                )
+            )
+        logger.debug(f"Found {len(ports)} active usbip ports in sysfs")
+        return ports
+
     @classmethod
     def get_port_by_remote_busid(
         cls, remote_busid: str, server: str, retries=0
@@ -201,6 +473,309 @@ class Port:
                     logger.info(f"Device attached on local port {port.port}")
                     return port
             if attempt < retries:
-                sleep(0.2)
+                time.sleep(0.2)
 
         return None
+
+    @classmethod
+    def wait_for_port(
+        cls,
+        remote_busid: str,
+        server: str,
+        timeout: float = ATTACH_TIMEOUT,
+    ) -> "Port | None":
+        """Wait for the local port of a remote device that is being attached.
+
+        The ports are checked again whenever udev reports a USB device event
+        beneath a vhci_hcd controller, rather than polling on a fixed interval.
+
+        Args:
+            remote_busid: The remote busid of the device being attached.
+            server: The server ip address the device is attached from.
+            timeout: Maximum seconds to wait for the port to appear.
+
+        Returns:
+            The Port of the local mount of the remote device if it appears
+            within timeout, otherwise None.
+        """
+        deadline = time.monotonic() + timeout
+
+        try:
+            # start monitoring before the first check so that no event is missed
+            monitor = pyudev.Monitor.from_netlink(pyudev.Context())
+            monitor.filter_by(subsystem="usb")
+            monitor.start()
+        except Exception as e:
+            logger.debug(f"Cannot monitor udev, polling for the port: {e}")
+            return cls.get_port_by_remote_busid(
+                remote_busid, server, retries=int(timeout / 0.2)
+            )
+
+        while True:
+            port = cls.get_port_by_remote_busid(remote_busid, server)
+            if port:
+                return port
+
+            # the attach record may be written just after the device's events,
+            # so check again periodically even if no further event arrives
+            recheck = time.monotonic() + ATTACH_RECHECK
+            while (now := time.monotonic()) < min(recheck, deadline):
+                event = monitor.poll(timeout=min(recheck, deadline) - now)
+                if event is not None and "vhci_hcd" in event.sys_path:
+                    break
+            if now >= deadline:
+                return cls.get_port_by_remote_busid(remote_busid, server)
+
+
+def reconcile_ports(
+    server: str, remote_busids: Collection[str], ports: list[Port] | None = None
+) -> list[Port]:
+    """Detach the local ports of a server that no longer exports their devices.
+
+    After a server restarts, every port attached from it before the restart is
+    dead. They are found from a single listing of the ports and detached in one
+    pass, rather than one at a time as each device is attached again.
+
+    Args:
+        server: The server the ports are attached from.
+        remote_busids: The bus IDs of the devices the server exports.
+        ports: The ports in use, listed if None.
+
+    Returns:
+        The ports that were detached.
+    """
+    if ports is None:
+        ports = Port.list_ports()
+    failed = {
+        vhci_port.port
+        for vhci_port in read_vhci_status() or []
+        if vhci_port.status == VDEV_ST_ERROR
+    }
+    stale = [
+        port
+        for port in ports
+        if port.server == server
+        and (port.remote_busid not in remote_busids or port.port_number in failed)
+    ]
+    for port in stale:
+        logger.info(
+            f"Detaching stale port {port.port} of {port.remote_busid} from {server}"
+        )
+        port.detach()
+    return stale
+
+
+class PortTable:
+    """A live table of the local usbip ports, kept up to date by udev events.
+
+    The table is read once when started and then updated as udev reports ports
+    being attached and detached and device files being created and removed,
+    so that lookups do not need to list the ports or scan udev.
+    """
+
+    def __init__(self, on_change: Callable[[str, Port, list[str]], None] | None = None):
+        """
+        Initialize the port table.
+
+        Args:
+            on_change: Called with the event, the port and its local device
+                files as the table changes. The event is "port" for each port
+                in use when the table is first read, then "attached",
+                "detached" or "devices" as ports and their device files
+                change. It may be called from the udev observer thread and
+                from threads that reload the table.
+        """
+        self.on_change = on_change
+        self._loaded = False
+        self._ports: dict[int, Port] = {}
+        # local device files of each port, and when they last changed
+        self._nodes: dict[int, set[str]] = {}
+        self._nodes_changed: dict[int, float] = {}
+        self._changed = threading.Condition()
+        # serializes reloads so that an older listing never replaces a newer one
+        self._reload_lock = threading.Lock()
+        self._observer: pyudev.MonitorObserver | None = None
+        self._recheck: threading.Timer | None = None
+
+    def ports(self) -> list[Port]:
+        """Return the ports in use."""
+        with self._changed:
+            return list(self._ports.values())
+
+    def find(self, remote_busid: str, server: str) -> Port | None:
+        """Return the local port a remote device is attached to, if any."""
+        with self._changed:
+            for port in self._ports.values():
+                if port.remote_busid == remote_busid and port.server == server:
+                    return port
+        return None
+
+    def local_devices(self, port_number: int) -> list[str]:
+        """Return the local device files of a port."""
+        with self._changed:
+            return sorted(self._nodes.get(port_number, ()))
+
+    def reload(self) -> None:
+        """Read the ports in use again, keeping what is known of unchanged ports."""
+        with self._reload_lock:
+            listed = {port.port_number: port for port in Port.list_ports()}
+            changes: list[tuple[str, Port, list[str]]] = []
+
+            with self._changed:
+                new_ports = []
+                for number, port in listed.items():
+                    if self._ports.get(number) == port:
+                        listed[number] = self._ports[number]
+                    else:
+                        new_ports.append(port)
+                        self._nodes[number] = set()
+                        self._nodes_changed[number] = time.monotonic()
+                for number in self._ports.keys() - listed.keys():
+                    self._nodes.pop(number, None)
+                    self._nodes_changed.pop(number, None)
+                    changes.append(("detached", self._ports[number], []))
+                self._ports = listed
+                self._changed.notify_all()
+
+            # scan udev for the files of new ports without blocking lookups,
+            # don't wait for them to settle as later events add them
+            for port in new_ports:
+                nodes = port.get_local_devices(settle_quiet=0)
+                with self._changed:
+                    if self._ports.get(port.port_number) is not port:
+                        continue
+                    if nodes:
+                        self._nodes[port.port_number].update(nodes)
+                        self._nodes_changed[port.port_number] = time.monotonic()
+                        self._changed.notify_all()
+                    nodes = sorted(self._nodes[port.port_number])
+                changes.append(("attached" if self._loaded else "port", port, nodes))
+            self._loaded = True
+            self._notify(changes)
+
+            # a port is in use before usbip records which device it is attached to
+            vhci_ports = read_vhci_status()
+            if vhci_ports is not None and len(vhci_ports) > len(listed):
+                if self._recheck:
+                    self._recheck.cancel()
+                self._recheck = threading.Timer(ATTACH_RECHECK, self.reload)
+                self._recheck.daemon = True
+                self._recheck.start()
+
+    def wait_for(
+        self, remote_busid: str, server: str, timeout: float = ATTACH_TIMEOUT
+    ) -> Port | None:
+        """Wait for the local port of a remote device that is being attached.
+
+        Args:
+            remote_busid: The remote busid of the device being attached.
+            server: The server ip address the device is attached from.
+            timeout: Maximum seconds to wait for the port to appear.
+
+        Returns:
+            The Port of the local mount of the remote device if it appears
+            within timeout, otherwise None.
+        """
+        deadline = time.monotonic() + timeout
+        self.reload()
+        while True:
+            port = self.find(remote_busid, server)
+            remaining = deadline - time.monotonic()
+            if port or remaining <= 0:
+                return port
+            with self._changed:
+                notified = self._changed.wait(min(ATTACH_RECHECK, remaining))
+            if not notified:
+                self.reload()
+
+    def wait_for_devices(
+        self,
+        port_number: int,
+        settle_quiet: float = SETTLE_QUIET,
+        timeout: float = SETTLE_TIMEOUT,
+    ) -> list[str]:
+        """Wait for the local device files of a newly attached port to settle.
+
+        Args:
+            port_number: The local port number.
+            settle_quiet: Seconds without changes to the port's device files
+                after which they are considered settled.
+            timeout: Maximum seconds to wait for the files to settle.
+
+        Returns:
+            The local device files of the port.
+        """
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while True:
+                now = time.monotonic()
+                settled = self._nodes_changed.get(port_number, 0) + settle_quiet
+                if now >= min(settled, deadline):
+                    return sorted(self._nodes.get(port_number, ()))
+                self._changed.wait(min(settled, deadline) - now)
+
+    def _handle_event(self, device: pyudev.Device) -> None:
+        """Update the table from a udev event."""
+        if "vhci_hcd" not in device.sys_path:
+            return
+
+        # a port's device is on a root hub of vhci_hcd, e.g. vhci_hcd.0/usb3/3-1
+        sys_path = Path(device.sys_path)
+        if (
+            device.device_type == "usb_device"
+            and device.action in ("add", "remove")
+            and sys_path.parent.parent.name.startswith("vhci_hcd")
+        ):
+            self.reload()
+            return
+
+        if device.device_node:
+            with self._changed:
+                for number, port in self._ports.items():
+                    if port.sys_path and sys_path.is_relative_to(port.sys_path):
+                        nodes = self._nodes.setdefault(number, set())
+                        removed = device.action == "remove"
+                        if (device.device_node in nodes) != removed:
+                            return
+                        if removed:
+                            nodes.discard(device.device_node)
+                        else:
+                            nodes.add(device.device_node)
+                        self._nodes_changed[number] = time.monotonic()
+                        self._changed.notify_all()
+                        changes = [("devices", port, sorted(nodes))]
+                        break
+                else:
+                    return
+            self._notify(changes)
+
+    def _notify(self, changes: list[tuple[str, Port, list[str]]]) -> None:
+        """Report changes to the table, outside its lock, to on_change."""
+        if self.on_change is None:
+            return
+        for event, port, nodes in changes:
+            try:
+                self.on_change(event, port, nodes)
+            except Exception as e:
+                logger.error(f"Error reporting {event} of port {port.port}: {e}")
+
+    def start(self) -> None:
+        """Read the ports and start following udev events in a background thread."""
+        try:
+            monitor = pyudev.Monitor.from_netlink(pyudev.Context())
+            self._observer = pyudev.MonitorObserver(
+                monitor, callback=self._handle_event, name="port-table"
+            )
+            self._observer.start()
+        except Exception as e:
+            logger.warning(f"Cannot monitor udev, port table will not update: {e}")
+        self.reload()
+        logger.info(f"Port table started with {len(self._ports)} ports")
+
+    def stop(self) -> None:
+        """Stop following udev events."""
+        if self._observer:
+            self._observer.send_stop()
+            self._observer.join(timeout=1)
+        if self._recheck:
+            self._recheck.cancel()
@@ -0,0 +1,315 @@
+"""Registry that keeps the merged device inventory of a fleet of servers.
+
+When every client asks every server for its devices, the load grows with
+clients times servers. A registry lists each server once, re-listing servers
+that send beacons only when they announce a new inventory generation, and
+answers list and find for the whole fleet in one request. Clients then contact
+the server that owns a device only to attach or detach it.
+"""
+
+import logging
+import os
+import re
+import socket
+import threading
+
+from pydantic import TypeAdapter, ValidationError
+
+from .api import (
+    DeviceRequest,
+    ErrorResponse,
+    ListRequest,
+    RegistryDeviceResponse,
+    RegistryListResponse,
+    error_response,
+    find_command,
+    multiple_matches_response,
+    not_found_response,
+)
+from .beacon import BeaconListener
+from .client import list_devices
+from .config import Defaults, Environment, get_beacon_address, get_server_port
+from .usbdevice import DeviceNotFoundError, MultipleDevicesError, UsbDevice
+from .utility import get_host_list
+
+logger = logging.getLogger(__name__)
+
+# characters that make a search criterion a glob pattern
+_GLOB_CHARS = re.compile(r"[*?\[]")
+
+
+class Registry:
+    """Service that follows many servers and answers list and find for all."""
+
+    def __init__(
+        self,
+        host: str = "0.0.0.0",
+        port: int | None = None,
+        beacon_address: str | None = None,
+        poll_interval: float = Defaults.REGISTRY_POLL_INTERVAL,
+    ):
+        """
+        Initialize the registry.
+
+        Args:
+            host: Address to listen for clients on
+            port: Port to listen for clients on. If None, uses
+                USB_REMOTE_REGISTRY_PORT or the default registry port.
+            beacon_address: Address to listen for server beacons on. If None,
+                uses the beacon_address of the config file.
+            poll_interval: Seconds between listings of the servers whose
+                inventory may have changed
+        """
+        self.host = host
+        if port is None:
+            port = int(
+                os.environ.get(
+                    Environment.USB_REMOTE_REGISTRY_PORT, Defaults.REGISTRY_PORT
+                )
+            )
+        self.port = port
+        if beacon_address is None:
+            beacon_address = get_beacon_address()
+        self.beacon_address = beacon_address
+        self.poll_interval = poll_interval
+        self.server_socket = None
+        self.running = False
+        self.beacons: BeaconListener | None = None
+        # server -> (beacon generation when listed, devices)
+        self._inventories: dict[str, tuple[int | None, list[UsbDevice]]] = {}
+        # "vendor:product" -> (server, device) of each device, for finds by ID
+        self._by_id: dict[str, list[tuple[str, UsbDevice]]] = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def servers(self) -> list[str]:
+        """Get the configured servers plus any announced by beacons."""
+        servers = get_host_list(None)
+        if self.beacons is not None:
+            for server in self.beacons.live_servers():
+                if server not in servers:
+                    servers.append(server)
+        return servers
+
+    def _generation(self, server: str) -> int | None:
+        """The inventory generation server last announced, if it sends beacons."""
+        return self.beacons.generation(server) if self.beacons else None
+
+    def _list(self, servers: list[str]) -> None:
+        """List the devices of servers and index them."""
+        # read the generations before listing, a change during it is seen next time
+        generations = {server: self._generation(server) for server in servers}
+        listed = list_devices(servers)
+        with self._lock:
+            for server, devices in listed.items():
+                # an empty list may be a failure to reach the server, list it
+                # again at the next poll
+                generation = generations[server] if devices else None
+                self._inventories[server] = (generation, devices)
+            self._reindex()
+
+    def _reindex(self) -> None:
+        """Rebuild the index of the devices by ID, holding the lock."""
+        self._by_id = {}
+        for server, (_, devices) in self._inventories.items():
+            for device in devices:
+                device_id = f"{device.vendor_id}:{device.product_id}".lower()
+                self._by_id.setdefault(device_id, []).append((server, device))
+
+    def refresh(self) -> None:
+        """
+        List the servers whose inventory may have changed since last listed.
+
+        Servers that send beacons are listed again only when they announce a new
+        inventory generation. Servers no longer followed are forgotten.
+        """
+        servers = self.servers()
+        with self._lock:
+            for server in self._inventories.keys() - set(servers):
+                logger.info(f"No longer following {server}")
+                del self._inventories[server]
+            stale = [
+                server
+                for server in servers
+                if server not in self._inventories
+                or self._inventories[server][0] is None
+                or self._inventories[server][0] != self._generation(server)
+            ]
+            self._reindex()
+        if stale:
+            logger.debug(f"Listing {len(stale)} of {len(servers)} servers")
+            self._list(stale)
+
+    def _relist(self, server: str, generation: int | None = None) -> None:
+        """List a server that announced a change, off the beacon thread."""
+        threading.Thread(
+            target=self._list, args=([server],), name="registry-list", daemon=True
+        ).start()
+
+    def _poll(self) -> None:
+        """Refresh the inventory until the registry stops."""
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Failed to refresh the inventory: {e}")
+            if self._stopped.wait(self.poll_interval):
+                break
+
+    def inventory(self) -> dict[str, list[UsbDevice]]:
+        """Get the devices of each server followed."""
+        with self._lock:
+            return {
+                server: list(devices)
+                for server, (_, devices) in self._inventories.items()
+            }
+
+    def find(self, request: DeviceRequest) -> tuple[UsbDevice, str]:
+        """
+        Find a device on any server, as the servers themselves would.
+
+        Args:
+            request: The find request with the search criteria
+
+        Returns:
+            The device and the server it is on
+
+        Raises:
+            DeviceNotFoundError: If no server has a matching device
+            MultipleDevicesError: If more than one device matched and first is
+                not set
+        """
+        with self._lock:
+            if request.id and not _GLOB_CHARS.search(request.id):
+                candidates = list(self._by_id.get(request.id.lower(), []))
+            else:
+                candidates = [
+                    (server, device)
+                    for server, (_, devices) in self._inventories.items()
+                    for device in devices
+                ]
+            servers = len(self._inventories)
+
+        matches = [
+            (device, server)
+            for server, device in candidates
+            if device.matches(
+                id=request.id, bus=request.bus, desc=request.desc, serial=request.serial
+            )
+        ]
+        if not matches:
+            raise DeviceNotFoundError(
+                f"No matching device found across {servers} servers"
+            )
+        if len(matches) > 1 and not request.first:
+            device_list = "\n".join(f"  {dev} (on {srv})" for dev, srv in matches)
+            raise MultipleDevicesError(
+                f"Multiple devices matched across servers:\n{device_list}\n\n"
+                "Use --first to attach to the first match."
+            )
+        return matches[0]
+
+    def _send_response(
+        self,
+        client_socket: socket.socket,
+        response: RegistryListResponse | RegistryDeviceResponse | ErrorResponse,
+    ):
+        """Send a JSON response to the client."""
+        client_socket.sendall(response.model_dump_json().encode("utf-8") + b"\n")
+
+    def handle_client(self, client_socket: socket.socket, address):
+        """Handle individual client connections."""
+        try:
+            data = client_socket.recv(1024).decode("utf-8")
+            request_adapter = TypeAdapter(ListRequest | DeviceRequest)
+            try:
+                request = request_adapter.validate_json(data)
+            except ValidationError as e:
+                self._send_response(
+                    client_socket,
+                    ErrorResponse(
+                        status=error_response,
+                        message=f"Invalid request format: {str(e)}",
+                    ),
+                )
+                return
+
+            logger.debug(f"{request.command.capitalize()} request from {address}")
+
+            if isinstance(request, ListRequest):
+                response = RegistryListResponse(status="success", data=self.inventory())
+            elif request.command == find_command:
+                device, server = self.find(request)
+                response = RegistryDeviceResponse(
+                    status="success", data=device, server=server
+                )
+            else:
+                response = ErrorResponse(
+                    status=error_response,
+                    message=f"The registry only answers list and find, send "
+                    f"{request.command} to the server that owns the device",
+                )
+            self._send_response(client_socket, response)
+
+        except DeviceNotFoundError as e:
+            self._send_response(
+                client_socket, ErrorResponse(status=not_found_response, message=str(e))
+            )
+        except MultipleDevicesError as e:
+            self._send_response(
+                client_socket,
+                ErrorResponse(status=multiple_matches_response, message=str(e)),
+            )
+        except Exception as e:
+            logger.error(f"Error handling client {address}: {e}")
+            self._send_response(
+                client_socket, ErrorResponse(status=error_response, message=str(e))
+            )
+
+        finally:
+            client_socket.close()
+
+    def start(self):
+        """Start the registry."""
+        logger.debug(f"Starting registry on {self.host}:{self.port}")
+        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server_socket.bind((self.host, self.port))
+        self.server_socket.listen(5)
+        self.running = True
+
+        logger.info(f"Registry listening on {self.host}:{self.port}")
+
+        if self.beacon_address:
+            self.beacons = BeaconListener(
+                self.beacon_address,
+                on_generation_change=self._relist,
+                server_port=get_server_port(),
+                on_server_up=self._relist,
+            )
+            self.beacons.start()
+
+        self._stopped.clear()
+        threading.Thread(target=self._poll, name="registry-poll", daemon=True).start()
+
+        while self.running:
+            try:
+                client_socket, address = self.server_socket.accept()
+                logger.debug(f"Client connected from {address}")
+                client_thread = threading.Thread(
+                    target=self.handle_client, args=(client_socket, address)
+                )
+                client_thread.start()
+            except OSError:
+                logger.debug("Registry socket closed")
+                break
+
+    def stop(self):
+        """Stop the registry."""
+        logger.info("Stopping registry")
+        self.running = False
+        self._stopped.set()
+        if self.beacons:
+            self.beacons.stop()
+        if self.server_socket:
+            self.server_socket.close()
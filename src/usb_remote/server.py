@@ -2,8 +2,12 @@ import logging
 import os
 import socket
 import threading
-from typing import Literal
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Literal, get_args
 
+import pyudev
 from pydantic import TypeAdapter, ValidationError
 
 from .api import (
@@ -12,25 +16,85 @@ from .api import (
     ErrorResponse,
     ListRequest,
     ListResponse,
+    busy_response,
     error_response,
     multiple_matches_response,
     not_found_response,
 )
+from .beacon import BeaconSender
 from .config import Defaults, Environment
 from .usbdevice import (
+    DeviceBusyError,
     DeviceNotFoundError,
     MultipleDevicesError,
     UsbDevice,
     get_device,
     get_devices,
 )
-from .utility import run_command
+from .utility import clear_command_cache, run_command
 
 logger = logging.getLogger(__name__)
 
+# Seconds a client's lease of a device lasts unless it is renewed
+LEASE_TIME = 600.0
+# usbip-host reports the state of each device it has bound in sysfs
+USB_SYSFS = Path("/sys/bus/usb/devices")
+# usbip-host lists the devices it has bound in its driver directory
+USBIP_HOST_DRIVER = Path("/sys/bus/usb/drivers/usbip-host")
+# usbip-host status of a bound device that no client has attached
+SDEV_ST_AVAILABLE = 1
+# usbip-host status of a bound device that a client has attached
+SDEV_ST_USED = 2
+# usbip-host status of a bound device whose connection to a client failed
+SDEV_ST_ERROR = 3
+# Seconds between checks of the devices bound to usbip-host
+SWEEP_INTERVAL = 10.0
+
+# What becomes of a bound device that no client is using:
+#   bound: kept bound to usbip-host, so the next attach need not bind it
+#   released: unbound, giving it back to its driver on this server
+IdleState = Literal["bound", "released"]
+
+
+@dataclass
+class Lease:
+    """A client's claim on a device it has attached."""
+
+    holder: str  # the address of the client
+    expires: float  # the time.monotonic() after which other clients may take it
+
+
+def read_usbip_status(bus_id: str) -> int | None:
+    """Read the usbip-host status of a device.
+
+    Args:
+        bus_id: The bus ID of the device
+
+    Returns:
+        The status, or None if the device is not bound to usbip-host.
+    """
+    try:
+        return int((USB_SYSFS / bus_id / "usbip_status").read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def bound_devices() -> list[str]:
+    """List the bus IDs of the devices bound to usbip-host."""
+    # the driver directory also holds bind, unbind, module and the like
+    return sorted(path.name for path in USBIP_HOST_DRIVER.glob("[0-9]*-*"))
+
 
 class CommandServer:
-    def __init__(self, host: str = "0.0.0.0", port: int | None = None):
+    def __init__(
+        self,
+        host: str = "0.0.0.0",
+        port: int | None = None,
+        beacon_address: str | None = None,
+        lease_time: float = LEASE_TIME,
+        idle_state: str | None = None,
+        idle_timeout: float | None = None,
+    ):
         self.host = host
         # Allow server port to be overridden via environment variable
         if port is None:
@@ -38,14 +102,86 @@ class CommandServer:
                 os.environ.get(Environment.USB_REMOTE_SERVER_PORT, Defaults.SERVER_PORT)
             )
         self.port = port
+        # Optional broadcast/multicast address to announce this server on
+        if beacon_address is None:
+            beacon_address = os.environ.get(Environment.USB_REMOTE_BEACON_ADDRESS)
+        self.beacon = (
+            BeaconSender(beacon_address, self.port, lambda: self.generation)
+            if beacon_address
+            else None
+        )
         self.server_socket = None
         self.running = False
+        # Incremented whenever the device inventory or its bindings change
+        self.generation = 0
+        self._generation_lock = threading.Lock()
+        self._last_inventory: list[str] | None = None
+        self._usb_observer: pyudev.MonitorObserver | None = None
+        # bus ID -> lease of each device attached by a client
+        self.lease_time = lease_time
+        self._leases: dict[str, Lease] = {}
+        self._leases_lock = threading.Lock()
+        # bus ID -> lock held while the device is bound or unbound
+        self._device_locks: dict[str, threading.Lock] = {}
+        # What to do with bound devices no client is using, and after how long
+        if idle_state is None:
+            idle_state = os.environ.get(
+                Environment.USB_REMOTE_IDLE_STATE, Defaults.IDLE_STATE
+            )
+        if idle_state not in get_args(IdleState):
+            raise ValueError(
+                f"Idle state must be one of {get_args(IdleState)}, not {idle_state}"
+            )
+        self.idle_state = idle_state
+        if idle_timeout is None:
+            idle_timeout = float(
+                os.environ.get(
+                    Environment.USB_REMOTE_IDLE_TIMEOUT, Defaults.IDLE_TIMEOUT
+                )
+            )
+        self.idle_timeout = idle_timeout
+        # bus ID -> time.monotonic() since when a bound device has been unused
+        self._idle_since: dict[str, float] = {}
+        self._stopped = threading.Event()
+
+    def _bump_generation(self) -> None:
+        """Record a change to the device inventory."""
+        with self._generation_lock:
+            self.generation += 1
+
+    def _handle_usb_event(self, device: pyudev.Device) -> None:
+        """Record a USB device being plugged into or removed from this server."""
+        if device.action in ("add", "remove"):
+            logger.debug(f"USB device {device.sys_name}: {device.action}")
+            # the listing of the devices is out of date
+            clear_command_cache()
+            self._bump_generation()
+
+    def _watch_devices(self) -> None:
+        """Follow USB hot-plug events so that the beacon generation changes."""
+        try:
+            monitor = pyudev.Monitor.from_netlink(pyudev.Context())
+            monitor.filter_by(subsystem="usb", device_type="usb_device")
+            self._usb_observer = pyudev.MonitorObserver(
+                monitor, callback=self._handle_usb_event, name="usb-watch"
+            )
+            self._usb_observer.start()
+        except Exception as e:
+            logger.warning(
+                f"Cannot monitor udev, the beacon generation will only change "
+                f"when devices are listed, bound or unbound: {e}"
+            )
 
     def handle_list(self) -> list[UsbDevice]:
         """Handle the 'list' command."""
         logger.debug("Retrieving list of USB devices")
         result = get_devices()
         logger.debug(f"Found {len(result)} USB devices")
+        inventory = [device.bus_id for device in result]
+        if inventory != self._last_inventory:
+            if self._last_inventory is not None:
+                self._bump_generation()
+            self._last_inventory = inventory
         return result
 
     def attach(self, device: UsbDevice):
@@ -60,26 +196,150 @@ class CommandServer:
         run_command(["sudo", "usbip", "unbind", "-b", device.bus_id], check=check)
         logger.info(f"Device unbound: {device.bus_id} ({device.description})")
 
+    def _claim(self, device: UsbDevice, client: str) -> None:
+        """Lease a device to client, or renew the lease it holds.
+
+        Raises:
+            DeviceBusyError: If another client holds an unexpired lease
+        """
+        now = time.monotonic()
+        with self._leases_lock:
+            lease = self._leases.get(device.bus_id)
+            if lease and lease.holder != client and lease.expires > now:
+                raise DeviceBusyError(
+                    f"Device {device.bus_id} ({device.description}) is in use by "
+                    f"{lease.holder} for up to {lease.expires - now:.0f}s"
+                )
+            self._leases[device.bus_id] = Lease(client, now + self.lease_time)
+
+    def _release(self, device: UsbDevice) -> None:
+        """Drop the lease of a device."""
+        with self._leases_lock:
+            self._leases.pop(device.bus_id, None)
+
+    def _device_lock(self, bus_id: str) -> threading.Lock:
+        """Get the lock held while a device is bound or unbound."""
+        with self._leases_lock:
+            return self._device_locks.setdefault(bus_id, threading.Lock())
+
+    def _leased(self, bus_id: str, now: float) -> bool:
+        """True if a client holds an unexpired lease of a device."""
+        with self._leases_lock:
+            lease = self._leases.get(bus_id)
+            return lease is not None and lease.expires > now
+
+    def sweep(self) -> None:
+        """Move the bound devices that no client is using to the idle state.
+
+        A device whose connection to a client failed is rebound, or unbound if
+        the idle state is released. An unused device with no live lease is
+        unbound once it has been idle for idle_timeout if the idle state is
+        released, and is otherwise left bound and ready to attach.
+        """
+        now = time.monotonic()
+        bound = bound_devices()
+        for bus_id in self._idle_since.keys() - set(bound):
+            del self._idle_since[bus_id]
+
+        for bus_id in bound:
+            status = read_usbip_status(bus_id)
+            if status == SDEV_ST_USED or status is None:
+                self._idle_since.pop(bus_id, None)
+                continue
+            idle_since = self._idle_since.setdefault(bus_id, now)
+            if status == SDEV_ST_ERROR:
+                logger.info(f"Resetting device {bus_id} after a client failed")
+            elif (
+                self.idle_state == "released"
+                and now - idle_since >= self.idle_timeout
+                and not self._leased(bus_id, now)
+            ):
+                logger.info(
+                    f"Releasing device {bus_id}, idle for {now - idle_since:.0f}s"
+                )
+            else:
+                continue
+
+            lock = self._device_lock(bus_id)
+            # a request is binding or unbinding it, look again next time
+            if not lock.acquire(blocking=False):
+                continue
+            try:
+                run_command(["sudo", "usbip", "unbind", "-b", bus_id], check=False)
+                if self.idle_state == "bound":
+                    run_command(["sudo", "usbip", "bind", "-b", bus_id], check=False)
+            finally:
+                lock.release()
+            self._idle_since.pop(bus_id, None)
+            self._bump_generation()
+
+    def _sweep_periodically(self) -> None:
+        """Sweep the bound devices until the server stops."""
+        while not self._stopped.wait(SWEEP_INTERVAL):
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"Failed to sweep idle devices: {e}")
+
     def handle_device(
         self,
         args: DeviceRequest,
+        client: str = "unknown",
     ) -> UsbDevice:
-        """Handle the a device command with optional search criteria."""
+        """Handle the a device command with optional search criteria.
+
+        Attaching a device leases it to the client until it detaches it or the
+        lease expires. Other clients cannot attach or detach it meanwhile.
+        Detaching a device unbinds it unless the idle state is bound.
+
+        Args:
+            args: The device command and search criteria
+            client: The address of the client making the request
+
+        Raises:
+            DeviceBusyError: If another client holds the device's lease
+        """
         criteria = args.model_dump(exclude={"command"})
         logger.debug(f"Looking for device with criteria: {criteria}")
         device = get_device(**criteria)
 
         match args.command:
             case "attach":
-                self.detach(device, check=False)
-                self.attach(device)
+                self._claim(device, client)
+                try:
+                    with self._device_lock(device.bus_id):
+                        self._bind(device)
+                except Exception:
+                    self._release(device)
+                    raise
             case "detach":
-                self.detach(device)
+                self._claim(device, client)
+                if self.idle_state == "released":
+                    with self._device_lock(device.bus_id):
+                        self.detach(device)
+                    self._bump_generation()
+                self._release(device)
+            case "renew":
+                self._claim(device, client)
+                logger.debug(f"Lease of {device.bus_id} renewed by {client}")
             case "find":
                 logger.info(f"Found device: {device.bus_id} ({device.description})")
 
         return device
 
+    def _bind(self, device: UsbDevice) -> None:
+        """Bind a device to usbip-host unless it is bound and unused."""
+        status = read_usbip_status(device.bus_id)
+        if status == SDEV_ST_AVAILABLE:
+            logger.info(f"Device already bound: {device.bus_id}")
+            return
+        # a bound device in use is still attached by a client whose lease has
+        # lapsed, rebinding disconnects it
+        if status is not None:
+            self.detach(device, check=False)
+        self.attach(device)
+        self._bump_generation()
+
     def _send_response(
         self,
         client_socket: socket.socket,
@@ -91,7 +351,7 @@ class CommandServer:
     def _send_error_response(
         self,
         client_socket: socket.socket,
-        status: Literal["error", "not_found", "multiple_matches"],
+        status: Literal["error", "not_found", "multiple_matches", "busy"],
         message: str,
     ):
         """Send an error response to the client."""
@@ -130,7 +390,7 @@ class CommandServer:
                 self._send_response(client_socket, response)
 
             elif isinstance(request, DeviceRequest):
-                result = self.handle_device(args=request)
+                result = self.handle_device(args=request, client=address[0])
                 response = DeviceResponse(status="success", data=result)
                 self._send_response(client_socket, response)
 
@@ -140,6 +400,9 @@ class CommandServer:
         except MultipleDevicesError as e:
             logger.warning(f"Multiple devices matched for client {address}: {e}")
             self._send_error_response(client_socket, multiple_matches_response, str(e))
+        except DeviceBusyError as e:
+            logger.warning(f"Device busy for client {address}: {e}")
+            self._send_error_response(client_socket, busy_response, str(e))
         except Exception as e:
             logger.error(f"Error handling client {address}: {e}")
             self._send_error_response(client_socket, error_response, str(e))
@@ -158,6 +421,15 @@ class CommandServer:
 
         logger.info(f"Server listening on {self.host}:{self.port}")
 
+        if self.beacon:
+            self._watch_devices()
+            self.beacon.start()
+
+        self._stopped.clear()
+        threading.Thread(
+            target=self._sweep_periodically, name="idle-sweeper", daemon=True
+        ).start()
+
         while self.running:
             try:
                 client_socket, address = self.server_socket.accept()
@@ -174,5 +446,10 @@ class CommandServer:
         """Stop the server."""
         logger.info("Stopping server")
         self.running = False
+        self._stopped.set()
+        if self.beacon:
+            self.beacon.stop()
+        if self._usb_observer:
+            self._usb_observer.send_stop()
         if self.server_socket:
             self.server_socket.close()
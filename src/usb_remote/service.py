@@ -47,7 +47,9 @@ RuntimeDirectory=usb-remote-client
 RuntimeDirectoryMode=0755
 ConfigurationDirectory=usb-remote-client
 ConfigurationDirectoryMode=0755
+CacheDirectory=usb-remote-client
 Environment="USB_REMOTE_CONFIG_PATH=/etc/usb-remote-client/usb-remote.config"
+Environment="USB_REMOTE_CACHE_PATH=/var/cache/usb-remote-client/servers.json"
 Environment="USB_REMOTE_CLIENT_SOCKET=/run/usb-remote-client/usb-remote-client.sock"
 
 
@@ -1,11 +1,15 @@
 import fnmatch
 import re
 import subprocess
+from typing import TYPE_CHECKING
 
-import usb.core
 from pydantic import BaseModel, Field
 
-from usb_remote.utility import run_command
+from usb_remote.utility import COMMAND_CACHE_TTL, run_command
+
+# pyusb is only needed on servers, so it is imported where it is used
+if TYPE_CHECKING:
+    import usb.core
 
 
 class DeviceNotFoundError(Exception):
@@ -16,6 +20,10 @@ class MultipleDevicesError(Exception):
     """Raised when multiple USB devices match the search criteria."""
 
 
+class DeviceBusyError(Exception):
+    """Raised when a USB device is leased to another client."""
+
+
 class UsbDevice(BaseModel):
     """Pydantic model representing a USB device."""
 
@@ -27,19 +35,55 @@ class UsbDevice(BaseModel):
     device_name: str = ""
     serial: str | None = ""
     description: str = "unknown"
+    # True if usbipd on the server is exporting the device (it is bound)
+    exported: bool = False
+    # bInterfaceClass of each interface, only known for exported devices
+    interface_classes: tuple[int, ...] = Field(default_factory=tuple)
 
     model_config = {"frozen": False}  # Allow field updates after creation
 
     def __str__(self):
         ser = f"\n  serial={self.serial}" if self.serial else ""
+        exported = " (exported)" if self.exported else ""
         return (
             f"- {self.description}{ser}\n"
-            f"  id={self.vendor_id}:{self.product_id} bus={self.bus_id:13}"
+            f"  id={self.vendor_id}:{self.product_id} bus={self.bus_id:13}{exported}"
         )
 
+    def matches(
+        self,
+        id: str | None = None,
+        bus: str | None = None,
+        desc: str | None = None,
+        serial: str | None = None,
+    ) -> bool:
+        """
+        Check the device against search criteria, each a glob pattern.
+
+        Args:
+            id: The device ID in the format "vendor:product" (e.g., "0bda:5400")
+            bus: The bus ID string (e.g., "1-2.3.4")
+            desc: A substring of or pattern for the device description
+            serial: The serial number, ignored for devices that have none
+        """
+        if id:
+            device_id = f"{self.vendor_id}:{self.product_id}"
+            if not fnmatch.fnmatch(device_id.lower(), id.lower()):
+                return False
+        if bus and not fnmatch.fnmatch(self.bus_id.lower(), bus.lower()):
+            return False
+        # for desc, match a substring or glob pattern
+        if desc and (
+            not fnmatch.fnmatch(self.description, desc) and desc not in self.description
+        ):
+            return False
+        if serial and self.serial and not fnmatch.fnmatch(self.serial, serial):
+            return False
+        return True
+
     @staticmethod
     def filter_on_port_numbers(
-        device: usb.core.Device, port_numbers: tuple[int, ...]
+        device: "usb.core.Device", port_numbers: tuple[int, ...]
     ) -> bool:
         """
         Custom filter function to match USB devices based on port numbers.
@@ -66,6 +110,8 @@ class UsbDevice(BaseModel):
         Returns:
             A fully populated UsbDevice instance
         """
+        import usb.core
+
         # Split bus_id into bus and port numbers
         bus_str, port_str = bus_id.split("-")
         bus = int(bus_str)
@@ -95,7 +141,8 @@ class UsbDevice(BaseModel):
         description = "unknown"
         try:
             lsusb_result = run_command(
-                ["lsusb", "-s", f"{device.bus:03d}:{device.address:03d}"]
+                ["lsusb", "-s", f"{device.bus:03d}:{device.address:03d}"],
+                cache_ttl=COMMAND_CACHE_TTL,
             )
             lsusb_output = lsusb_result.stdout.strip()
             desc_match = re.search(rf".*{vendor_id}:{product_id} (.+)$", lsusb_output)
@@ -135,25 +182,11 @@ def get_device(
     Returns:
         A UsbDevice instance matching the criteria.
     """
-    devices = get_devices()
-    filtered_devices = []
-
-    for device in devices:
-        if id:
-            device_id = f"{device.vendor_id}:{device.product_id}"
-            if not fnmatch.fnmatch(device_id.lower(), id.lower()):
-                continue
-        if bus and not fnmatch.fnmatch(device.bus_id.lower(), bus.lower()):
-            continue
-        # for desc, match a substring or glob pattern
-        if desc and (
-            not fnmatch.fnmatch(device.description, desc)
-            and desc not in device.description
-        ):
-            continue
-        if serial and device.serial and not fnmatch.fnmatch(device.serial, serial):
-            continue
-        filtered_devices.append(device)
+    filtered_devices = [
+        device
+        for device in get_devices()
+        if device.matches(id=id, bus=bus, desc=desc, serial=serial)
+    ]
 
     if not filtered_devices:
         raise DeviceNotFoundError("No matching USB device found.")
@@ -182,7 +215,7 @@ def get_devices() -> list[UsbDevice]:
         list: A list of connected USB devices.
     """
     # Call the system CLI usbip list -lp to get a list of shareable USB devices
-    result = run_command(["usbip", "list", "-pl"])
+    result = run_command(["usbip", "list", "-pl"], cache_ttl=COMMAND_CACHE_TTL)
     pattern = r"busid=([^#]+)#usbid=([0-9a-f]+):([0-9a-f]+)#"
 
     # Parse the output and extract detailed information for each device
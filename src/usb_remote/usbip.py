@@ -0,0 +1,207 @@
+"""
+Native implementation of the client side of the usbip network protocol.
+
+This talks directly to the usbipd daemon on a server, as the usbip command line
+tool does, see https://docs.kernel.org/usb/usbip_protocol.html
+"""
+
+import logging
+import socket
+import struct
+from dataclasses import dataclass, field
+
+from .usbdevice import UsbDevice
+
+logger = logging.getLogger(__name__)
+
+USBIP_PORT = 3240
+USBIP_VERSION = 0x0111
+
+OP_REQ_DEVLIST = 0x8005
+OP_REP_DEVLIST = 0x0005
+OP_REQ_IMPORT = 0x8003
+OP_REP_IMPORT = 0x0003
+
+# enum usb_device_speed values from the kernel
+USB_SPEED_SUPER = 5
+
+# version, command code, status
+OP_COMMON = struct.Struct(">HHI")
+# path, busid, busnum, devnum, speed, idVendor, idProduct, bcdDevice,
+# bDeviceClass, bDeviceSubClass, bDeviceProtocol, bConfigurationValue,
+# bNumConfigurations, bNumInterfaces
+USB_DEVICE = struct.Struct(">256s32sIIIHHHBBBBBB")
+# bInterfaceClass, bInterfaceSubClass, bInterfaceProtocol, padding
+USB_INTERFACE = struct.Struct(">BBBx")
+
+
+class UsbipError(RuntimeError):
+    """Raised when a usbipd server refuses a request or breaks the protocol."""
+
+
+@dataclass
+class UsbipDevice:
+    """A USB device exported by a usbipd server."""
+
+    path: str  # the sysfs path of the device on the server
+    busid: str
+    busnum: int
+    devnum: int
+    speed: int
+    vendor_id: int
+    product_id: int
+    bcd_device: int
+    device_class: int
+    device_subclass: int
+    device_protocol: int
+    configuration_value: int
+    num_configurations: int
+    num_interfaces: int
+    # (class, subclass, protocol) of each interface, only sent by OP_REP_DEVLIST
+    interfaces: list[tuple[int, int, int]] = field(default_factory=list)
+
+    @property
+    def devid(self) -> int:
+        """The device id the kernel uses to identify the remote device."""
+        return (self.busnum << 16) | self.devnum
+
+    def pack(self) -> bytes:
+        """Encode as a usbip usb_device structure."""
+        return USB_DEVICE.pack(
+            self.path.encode(),
+            self.busid.encode(),
+            self.busnum,
+            self.devnum,
+            self.speed,
+            self.vendor_id,
+            self.product_id,
+            self.bcd_device,
+            self.device_class,
+            self.device_subclass,
+            self.device_protocol,
+            self.configuration_value,
+            self.num_configurations,
+            self.num_interfaces,
+        )
+
+    def to_usb_device(self) -> UsbDevice:
+        """Convert to a UsbDevice marked as exported by usbipd."""
+        _, _, ports = self.busid.partition("-")
+        return UsbDevice(
+            bus_id=self.busid,
+            vendor_id=f"{self.vendor_id:04x}",
+            product_id=f"{self.product_id:04x}",
+            bus=self.busnum,
+            port_numbers=tuple(int(p) for p in ports.split(".") if p.isdigit()),
+            device_name=f"/dev/bus/usb/{self.busnum:03d}/{self.devnum:03d}",
+            serial=None,
+            exported=True,
+            interface_classes=tuple(c for c, _, _ in self.interfaces),
+        )
+
+    @classmethod
+    def unpack(cls, data: bytes) -> "UsbipDevice":
+        """Decode a usbip usb_device structure."""
+        path, busid, *fields = USB_DEVICE.unpack(data)
+        return cls(
+            path.rstrip(b"\0").decode(errors="replace"),
+            busid.rstrip(b"\0").decode(errors="replace"),
+            *fields,
+        )
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    """Receive exactly size bytes from sock."""
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise UsbipError("Connection closed by usbipd")
+        data.extend(chunk)
+    return bytes(data)
+
+
+def _recv_reply(sock: socket.socket, code: int) -> None:
+    """Receive an op_common reply header and check it is a successful reply."""
+    version, reply_code, status = OP_COMMON.unpack(_recv_exact(sock, OP_COMMON.size))
+    if version != USBIP_VERSION:
+        raise UsbipError(f"Unsupported usbip version {version:#06x}")
+    if reply_code != code:
+        raise UsbipError(f"Unexpected usbip reply {reply_code:#06x}")
+    if status != 0:
+        raise UsbipError(f"usbipd request failed with status {status}")
+
+
+def list_exported(
+    host: str, port: int = USBIP_PORT, timeout: float | None = None
+) -> list[UsbipDevice]:
+    """
+    List the devices a usbipd server exports (OP_REQ_DEVLIST).
+
+    These are the devices bound to usbip on the server, whether or not a
+    client has attached them.
+
+    Args:
+        host: The server hostname or IP address
+        port: The usbipd port
+        timeout: Connection timeout in seconds, None to block
+
+    Returns:
+        The exported devices, with their interface classes.
+
+    Raises:
+        UsbipError: If the server refuses the request
+        OSError: If the server cannot be reached
+    """
+    with socket.create_connection((host, port), timeout=timeout) as sock:
+        sock.sendall(OP_COMMON.pack(USBIP_VERSION, OP_REQ_DEVLIST, 0))
+        _recv_reply(sock, OP_REP_DEVLIST)
+        (count,) = struct.unpack(">I", _recv_exact(sock, 4))
+        devices = []
+        for _ in range(count):
+            device = UsbipDevice.unpack(_recv_exact(sock, USB_DEVICE.size))
+            for _ in range(device.num_interfaces):
+                interface = USB_INTERFACE.unpack(_recv_exact(sock, USB_INTERFACE.size))
+                device.interfaces.append(interface)
+            devices.append(device)
+    logger.debug(f"usbipd on {host}:{port} exports {len(devices)} devices")
+    return devices
+
+
+def import_device(
+    host: str, busid: str, port: int = USBIP_PORT, timeout: float | None = None
+) -> tuple[socket.socket, UsbipDevice]:
+    """
+    Ask a usbipd server to export a device to this host (OP_REQ_IMPORT).
+
+    Args:
+        host: The server hostname or IP address
+        busid: The bus ID of the device on the server
+        port: The usbipd port
+        timeout: Connection timeout in seconds, None to block
+
+    Returns:
+        The connected socket, which carries the device's URBs once handed to
+        the kernel, and the imported device.
+
+    Raises:
+        UsbipError: If the server refuses to export the device
+        OSError: If the server cannot be reached
+    """
+    sock = socket.create_connection((host, port), timeout=timeout)
+    try:
+        sock.sendall(
+            OP_COMMON.pack(USBIP_VERSION, OP_REQ_IMPORT, 0)
+            + struct.pack(">32s", busid.encode())
+        )
+        _recv_reply(sock, OP_REP_IMPORT)
+        device = UsbipDevice.unpack(_recv_exact(sock, USB_DEVICE.size))
+        if device.busid != busid:
+            raise UsbipError(f"usbipd exported {device.busid} instead of {busid}")
+    except BaseException:
+        sock.close()
+        raise
+    # the kernel expects a blocking socket
+    sock.settimeout(None)
+    logger.debug(f"Imported {busid} from {host}:{port}")
+    return sock, device
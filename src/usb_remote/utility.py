@@ -1,113 +1,466 @@
 """Utility functions for subprocess operations."""
 
+import errno
 import ipaddress
+import itertools
 import logging
 import re
+import selectors
 import socket
 import subprocess
+import threading
+import time
+from collections import deque
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import cast
 
-from usb_remote.config import get_server_port, get_server_ranges, get_servers
+from usb_remote.config import (
+    get_discovery_ttl,
+    get_server_port,
+    get_server_ranges,
+    get_servers,
+    get_timeout,
+)
+from usb_remote.discovery import DiscoveryCache, get_cache_path
 
 logger = logging.getLogger(__name__)
 
-# Regex pattern to parse IP range specifications https://regex101.com/r/ChTMLn/1
+# Regex pattern to parse IP range shorthand https://regex101.com/r/ChTMLn/1
 re_ip_range = re.compile(
     r"^(?P<prefix>(?:\d{1,3}\.){3})(?P<start>\d{1,3})-(?P<stop>\d{1,3})$"
 )
 
-# Server port constant (also defined in api.py to avoid circular import)
+# Time allowed for each server probe to connect during a range scan
+SCAN_TIMEOUT = 0.25
+# Maximum number of server probes in flight at once during a range scan
+SCAN_CONCURRENCY = 256
+# Maximum rate at which new server probes are started (probes per second)
+SCAN_RATE = 2000.0
+# Number of probes that may be started at once before SCAN_RATE applies
+SCAN_BURST = 32
+# Largest number of addresses a single server_ranges entry may expand to (a /20)
+MAX_RANGE_ADDRESSES = 4096
+
+# Seconds a command may run before it is killed
+COMMAND_TIMEOUT = 60.0
+# Maximum number of commands running at once, so that a burst of requests
+# does not start a process for each
+COMMAND_CONCURRENCY = 8
+# Seconds the output of a read-only command such as 'usbip list -pl' is reused
+COMMAND_CACHE_TTL = 1.0
+
+IPAddress = ipaddress.IPv4Address | ipaddress.IPv6Address
+
+# Serializes scans that refresh the discovery cache
+_refresh_lock = threading.Lock()
+
+# Limits the commands running at once
+_command_slots = threading.BoundedSemaphore(COMMAND_CONCURRENCY)
+# command -> (time it expires, result) of read-only commands, the lock of each
+# command, and the timing of each command name, all guarded by _commands_lock
+_command_cache: dict[tuple[str, ...], tuple[float, subprocess.CompletedProcess]] = {}
+_command_locks: dict[tuple[str, ...], threading.Lock] = {}
+_command_stats: dict[str, "CommandStats"] = {}
+_commands_lock = threading.Lock()
+
+
+@dataclass
+class CommandStats:
+    """How often a command has run and how long it took."""
 
+    runs: int = 0  # the number of times it ran
+    cached: int = 0  # the number of times a recent result was reused instead
+    seconds: float = 0.0  # the total time it took
+    max_seconds: float = 0.0  # the longest time it took
 
-def get_host_list(host: str | None) -> list[str]:
-    """Get list of server hosts from argument or config."""
+
+def get_host_list(host: str | None, rescan: bool = False) -> list[str]:
+    """
+    Get list of server hosts from argument or config.
+
+    Args:
+        host: A single server to use instead of the configured servers
+        rescan: Scan server_ranges now instead of using the discovery cache
+    """
+    servers, _ = probe_host_list(host, rescan)
+    return servers
+
+
+def probe_host_list(
+    host: str | None, rescan: bool = False, request: bytes | None = None
+) -> tuple[list[str], dict[str, bytes]]:
+    """
+    Get list of server hosts, sending a request to any servers found by scanning.
+
+    When server_ranges must be scanned, the request is sent on each probing
+    connection so that its response is available without connecting again.
+
+    Args:
+        host: A single server to use instead of the configured servers
+        rescan: Scan server_ranges now instead of using the discovery cache
+        request: Serialized request to send to servers found by a scan
+
+    Returns:
+        The server hosts, and the raw responses to request from those servers
+        that were contacted during a scan
+    """
+    responses: dict[str, bytes] = {}
     if host:
         servers = [host]
     else:
         servers = get_servers()
-        # Scan server-ranges and add responsive servers
+        # Add responsive servers from server-ranges
         ranges = get_server_ranges()
-        for range_spec in ranges:
-            servers.extend(_scan_ip_range(range_spec))
+        if ranges:
+            found, responses = _get_range_servers(
+                ranges, get_server_port(), rescan, request
+            )
+            servers.extend(found)
     if not servers:
         logger.warning("No servers configured, defaulting to localhost")
         servers = ["localhost"]
-    return servers
+    return servers, responses
 
 
-def _scan_ip_range(range_spec: str) -> list[str]:
+def _get_range_servers(
+    ranges: list[str], port: int, rescan: bool, request: bytes | None = None
+) -> tuple[list[str], dict[str, bytes]]:
     """
-    Scan an IP range and return addresses that are listening on SERVER_PORT.
+    Get the servers in server_ranges, preferring the discovery cache.
 
-    Args:
-        range_spec: IP range specification like '192.168.1.30-40'
-                    Only supports scanning the last octet as this keeps scans short.
+    A fresh cache is used as is. A stale cache is still used, but a scan is
+    started in the background to refresh it for the next caller. A missing
+    cache, or one built from different ranges, is refreshed before returning.
 
     Returns:
-        List of IP addresses that are responsive on SERVER_PORT
+        The servers, and their responses to request if a scan was done
     """
-    responsive_servers = []
+    ttl = get_discovery_ttl()
+    cache_path = get_cache_path()
+    cache = DiscoveryCache.from_file(cache_path)
 
-    try:
-        # Parse the range specification with regex
-        # Supports: '192.168.1.30-40' only, to keep scans short - only over last octet
-        match = re_ip_range.match(range_spec.strip())
-        if not match:
-            logger.error(f"Invalid range format: {range_spec}")
-            return responsive_servers
+    if rescan or ttl == 0 or not cache.matches(ranges, port):
+        return _refresh_discovery_cache(cache_path, ranges, port, request)
 
+    if not cache.is_fresh(ttl) and not _refresh_lock.locked():
+        logger.debug("Discovery cache is stale, refreshing in the background")
+        # a daemon thread so that a short-lived CLI never waits for the scan at
+        # exit, if it exits first the refresh is lost and the next command
+        # starts another
+        threading.Thread(
+            target=_refresh_discovery_cache,
+            args=(cache_path, ranges, port),
+            name="discovery-refresh",
+            daemon=True,
+        ).start()
+
+    logger.debug(f"Using {len(cache.servers)} cached servers from {cache_path}")
+    return list(cache.servers), {}
+
+
+def _refresh_discovery_cache(
+    cache_path: Path, ranges: list[str], port: int, request: bytes | None = None
+) -> tuple[list[str], dict[str, bytes]]:
+    """Scan server_ranges and merge the responsive servers into the cache."""
+    with _refresh_lock:
+        found = _scan_ip_ranges(ranges, port, request)
+        cache = DiscoveryCache.from_file(cache_path)
+        cache.update(ranges, port, list(found))
+        cache.to_file(cache_path)
+    return list(cache.servers), {server: data for server, data in found.items() if data}
+
+
+def _parse_ip_range(range_spec: str) -> tuple[IPAddress, IPAddress]:
+    """
+    Parse a server_ranges entry into its first and last address.
+
+    Args:
+        range_spec: One of:
+            - last octet shorthand: '192.168.1.30-40'
+            - full address range: '10.20.0.10-10.20.3.200'
+            - CIDR block: '10.20.0.0/22' (network and broadcast are excluded)
+
+    Returns:
+        Tuple of the first and last address in the range (inclusive)
+
+    Raises:
+        ValueError: If the specification is invalid or too large to scan
+    """
+    spec = range_spec.strip()
+
+    if "/" in spec:
+        network = ipaddress.ip_network(spec, strict=False)
+        start_ip, end_ip = network.network_address, network.broadcast_address
+        if network.num_addresses > 2:
+            start_ip, end_ip = start_ip + 1, end_ip - 1
+    elif match := re_ip_range.match(spec):
         d = match.groupdict()
+        start_ip = ipaddress.ip_address(d["prefix"] + d["start"])
+        end_ip = ipaddress.ip_address(d["prefix"] + d["stop"])
+    elif spec.count("-") == 1:
+        start_str, end_str = spec.split("-")
+        start_ip = ipaddress.ip_address(start_str.strip())
+        end_ip = ipaddress.ip_address(end_str.strip())
+    else:
+        raise ValueError("expected a.b.c.X-Y, a.b.c.d-e.f.g.h or a.b.c.d/n")
 
-        start_ip_str, end_ip_str = d["prefix"] + d["start"], d["prefix"] + d["stop"]
-        start_ip = ipaddress.ip_address(start_ip_str)
-        end_ip = ipaddress.ip_address(end_ip_str)
+    # Ensure both IPs are the same version
+    if start_ip.version != end_ip.version:
+        raise ValueError("IP version mismatch in range")
+    if int(end_ip) < int(start_ip):
+        raise ValueError("range end is before range start")
+    if int(end_ip) - int(start_ip) + 1 > MAX_RANGE_ADDRESSES:
+        raise ValueError(f"range is larger than {MAX_RANGE_ADDRESSES} addresses")
 
-        logger.debug(f"Scanning IP range: {start_ip} - {end_ip}")
+    return start_ip, end_ip
 
-        # Ensure both IPs are the same version
-        if start_ip.version != end_ip.version:
-            logger.error(f"IP version mismatch in range: {range_spec}")
-            return responsive_servers
-
-        # Scan each IP in the range
-        for current_int in range(int(start_ip), int(end_ip) + 1):
-            current_ip = ipaddress.ip_address(current_int)
-            ip_str = str(current_ip)
-            port = get_server_port()
-            if _is_port_open(ip_str, port):
-                logger.info(f"Found server at {ip_str}:{port}")
-                responsive_servers.append(ip_str)
-            else:
-                logger.debug(f"No response from {ip_str}:{port}")
-            current_int += 1
 
-    except ValueError as e:
-        logger.error(f"Invalid IP range specification '{range_spec}': {e}")
+def _expand_ip_range(start_ip: IPAddress, end_ip: IPAddress) -> Iterator[str]:
+    """Lazily yield every address from start_ip to end_ip inclusive."""
+    for current_int in range(int(start_ip), int(end_ip) + 1):
+        yield str(ipaddress.ip_address(current_int))
+
+
+def _scan_ip_ranges(
+    range_specs: list[str], port: int, request: bytes | None = None
+) -> dict[str, bytes]:
+    """
+    Scan IP ranges and return addresses that are listening on the server port.
+
+    All ranges are scanned together in a single pass. Invalid entries are
+    logged and skipped.
+
+    Args:
+        range_specs: IP range specifications, see _parse_ip_range for formats
+        port: Port to probe
+        request: Optional request to send to each responsive address
+
+    Returns:
+        Responsive IP addresses in the order given by range_specs and then by
+        address, mapped to their response to request (b"" if none was received)
+    """
+    ranges = []
+    for range_spec in range_specs:
+        try:
+            start_ip, end_ip = _parse_ip_range(range_spec)
+        except ValueError as e:
+            logger.error(f"Invalid IP range specification '{range_spec}': {e}")
+            continue
+        logger.debug(f"Scanning IP range: {start_ip} - {end_ip}")
+        ranges.append(_expand_ip_range(start_ip, end_ip))
+
+    try:
+        return _scan_hosts(
+            itertools.chain(*ranges),
+            port,
+            request=request,
+            response_timeout=get_timeout() if request else 0.0,
+        )
     except Exception as e:
-        logger.error(f"Error scanning IP range '{range_spec}': {e}")
+        logger.error(f"Error scanning IP ranges {range_specs}: {e}")
+        return {}
 
-    return responsive_servers
 
+class _Probe:
+    """State of one connection made by _scan_hosts."""
 
-def _is_port_open(host: str, port: int, timeout: float = 0.02) -> bool:
+    CONNECTING = "connecting"
+    RESPONDING = "responding"
+    DONE = "done"
+
+    def __init__(self, index: int, host: str, sock: socket.socket, deadline: float):
+        self.index = index
+        self.host = host
+        self.sock = sock
+        self.deadline = deadline
+        self.phase = self.CONNECTING
+        self.response = bytearray()
+
+
+def _scan_hosts(
+    hosts: Iterable[str],
+    port: int,
+    timeout: float = SCAN_TIMEOUT,
+    max_concurrency: int = SCAN_CONCURRENCY,
+    rate: float = SCAN_RATE,
+    request: bytes | None = None,
+    response_timeout: float = 0.0,
+) -> dict[str, bytes]:
     """
-    Check if a port is open on a given host.
+    Probe many hosts for an open TCP port in parallel.
+
+    Uses non-blocking connects multiplexed on a single selector, keeping at most
+    max_concurrency probes in flight and starting no more than `rate` probes per
+    second (after an initial burst of SCAN_BURST). Each probe is given `timeout`
+    seconds to connect.
+
+    If a request is given it is sent as soon as each connection is made, and
+    the reply is read until the server closes the connection, for up to
+    response_timeout seconds.
 
     Args:
-        host: IP address or hostname
+        hosts: IP addresses to probe, in the order results should be returned.
+            Consumed lazily, so may be a generator over a large range.
         port: Port number to check
-        timeout: Connection timeout in seconds
+        timeout: Time in seconds to wait for each connection to complete
+        max_concurrency: Maximum number of connections in flight
+        rate: Maximum number of connection attempts started per second
+        request: Optional request to send on each successful connection
+        response_timeout: Time in seconds to wait for each response to request
+
+    Returns:
+        Hosts with the port open, in the same order as `hosts`, mapped to their
+        response to request (b"" if there was no request or no full response)
+    """
+    responsive: dict[int, tuple[str, bytes]] = {}
+    pending = enumerate(hosts)
+    # Probes in each phase, oldest first. Every probe in a queue was given the
+    # same time limit, so deadlines are non-decreasing and expire from the left.
+    queues: dict[str, deque[_Probe]] = {
+        _Probe.CONNECTING: deque(),
+        _Probe.RESPONDING: deque(),
+    }
+    scan_start = time.monotonic()
+    started = 0
+
+    with selectors.DefaultSelector() as selector:
+
+        def close(probe: _Probe, response: bytes | None) -> None:
+            """Finish a probe, recording the host as a server unless None."""
+            selector.unregister(probe.sock)
+            probe.sock.close()
+            probe.phase = _Probe.DONE
+            if response is None:
+                logger.debug(f"No response from {probe.host}:{port}")
+            else:
+                logger.info(f"Found server at {probe.host}:{port}")
+                responsive[probe.index] = (probe.host, response)
+
+        exhausted = False
+        while True:
+            # Top up the in-flight window with new probes, within the rate limit
+            next_start = None
+            while not exhausted and len(selector.get_map()) < max_concurrency:
+                now = time.monotonic()
+                if started >= (now - scan_start) * rate + SCAN_BURST:
+                    next_start = scan_start + (started - SCAN_BURST + 1) / rate
+                    break
+                try:
+                    index, host = next(pending)
+                except StopIteration:
+                    exhausted = True
+                    break
+                started += 1
+                sock = _start_probe(host, port)
+                if sock is not None:
+                    probe = _Probe(index, host, sock, now + timeout)
+                    selector.register(sock, selectors.EVENT_WRITE, probe)
+                    queues[_Probe.CONNECTING].append(probe)
+
+            # Drop probes that have left each phase from the heads of the queues
+            for phase, queue in queues.items():
+                while queue and queue[0].phase != phase:
+                    queue.popleft()
+
+            heads = [queue[0].deadline for queue in queues.values() if queue]
+            if not heads:
+                if exhausted:
+                    break
+                if next_start is not None:
+                    time.sleep(max(0.0, next_start - time.monotonic()))
+                continue
+            wake = min(heads) if next_start is None else min(*heads, next_start)
+
+            for key, _ in selector.select(max(0.0, wake - time.monotonic())):
+                probe = cast(_Probe, key.data)
+                if probe.phase == _Probe.CONNECTING:
+                    error = probe.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                    if error != 0:
+                        close(probe, None)
+                    elif request is None:
+                        close(probe, b"")
+                    else:
+                        try:
+                            # the request is small enough to fit the send buffer
+                            probe.sock.send(request)
+                        except OSError as e:
+                            logger.warning(f"Failed sending to {probe.host}: {e}")
+                            close(probe, b"")
+                            continue
+                        probe.phase = _Probe.RESPONDING
+                        probe.deadline = time.monotonic() + response_timeout
+                        selector.modify(probe.sock, selectors.EVENT_READ, probe)
+                        queues[_Probe.RESPONDING].append(probe)
+                elif probe.phase == _Probe.RESPONDING:
+                    try:
+                        data = probe.sock.recv(65536)
+                    except OSError as e:
+                        logger.warning(f"Failed reading from {probe.host}: {e}")
+                        close(probe, b"")
+                        continue
+                    if data:
+                        probe.response.extend(data)
+                    else:
+                        close(probe, bytes(probe.response))
+
+            # Expire probes that have run out of time
+            now = time.monotonic()
+            for phase, queue in queues.items():
+                while queue and queue[0].deadline <= now:
+                    probe = queue.popleft()
+                    if probe.phase != phase:
+                        continue
+                    if phase == _Probe.RESPONDING:
+                        # the port is open even though the reply was too slow
+                        logger.warning(f"Timed out waiting for {probe.host}:{port}")
+                        close(probe, b"")
+                    else:
+                        close(probe, None)
+
+    return dict(responsive[index] for index in sorted(responsive))
+
+
+def _start_probe(host: str, port: int) -> socket.socket | None:
+    """
+    Begin a non-blocking TCP connection to host:port.
 
     Returns:
-        True if port is open, False otherwise
+        The connecting socket, or None if the connection failed immediately
     """
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setblocking(False)
     try:
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(timeout)
         result = sock.connect_ex((host, port))
-        sock.close()
-        return result == 0
-    except OSError:
-        return False
+    except OSError as e:
+        logger.debug(f"Failed to probe {host}:{port}: {e}")
+        result = e.errno
+    if result in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+        return sock
+    sock.close()
+    return None
+
+
+@contextmanager
+def timed(timings: dict[str, float] | None, phase: str) -> Iterator[None]:
+    """
+    Record how many seconds a block takes, by the monotonic clock.
+
+    Args:
+        timings: Phase name to seconds taken, updated with this phase. Nothing
+            is recorded if None.
+        phase: The name of the phase the block performs
+    """
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings[phase] = time.monotonic() - start
+            logger.debug(f"{phase} took {timings[phase]:.3f}s")
 
 
 def run_command(
@@ -115,35 +468,119 @@ def run_command(
     capture_output: bool = True,
     text: bool = True,
     check: bool = True,
+    timeout: float | None = COMMAND_TIMEOUT,
+    cache_ttl: float = 0,
 ) -> subprocess.CompletedProcess:
     """
     Run a command using subprocess.run with common defaults.
 
+    At most COMMAND_CONCURRENCY commands run at once, and the time each takes
+    is recorded in command_stats(). usbip commands run with sudo are sent to
+    the privileged helper instead, when one is running.
+
     Args:
         command: The command and its arguments as a list of strings
         capture_output: Whether to capture stdout and stderr
         text: Whether to return output as text (string) instead of bytes
         check: Whether to raise CalledProcessError on non-zero exit
+        timeout: Seconds the command may run before it is killed, None to wait
+            for it however long it takes
+        cache_ttl: Seconds to reuse a successful result of this read-only
+            command for, concurrent calls waiting for one run. If 0 the command
+            always runs, and the cached results are forgotten as it may change
+            what they report.
 
     Returns:
         CompletedProcess instance containing the result
 
     Raises:
-        CalledProcessError: If check=True and the command returns non-zero
+        RuntimeError: If check=True and the command returns non-zero, or if it
+            does not finish within timeout
     """
+    key = tuple(command)
+    if cache_ttl <= 0:
+        clear_command_cache()
+        return _run_command(command, capture_output, text, check, timeout)
+
+    with _commands_lock:
+        command_lock = _command_locks.setdefault(key, threading.Lock())
+    with command_lock:
+        with _commands_lock:
+            expires, result = _command_cache.get(key, (0.0, None))
+            if result is not None and expires > time.monotonic():
+                name = _command_name(command)
+                _command_stats.setdefault(name, CommandStats()).cached += 1
+                logger.debug(f"Reusing result of command: {' '.join(command)}")
+                return result
+        result = _run_command(command, capture_output, text, check, timeout)
+        if result.returncode == 0:
+            with _commands_lock:
+                _command_cache[key] = (time.monotonic() + cache_ttl, result)
+        return result
+
+
+def clear_command_cache() -> None:
+    """Forget the results of read-only commands, e.g. when devices change."""
+    with _commands_lock:
+        _command_cache.clear()
+
+
+def command_stats() -> dict[str, CommandStats]:
+    """Return the timing of each command run, by command name (e.g. 'usbip port')."""
+    with _commands_lock:
+        return {name: replace(stats) for name, stats in _command_stats.items()}
+
+
+def _command_name(command: list[str]) -> str:
+    """Name a command by its program and subcommand, without sudo or options."""
+    words = command[1:] if command[:1] == ["sudo"] else command
+    return " ".join(words[:2] if len(words) > 1 and words[1][:1] != "-" else words[:1])
+
+
+def _run_command(
+    command: list[str],
+    capture_output: bool,
+    text: bool,
+    check: bool,
+    timeout: float | None,
+) -> subprocess.CompletedProcess:
+    """Run a command once, recording how long it took."""
+    cmd_str = " ".join(command)
+    start = time.monotonic()
     try:
-        logger.debug(f"Running command: {' '.join(command)}")
-        result = subprocess.run(
-            command,
-            capture_output=capture_output,
-            text=text,
-            check=check,
-        )
+        logger.debug(f"Running command: {cmd_str}")
+        result = None
+        if command[:2] == ["sudo", "usbip"] and capture_output and text:
+            # imported here as only the usbip commands need it
+            from usb_remote.helper import run_helper
+
+            result = run_helper(command[2:])
+            if result is not None and check:
+                result.check_returncode()
+        if result is None:
+            with _command_slots:
+                result = subprocess.run(
+                    command,
+                    capture_output=capture_output,
+                    text=text,
+                    check=check,
+                    timeout=timeout,
+                )
         logger.debug(f"Command completed with exit code {result.returncode}")
         return result
     except subprocess.CalledProcessError as e:
-        cmd_str = " ".join(command)
         logger.error(f"Command '{cmd_str}' failed with exit code {e.returncode}")
         logger.error(f"Stdout: {e.stdout}")
         logger.error(f"Stderr: {e.stderr}")
         raise RuntimeError(e.stderr) from e
+    except subprocess.TimeoutExpired as e:
+        logger.error(f"Command '{cmd_str}' timed out after {timeout}s")
+        raise RuntimeError(f"Command '{cmd_str}' timed out after {timeout}s") from e
+    finally:
+        seconds = time.monotonic() - start
+        logger.debug(f"Command '{cmd_str}' took {seconds:.3f}s")
+        with _commands_lock:
+            stats = _command_stats.setdefault(_command_name(command), CommandStats())
+            stats.runs += 1
+            stats.seconds += seconds
+            stats.max_seconds = max(stats.max_seconds, seconds)
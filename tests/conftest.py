@@ -8,11 +8,76 @@ import pytest
 from usb_remote.api import DeviceResponse, ErrorResponse, ListResponse
 from usb_remote.config import UsbRemoteConfig
 from usb_remote.usbdevice import UsbDevice
+from usb_remote.utility import clear_command_cache
 
 # Load system integration test fixtures from conftest_system.py
 pytest_plugins = ["tests.conftest_system"]
 
 
+@pytest.fixture(autouse=True)
+def isolated_cache(tmp_path, monkeypatch):
+    """Keep the discovery cache out of the user's home directory."""
+    cache_path = tmp_path / "servers.json"
+    monkeypatch.setenv("USB_REMOTE_CACHE_PATH", str(cache_path))
+    return cache_path
+
+
+@pytest.fixture(autouse=True)
+def isolated_client_socket(tmp_path, monkeypatch):
+    """Stop the CLI forwarding to a client service running on this machine."""
+    socket_path = tmp_path / "usb-remote-client.sock"
+    monkeypatch.setenv("USB_REMOTE_CLIENT_SOCKET", str(socket_path))
+    return socket_path
+
+
+@pytest.fixture(autouse=True)
+def clear_commands():
+    """Stop command results cached by one test being reused by the next."""
+    clear_command_cache()
+
+
+@pytest.fixture(autouse=True)
+def isolated_helper_socket(tmp_path, monkeypatch):
+    """Stop usbip commands going to a privileged helper running on this machine."""
+    socket_path = tmp_path / "usb-remote-helper.sock"
+    monkeypatch.setenv("USB_REMOTE_HELPER_SOCKET", str(socket_path))
+    return socket_path
+
+
+@pytest.fixture(autouse=True)
+def isolated_vhci(tmp_path, monkeypatch):
+    """Hide any real vhci_hcd sysfs so that tests see the mocked usbip port."""
+    sysfs = tmp_path / "platform"
+    monkeypatch.setattr("usb_remote.port.VHCI_SYSFS", sysfs)
+    monkeypatch.setattr("usb_remote.port.VHCI_STATE_PATH", tmp_path / "vhci_hcd")
+    monkeypatch.setattr("usb_remote.port.USB_SYSFS", tmp_path / "usb")
+    return tmp_path
+
+
+@pytest.fixture
+def fake_usbipd():
+    """A fake usbipd exporting a USB 2 device 1-1.1 and a USB 3 device 2-1."""
+    from tests.fake_usbipd import FakeUsbipd, make_device
+
+    usbipd = FakeUsbipd(
+        [
+            # a CDC ACM serial device
+            make_device("1-1.1", interfaces=[(0x02, 0x02, 0x01), (0x0A, 0, 0)]),
+            # a mass storage device
+            make_device(
+                "2-1",
+                speed=5,
+                vendor_id=0x0781,
+                product_id=0x5581,
+                interfaces=[(0x08, 0x06, 0x50)],
+            ),
+        ]
+    )
+    usbipd.start()
+    yield usbipd
+    usbipd.stop()
+
+
 @pytest.fixture
 def mock_config():
     """Mock config to return just localhost as a server."""
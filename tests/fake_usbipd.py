@@ -0,0 +1,93 @@
+"""A stand-in for the usbipd daemon that speaks the usbip network protocol."""
+
+import socket
+import struct
+import threading
+
+from usb_remote.usbip import (
+    OP_COMMON,
+    OP_REP_DEVLIST,
+    OP_REP_IMPORT,
+    OP_REQ_DEVLIST,
+    OP_REQ_IMPORT,
+    USB_INTERFACE,
+    USBIP_VERSION,
+    UsbipDevice,
+)
+
+
+def make_device(busid: str, speed: int = 3, **kwargs) -> UsbipDevice:
+    """Make an exported device, with fields that are not given defaulted."""
+    busnum, _, port = busid.partition("-")
+    fields = {
+        "path": f"/sys/devices/pci0000:00/0000:00:14.0/usb{busnum}/{busid}",
+        "busid": busid,
+        "busnum": int(busnum),
+        "devnum": len(port) + 1,
+        "speed": speed,
+        "vendor_id": 0x2E8A,
+        "product_id": 0x000A,
+        "bcd_device": 0x0100,
+        "device_class": 0,
+        "device_subclass": 0,
+        "device_protocol": 0,
+        "configuration_value": 1,
+        "num_configurations": 1,
+        "num_interfaces": 0,
+    }
+    fields.update(kwargs)
+    device = UsbipDevice(**fields)
+    device.num_interfaces = len(device.interfaces)
+    return device
+
+
+class FakeUsbipd:
+    """Export a fixed list of devices on a localhost port, as usbipd would."""
+
+    def __init__(self, devices: list[UsbipDevice]):
+        self.devices = {device.busid: device for device in devices}
+        self.imported: list[str] = []
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.port = self.sock.getsockname()[1]
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> None:
+        self.sock.listen()
+        self._thread.start()
+
+    def stop(self) -> None:
+        # shutdown wakes the thread blocked in accept
+        self.sock.shutdown(socket.SHUT_RDWR)
+        self.sock.close()
+        self._thread.join(timeout=1)
+
+    def _run(self) -> None:
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            with conn:
+                self._handle(conn)
+
+    def _handle(self, conn: socket.socket) -> None:
+        request = conn.recv(OP_COMMON.size, socket.MSG_WAITALL)
+        _version, code, _status = OP_COMMON.unpack(request)
+        if code == OP_REQ_DEVLIST:
+            reply = OP_COMMON.pack(USBIP_VERSION, OP_REP_DEVLIST, 0)
+            reply += struct.pack(">I", len(self.devices))
+            for device in self.devices.values():
+                reply += device.pack()
+                for interface in device.interfaces:
+                    reply += USB_INTERFACE.pack(*interface)
+            conn.sendall(reply)
+        elif code == OP_REQ_IMPORT:
+            (busid,) = struct.unpack(">32s", conn.recv(32, socket.MSG_WAITALL))
+            device = self.devices.get(busid.rstrip(b"\0").decode())
+            if device is None:
+                conn.sendall(OP_COMMON.pack(USBIP_VERSION, OP_REP_IMPORT, 1))
+                return
+            self.imported.append(device.busid)
+            conn.sendall(OP_COMMON.pack(USBIP_VERSION, OP_REP_IMPORT, 0))
+            conn.sendall(device.pack())
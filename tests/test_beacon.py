@@ -0,0 +1,175 @@
+"""Unit tests for UDP server announcement beacons, run over loopback."""
+
+import random
+import time
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+
+import pytest
+
+from usb_remote import __version__
+from usb_remote.api import DeviceRequest, ServerBeacon
+from usb_remote.beacon import BeaconListener, BeaconSender
+from usb_remote.server import CommandServer
+
+
+@pytest.fixture
+def beacon_port():
+    """Provide a random UDP port for beacons."""
+    return random.randint(10000, 60000)
+
+
+@pytest.fixture
+def listener(beacon_port):
+    """Start a beacon listener on loopback."""
+    on_change = Mock()
+    listener = BeaconListener(beacon_port=beacon_port, on_generation_change=on_change)
+    listener.start()
+    yield listener
+    listener.stop()
+
+
+def wait_for(condition, timeout=2.0):
+    """Poll until condition() is true or timeout expires."""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class TestBeacon:
+    """Test sending and receiving beacons."""
+
+    def test_listener_discovers_sender(self, listener, beacon_port):
+        """Test that a server sending beacons becomes a live server."""
+        sender = BeaconSender(
+            "127.0.0.1", 5055, lambda: 7, host="pi1", beacon_port=beacon_port
+        )
+        sender.start()
+        try:
+            assert wait_for(lambda: listener.live_servers() == ["127.0.0.1"])
+            assert listener.generation("127.0.0.1") == 7
+        finally:
+            sender.stop()
+
+    def test_generation_change_notifies(self, listener, beacon_port):
+        """Test that a new generation from a known server triggers the callback."""
+        generation = [1]
+        sender = BeaconSender(
+            "127.0.0.1", 5055, lambda: generation[0], beacon_port=beacon_port
+        )
+        sender.start()
+        try:
+            assert wait_for(lambda: listener.generation("127.0.0.1") == 1)
+            generation[0] = 2
+            sender.send()
+            assert wait_for(lambda: listener.generation("127.0.0.1") == 2)
+        finally:
+            sender.stop()
+        listener.on_generation_change.assert_called_once_with("127.0.0.1", 2)
+
+    def test_beacon_expires(self):
+        """Test that a server is dropped after missing several beacons."""
+        listener = BeaconListener()
+        beacon = ServerBeacon(
+            host="pi1", port=5055, version=__version__, generation=0, interval=0.01
+        )
+        listener.handle_beacon(beacon.model_dump_json().encode(), "10.0.0.9")
+        assert listener.live_servers() == ["10.0.0.9"]
+        time.sleep(0.05)
+        assert listener.live_servers() == []
+
+    def test_server_up(self):
+        """Test servers coming back are reported, but not their later beacons."""
+        on_server_up = Mock()
+        listener = BeaconListener(on_server_up=on_server_up)
+
+        def beacon(generation, interval=1.0):
+            return (
+                ServerBeacon(
+                    host="pi1",
+                    port=5055,
+                    version=__version__,
+                    generation=generation,
+                    interval=interval,
+                )
+                .model_dump_json()
+                .encode()
+            )
+
+        listener.handle_beacon(beacon(2), "10.0.0.9")
+        on_server_up.assert_called_once_with("10.0.0.9")
+        listener.handle_beacon(beacon(3, interval=0.01), "10.0.0.9")
+        assert on_server_up.call_count == 1
+
+        # beacons expired
+        time.sleep(0.05)
+        listener.handle_beacon(beacon(3), "10.0.0.9")
+        assert on_server_up.call_count == 2
+
+        # restarted
+        listener.handle_beacon(beacon(0), "10.0.0.9")
+        assert on_server_up.call_count == 3
+
+    def test_other_server_port_ignored(self):
+        """Test a server advertising a port clients don't connect on is ignored."""
+        listener = BeaconListener(server_port=5055)
+        beacon = ServerBeacon(
+            host="pi1", port=6000, version=__version__, generation=0, interval=1.0
+        )
+        listener.handle_beacon(beacon.model_dump_json().encode(), "10.0.0.9")
+        assert listener.live_servers() == []
+
+    def test_invalid_beacon_ignored(self):
+        """Test that garbage datagrams are ignored."""
+        listener = BeaconListener()
+        listener.handle_beacon(b"not json", "10.0.0.9")
+        listener.handle_beacon(b'{"command": "list"}', "10.0.0.9")
+        assert listener.live_servers() == []
+
+
+class TestServerGeneration:
+    """Test the inventory generation advertised by CommandServer."""
+
+    def test_generation_bumps_on_bind_changes(self, mock_usb_devices):
+        """Test that attach and detach change the generation."""
+        server = CommandServer(host="127.0.0.1", port=0)
+        with (
+            patch("usb_remote.server.get_device", return_value=mock_usb_devices[0]),
+            patch("usb_remote.server.run_command"),
+        ):
+            server.handle_device(DeviceRequest(command="find", bus="1-1.1"))
+            assert server.generation == 0
+            server.handle_device(DeviceRequest(command="attach", bus="1-1.1"))
+            server.handle_device(DeviceRequest(command="detach", bus="1-1.1"))
+        assert server.generation == 2
+
+    def test_generation_bumps_on_inventory_change(self, mock_usb_devices):
+        """Test that a changed device list changes the generation."""
+        server = CommandServer(host="127.0.0.1", port=0)
+        with patch("usb_remote.server.get_devices", return_value=mock_usb_devices):
+            server.handle_list()
+            server.handle_list()
+        assert server.generation == 0
+        with patch("usb_remote.server.get_devices", return_value=mock_usb_devices[:1]):
+            server.handle_list()
+        assert server.generation == 1
+
+    def test_generation_bumps_on_hotplug(self):
+        """Test that a USB device plugged into the server changes the generation."""
+        server = CommandServer(host="127.0.0.1", port=0)
+        server._handle_usb_event(SimpleNamespace(action="add", sys_name="1-2"))
+        server._handle_usb_event(SimpleNamespace(action="bind", sys_name="1-2"))
+        assert server.generation == 1
+        server._handle_usb_event(SimpleNamespace(action="remove", sys_name="1-2"))
+        assert server.generation == 2
+
+    def test_beacon_from_environment(self, monkeypatch):
+        """Test that USB_REMOTE_BEACON_ADDRESS enables the beacon."""
+        assert CommandServer(port=5055).beacon is None
+        monkeypatch.setenv("USB_REMOTE_BEACON_ADDRESS", "239.255.50.55")
+        server = CommandServer(port=5055)
+        assert server.beacon is not None
+        assert server.beacon.address == "239.255.50.55"
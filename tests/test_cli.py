@@ -1,12 +1,17 @@
 """Tests for basic CLI features."""
 
+import json
 import subprocess
 import sys
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import patch
 
 from typer.testing import CliRunner
 
 from usb_remote import __version__
 from usb_remote.__main__ import app
+from usb_remote.port import Port, PortTable
 
 runner = CliRunner()
 
@@ -59,3 +64,75 @@ class TestCLIIntegration:
         result = runner.invoke(app, ["server", "--help"])
         assert result.exit_code == 0
         assert "Start the USB sharing server" in result.stdout
+
+
+class TestPortsCommand:
+    """Test the ports command's JSON and watch output."""
+
+    def make_port(self):
+        return Port(
+            "00",
+            "server1",
+            "Raspberry Pi : Pico (2e8a:000a)",
+            "1-1.1",
+            Path("/sys/devices/platform/vhci_hcd.0/usb3/3-1"),
+        )
+
+    def test_ports_json(self):
+        """Test each port is printed as a line of JSON."""
+        with (
+            patch.object(Port, "list_ports", return_value=[self.make_port()]),
+            patch.object(Port, "get_local_devices", return_value=["/dev/ttyACM0"]),
+        ):
+            result = runner.invoke(app, ["ports", "--json"])
+
+        assert result.exit_code == 0
+        assert [json.loads(line) for line in result.stdout.splitlines()] == [
+            {
+                "event": "port",
+                "port": 0,
+                "server": "server1",
+                "remote_busid": "1-1.1",
+                "description": "Raspberry Pi : Pico (2e8a:000a)",
+                "local_devices": ["/dev/ttyACM0"],
+            }
+        ]
+
+    def test_ports_watch_json(self):
+        """Test the ports are printed once, then each change as it happens."""
+        port = self.make_port()
+        tables = []
+
+        def start(table):
+            # follow the changes made by the test rather than udev events
+            tables.append(table)
+            table.reload()
+
+        def wait():
+            table = tables[0]
+            tty = SimpleNamespace(
+                sys_path=f"{port.sys_path}/3-1:1.0/tty/ttyACM1",
+                device_node="/dev/ttyACM1",
+                device_type=None,
+                action="add",
+            )
+            table._handle_event(tty)
+            table.reload()
+            raise KeyboardInterrupt
+
+        with (
+            patch.object(Port, "list_ports", side_effect=[[port], []]),
+            patch.object(Port, "get_local_devices", return_value=["/dev/ttyACM0"]),
+            patch.object(PortTable, "start", start),
+            patch("usb_remote.__main__.threading.Event") as mock_event,
+        ):
+            mock_event.return_value.wait.side_effect = wait
+            result = runner.invoke(app, ["ports", "--watch", "--json"])
+
+        assert result.exit_code == 0
+        events = [json.loads(line) for line in result.stdout.splitlines()]
+        assert [(e["event"], e["local_devices"]) for e in events] == [
+            ("port", ["/dev/ttyACM0"]),
+            ("devices", ["/dev/ttyACM0", "/dev/ttyACM1"]),
+            ("detached", []),
+        ]
@@ -6,6 +6,8 @@ from typer.testing import CliRunner
 
 from tests.conftest import create_error_socket, mock_subprocess_run
 from usb_remote.__main__ import app
+from usb_remote.api import ListResponse
+from usb_remote.client import list_devices
 
 runner = CliRunner()
 
@@ -73,6 +75,14 @@ class TestListCommand:
             # Should show devices
             assert "Test Device" in result.stdout
 
+    def test_list_uses_probed_responses(self, mock_usb_devices):
+        """Test that responses received while scanning are not requested again."""
+        response = ListResponse(status="success", data=mock_usb_devices)
+        probed = {"10.0.0.5": response.model_dump_json().encode("utf-8")}
+        with patch("socket.socket", side_effect=AssertionError("connected")):
+            results = list_devices(["10.0.0.5"], probed=probed)
+        assert results == {"10.0.0.5": mock_usb_devices}
+
 
 class TestAttachCommand:
     """Test the attach command."""
@@ -101,6 +111,28 @@ class TestAttachCommand:
             assert "Port 0:" in result.stdout
             assert "local devices:" in result.stdout
 
+    def test_attach_timings(self, mock_usb_devices, mock_socket):
+        """Test attach --timings reports how long each phase took."""
+        with (
+            patch("subprocess.run", side_effect=mock_subprocess_run),
+            patch("socket.socket", return_value=mock_socket()),
+        ):
+            result = runner.invoke(
+                app, ["attach", "--id", "1234:5678", "--host", "localhost", "--timings"]
+            )
+            assert result.exit_code == 0
+            lines = result.stdout.split("Timings:")[1].split("\n")
+            assert [line.split()[0] for line in lines if line] == [
+                "discovery",
+                "find",
+                "stale_detach",
+                "bind",
+                "attach",
+                "port",
+                "settle",
+                "total",
+            ]
+
     def test_attach_with_serial(self, mock_usb_devices, mock_socket):
         """Test attach command with serial number."""
         with (
@@ -349,7 +381,7 @@ class TestServerCommand:
     def test_server_start(self):
         """Test server command starts the server."""
         mock_server = MagicMock()
-        with patch("usb_remote.__main__.CommandServer", return_value=mock_server):
+        with patch("usb_remote.server.CommandServer", return_value=mock_server):
             # Use a background thread or timeout since server.start() blocks
             import threading
 
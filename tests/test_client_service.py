@@ -0,0 +1,338 @@
+"""Tests for request handling in the client service."""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import ANY, Mock, patch
+
+import pytest
+
+from usb_remote.client_api import ClientDeviceRequest
+from usb_remote.client_service import ClientService
+from usb_remote.port import Port, PortTable
+from usb_remote.usbip import UsbipDevice
+
+
+def _find_by_bus(mock_usb_devices):
+    """Make a find_device side effect that returns the device on bus."""
+
+    def find_device(server_hosts, bus=None, **kwargs):
+        device = next(d for d in mock_usb_devices if d.bus_id == bus)
+        return device, "server1"
+
+    return find_device
+
+
+class TestRequestCoalescing:
+    """Test concurrent requests for the same device share one operation."""
+
+    def test_concurrent_attach_runs_once(self, mock_usb_devices):
+        """Test identical concurrent attach requests share a single attach."""
+        service = ClientService(socket_path="unused.sock")
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow_attach(bus_id, server, ports, timings=None):
+            started.set()
+            assert release.wait(timeout=2)
+
+        request = ClientDeviceRequest(command="attach", bus="1-1.1", host="server1")
+        with (
+            patch(
+                "usb_remote.client_service.find_device",
+                side_effect=_find_by_bus(mock_usb_devices),
+            ) as mock_find,
+            patch(
+                "usb_remote.client_service.attach_device", side_effect=slow_attach
+            ) as mock_attach,
+            patch(
+                "usb_remote.client_service.Port.wait_for_port",
+                return_value=None,
+            ),
+            ThreadPoolExecutor(max_workers=4) as pool,
+        ):
+            leader = pool.submit(service.handle_device_command, request)
+            assert started.wait(timeout=2)
+            followers = [
+                pool.submit(service.handle_device_command, request) for _ in range(3)
+            ]
+            # let the followers find the device and join the leader's attach
+            while mock_find.call_count < 4:
+                time.sleep(0.01)
+            time.sleep(0.1)
+            release.set()
+            responses = [f.result(timeout=2) for f in [leader, *followers]]
+
+        mock_attach.assert_called_once_with("1-1.1", "server1", None, ANY)
+        assert all(r == responses[0] for r in responses)
+        assert not service._flights
+
+    def test_concurrent_attach_shares_failure(self, mock_usb_devices):
+        """Test requests joining a failed attach all receive its error."""
+        service = ClientService(socket_path="unused.sock")
+        started = threading.Event()
+        release = threading.Event()
+
+        def failing_attach(bus_id, server, ports, timings=None):
+            started.set()
+            assert release.wait(timeout=2)
+            raise RuntimeError("attach failed")
+
+        request = ClientDeviceRequest(command="attach", bus="1-1.1", host="server1")
+        with (
+            patch(
+                "usb_remote.client_service.find_device",
+                side_effect=_find_by_bus(mock_usb_devices),
+            ) as mock_find,
+            patch(
+                "usb_remote.client_service.attach_device", side_effect=failing_attach
+            ) as mock_attach,
+            ThreadPoolExecutor(max_workers=2) as pool,
+        ):
+            leader = pool.submit(service.handle_device_command, request)
+            assert started.wait(timeout=2)
+            follower = pool.submit(service.handle_device_command, request)
+            while mock_find.call_count < 2:
+                time.sleep(0.01)
+            time.sleep(0.1)
+            release.set()
+
+            for future in (leader, follower):
+                with pytest.raises(RuntimeError, match="attach failed"):
+                    future.result(timeout=2)
+
+        mock_attach.assert_called_once()
+        assert not service._flights
+
+    def test_different_devices_in_parallel(self, mock_usb_devices):
+        """Test attaches of different devices are not serialized."""
+        service = ClientService(socket_path="unused.sock")
+        # both attaches must be running at once to pass the barrier
+        barrier = threading.Barrier(2, timeout=2)
+
+        def parallel_attach(bus_id, server, ports, timings=None):
+            barrier.wait()
+
+        with (
+            patch(
+                "usb_remote.client_service.find_device",
+                side_effect=_find_by_bus(mock_usb_devices),
+            ),
+            patch(
+                "usb_remote.client_service.attach_device",
+                side_effect=parallel_attach,
+            ) as mock_attach,
+            patch(
+                "usb_remote.client_service.Port.wait_for_port",
+                return_value=None,
+            ),
+            ThreadPoolExecutor(max_workers=2) as pool,
+        ):
+            futures = [
+                pool.submit(
+                    service.handle_device_command,
+                    ClientDeviceRequest(command="attach", bus=bus, host="server1"),
+                )
+                for bus in ("1-1.1", "2-2.1")
+            ]
+            for future in futures:
+                future.result(timeout=2)
+
+        assert mock_attach.call_count == 2
+
+    def test_attach_and_detach_serialized(self, mock_usb_devices):
+        """Test an attach and a detach of the same device do not overlap."""
+        service = ClientService(socket_path="unused.sock")
+        running = threading.Lock()
+
+        def exclusive(bus_id, server, ports, timings=None):
+            assert running.acquire(blocking=False), "operations overlapped"
+            time.sleep(0.1)
+            running.release()
+
+        with (
+            patch(
+                "usb_remote.client_service.find_device",
+                side_effect=_find_by_bus(mock_usb_devices),
+            ),
+            patch("usb_remote.client_service.attach_device", side_effect=exclusive),
+            patch("usb_remote.client_service.detach_device", side_effect=exclusive),
+            patch(
+                "usb_remote.client_service.Port.wait_for_port",
+                return_value=None,
+            ),
+            ThreadPoolExecutor(max_workers=2) as pool,
+        ):
+            futures = [
+                pool.submit(
+                    service.handle_device_command,
+                    ClientDeviceRequest(command=command, bus="1-1.1", host="server1"),
+                )
+                for command in ("attach", "detach")
+            ]
+            for future in futures:
+                future.result(timeout=2)
+
+
+class TestPortTableLookup:
+    """Test attaching finds the local port and its files in the port table."""
+
+    def test_attach_uses_table_devices(self, mock_usb_devices):
+        """Test the device files come from the table rather than a udev scan."""
+        service = ClientService(socket_path="unused.sock")
+        service.ports = Mock(spec=PortTable)
+        port = Port("03", "server1", "Test Device 1", "1-1.1")
+        service.ports.wait_for.return_value = port
+        service.ports.wait_for_devices.return_value = ["/dev/ttyACM0"]
+
+        with (
+            patch(
+                "usb_remote.client_service.find_device",
+                side_effect=_find_by_bus(mock_usb_devices),
+            ),
+            patch("usb_remote.client_service.attach_device"),
+            patch.object(Port, "get_local_devices") as mock_scan,
+        ):
+            response = service.handle_device_command(
+                ClientDeviceRequest(command="attach", bus="1-1.1", host="server1")
+            )
+
+        service.ports.wait_for_devices.assert_called_once_with(3)
+        mock_scan.assert_not_called()
+        assert response.local_devices == ["/dev/ttyACM0"]
+
+    def test_attach_timings(self, mock_usb_devices):
+        """Test an attach response reports the time taken by each phase."""
+        service = ClientService(socket_path="unused.sock")
+        service.ports = Mock(spec=PortTable)
+        service.ports.wait_for.return_value = Port("03", "server1", "Test", "1-1.1")
+        service.ports.wait_for_devices.return_value = []
+
+        def attach(bus_id, server, ports, timings):
+            timings["bind"] = 0.5
+
+        with (
+            patch(
+                "usb_remote.client_service.find_device",
+                side_effect=_find_by_bus(mock_usb_devices),
+            ),
+            patch("usb_remote.client_service.attach_device", side_effect=attach),
+        ):
+            attached = service.handle_device_command(
+                ClientDeviceRequest(command="attach", bus="1-1.1", host="server1")
+            )
+            found = service.handle_device_command(
+                ClientDeviceRequest(command="find", bus="1-1.1", host="server1")
+            )
+
+        timings = attached.timings
+        assert timings is not None
+        assert list(timings) == ["discovery", "find", "bind", "port", "settle"]
+        assert timings["bind"] == 0.5
+        assert all(seconds >= 0 for seconds in timings.values())
+        assert found.timings is None
+
+
+class TestInventoryCache:
+    """Test device lists of servers that send beacons are reused."""
+
+    @pytest.fixture
+    def service(self):
+        service = ClientService(socket_path="unused.sock")
+        service.beacons = Mock()
+        service.beacons.generation.return_value = 3
+        return service
+
+    def test_unchanged_inventory_reused(self, service, mock_usb_devices):
+        """Test a server is listed again only when its generation changes."""
+        request = ClientDeviceRequest(command="list", host="server1")
+        with patch(
+            "usb_remote.client_service.list_devices",
+            return_value={"server1": mock_usb_devices},
+        ) as mock_list:
+            first = service.handle_list_command(request)
+            second = service.handle_list_command(request)
+            assert mock_list.call_count == 1
+            assert first == second
+
+            service.beacons.generation.return_value = 4
+            service.handle_list_command(request)
+            assert mock_list.call_count == 2
+
+    def test_generation_change_invalidates(self, service, mock_usb_devices):
+        """Test a generation change announced by a beacon drops the inventory."""
+        request = ClientDeviceRequest(command="list", host="server1")
+        with patch(
+            "usb_remote.client_service.list_devices",
+            return_value={"server1": mock_usb_devices},
+        ):
+            service.handle_list_command(request)
+        assert "server1" in service._inventories
+
+        service._invalidate_inventory("server1", 4)
+
+        assert "server1" not in service._inventories
+
+
+class TestReconcile:
+    """Test the stale ports of a server are detached when it comes back."""
+
+    def test_reconcile_with_table(self):
+        """Test the ports in the table are compared with the server's exports."""
+        service = ClientService(socket_path="unused.sock")
+        service.ports = Mock(spec=PortTable)
+        live = Port("00", "server1", "Test Device 1", "1-1.1")
+        dead = Port("01", "server1", "Test Device 2", "1-1.2")
+        service.ports.ports.return_value = [live, dead]
+        exported = UsbipDevice(
+            "/sys/1-1.1", "1-1.1", 1, 2, 3, 0, 0, 0, 0, 0, 0, 1, 1, 0
+        )
+
+        with (
+            patch("usb_remote.client.list_exported", return_value=[exported]),
+            patch("usb_remote.port.read_vhci_status", return_value=[]),
+            patch.object(Port, "detach", autospec=True) as mock_detach,
+        ):
+            assert service.reconcile("server1") == [dead]
+
+        mock_detach.assert_called_once_with(dead)
+
+    def test_unreachable_server_kept(self):
+        """Test nothing is detached when the server's exports cannot be listed."""
+        service = ClientService(socket_path="unused.sock")
+        service.ports = Mock(spec=PortTable)
+
+        with (
+            patch("usb_remote.client.list_exported", side_effect=OSError),
+            patch.object(Port, "detach") as mock_detach,
+        ):
+            assert service.reconcile("server1") == []
+
+        mock_detach.assert_not_called()
+        service.ports.ports.assert_not_called()
+
+
+class TestLeaseRenewal:
+    """Test the leases of attached devices are renewed with their servers."""
+
+    def test_renews_each_port(self):
+        """Test every attached port is renewed, even after one is lost."""
+        from usb_remote.usbdevice import DeviceBusyError
+
+        service = ClientService(socket_path="unused.sock")
+        service.ports = Mock(spec=PortTable)
+        service.ports.ports.return_value = [
+            Port("00", "server1", "Test Device 1", "1-1.1"),
+            Port("01", "server2", "Test Device 2", "2-2.1"),
+        ]
+
+        with patch(
+            "usb_remote.client_service.renew_lease",
+            side_effect=[DeviceBusyError("in use by 10.0.0.2"), None],
+        ) as mock_renew:
+            service.renew_leases()
+
+        assert [call.args for call in mock_renew.call_args_list] == [
+            ("1-1.1", "server1"),
+            ("2-2.1", "server2"),
+        ]
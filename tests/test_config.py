@@ -5,7 +5,9 @@ from pathlib import Path
 from unittest.mock import patch
 
 import pytest
+from typer.testing import CliRunner
 
+from usb_remote.__main__ import app
 from usb_remote.config import (
     Defaults,
     UsbRemoteConfig,
@@ -13,6 +15,7 @@ from usb_remote.config import (
     get_config,
     get_servers,
     get_timeout,
+    reload_config,
     save_servers,
 )
 
@@ -220,6 +223,68 @@ class TestGetConfig:
         assert config.timeout == 10.0
 
 
+class TestConfigCache:
+    """Test that config is parsed once and re-read only when the file changes."""
+
+    @pytest.fixture(autouse=True)
+    def config_path(self, temp_config_file, sample_config_content):
+        temp_config_file.write_text(sample_config_content)
+        with patch(
+            "usb_remote.config.discover_config_path", return_value=temp_config_file
+        ):
+            reload_config()
+            yield temp_config_file
+
+    def test_repeated_calls_parse_once(self):
+        """Test that getters share one parsed snapshot."""
+        with patch.object(
+            UsbRemoteConfig, "from_file", wraps=UsbRemoteConfig.from_file
+        ) as from_file:
+            assert get_timeout() == 10.0
+            assert len(get_servers()) == 3
+            assert get_config() is get_config()
+        from_file.assert_not_called()
+
+    def test_file_change_reloads(self, config_path):
+        """Test that a modified file is re-read."""
+        assert get_timeout() == 10.0
+        config_path.write_text("timeout: 3.5\n")
+        assert get_timeout() == 3.5
+
+    def test_reload_config(self):
+        """Test that reload_config always parses the file again."""
+        with patch.object(
+            UsbRemoteConfig, "from_file", wraps=UsbRemoteConfig.from_file
+        ) as from_file:
+            reload_config()
+        from_file.assert_called_once()
+
+    def test_getters_return_copies(self):
+        """Test that callers cannot modify the cached snapshot."""
+        get_servers().append("extra")
+        assert "extra" not in get_servers()
+
+    def test_config_commands_copy_snapshot(self):
+        """Test that config commands change a copy, not the cached snapshot."""
+        runner = CliRunner()
+        with patch.object(UsbRemoteConfig, "to_file", side_effect=OSError("read-only")):
+            runner.invoke(app, ["config", "set-timeout", "2.5"])
+            runner.invoke(app, ["config", "add-server", "extra"])
+            runner.invoke(app, ["config", "rm-server", "server1.example.com"])
+
+        assert get_timeout() == 10.0
+        assert get_servers() == [
+            "server1.example.com",
+            "192.168.1.100",
+            "raspberrypi.local",
+        ]
+
+    def test_save_servers_refreshes_cache(self):
+        """Test that saving the config is seen by the next read."""
+        save_servers(["only"])
+        assert get_servers() == ["only"]
+
+
 class TestGetServers:
     """Test the get_servers function."""
 
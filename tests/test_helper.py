@@ -0,0 +1,112 @@
+"""Tests for the privileged helper that runs usbip commands as root."""
+
+import subprocess
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+from usb_remote.helper import HelperRequest, PrivilegedHelper
+from usb_remote.utility import run_command
+
+
+def completed(command, returncode=0, stdout="", stderr=""):
+    """Make the result of a command run by subprocess.run."""
+    return subprocess.CompletedProcess(command, returncode, stdout, stderr)
+
+
+@pytest.fixture
+def helper(isolated_helper_socket):
+    """Run a privileged helper on the test's helper socket."""
+    helper = PrivilegedHelper(socket_path=str(isolated_helper_socket))
+    thread = threading.Thread(target=helper.start, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 2
+    while not helper.running and time.monotonic() < deadline:
+        time.sleep(0.01)
+    yield helper
+    helper.stop()
+    thread.join(timeout=1)
+
+
+class TestHelperRequest:
+    """Test which usbip command lines the helper accepts."""
+
+    @pytest.mark.parametrize(
+        "args",
+        [
+            ["bind", "-b", "1-1.1"],
+            ["unbind", "-b", "2-3.4.1"],
+            ["attach", "-r", "192.168.1.10", "-b", "1-1"],
+            ["attach", "-r", "pi-server.local", "-b", "1-1"],
+            ["detach", "-p", "7"],
+            ["port"],
+        ],
+    )
+    def test_round_trip(self, args):
+        """Test accepted command lines are run as given."""
+        request = HelperRequest.from_usbip_args(args)
+        assert request is not None
+        assert request.usbip_args() == args
+
+    @pytest.mark.parametrize(
+        "args",
+        [
+            [],
+            ["list", "-l"],
+            ["bind", "-b", "--help"],
+            ["bind", "-b", "1-1.1; reboot"],
+            ["attach", "-r", "-x", "-b", "1-1"],
+            ["attach", "-b", "1-1"],
+            ["detach", "-p", "00", "-b", "1-1"],
+            ["port", "-b", "1-1"],
+        ],
+    )
+    def test_rejected(self, args):
+        """Test other commands and unexpected arguments are not run."""
+        assert HelperRequest.from_usbip_args(args) is None
+
+
+class TestRunCommand:
+    """Test sudo usbip commands go to the helper when one is running."""
+
+    def test_uses_helper(self, helper):
+        """Test a usbip command runs in the helper without starting sudo."""
+        with patch(
+            "subprocess.run", return_value=completed([], stdout="bound")
+        ) as mock_run:
+            result = run_command(["sudo", "usbip", "bind", "-b", "1-1.1"])
+
+        mock_run.assert_called_once()
+        assert mock_run.call_args.args[0] == ["usbip", "bind", "-b", "1-1.1"]
+        assert result.returncode == 0
+        assert result.stdout == "bound"
+
+    def test_helper_failure_checked(self, helper):
+        """Test a failing command run by the helper raises as if run directly."""
+        with (
+            patch("subprocess.run", return_value=completed([], 1, stderr="no device")),
+            pytest.raises(RuntimeError, match="no device"),
+        ):
+            run_command(["sudo", "usbip", "unbind", "-b", "1-1.1"])
+
+        with patch("subprocess.run", return_value=completed([], 1)):
+            result = run_command(["sudo", "usbip", "port"], check=False)
+        assert result.returncode == 1
+
+    def test_unsupported_command_uses_sudo(self, helper):
+        """Test commands the helper does not run still start sudo."""
+        with patch("subprocess.run", return_value=completed([])) as mock_run:
+            run_command(["sudo", "usbip", "list", "-l"])
+
+        mock_run.assert_called_once()
+        assert mock_run.call_args.args[0] == ["sudo", "usbip", "list", "-l"]
+
+    def test_no_helper_uses_sudo(self):
+        """Test sudo is used when no helper is running."""
+        with patch("subprocess.run", return_value=completed([])) as mock_run:
+            run_command(["sudo", "usbip", "detach", "-p", "00"])
+
+        mock_run.assert_called_once()
+        assert mock_run.call_args.args[0] == ["sudo", "usbip", "detach", "-p", "00"]
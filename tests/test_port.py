@@ -0,0 +1,573 @@
+"""Tests for reading local usbip ports."""
+
+import threading
+import time
+from datetime import timedelta
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+
+import pytest
+
+from usb_remote.port import (
+    Port,
+    PortTable,
+    read_vhci_record,
+    read_vhci_status,
+    reconcile_ports,
+)
+
+VHCI_DEVICE = "/sys/devices/platform/vhci_hcd.0/usb3/3-1"
+
+STATUS = """\
+hub port sta spd dev      sockfd local_busid
+hs  0000 006 002 00010002 000003 3-1
+hs  0001 004 000 00000000 000000 0-0
+ss  0008 006 005 00020003 000004 4-1
+"""
+
+STATUS_OLD = """\
+prt sta spd bus dev socket           local_busid
+000 006 002 00010002 ffff88003a5e4000 3-1
+001 004 000 00000000 0000000000000000 0-0
+"""
+
+
+@pytest.fixture
+def vhci(isolated_vhci):
+    """A fake vhci_hcd sysfs tree with two ports attached."""
+    controller = isolated_vhci / "platform" / "vhci_hcd.0"
+    controller.mkdir(parents=True)
+    (controller / "status").write_text(STATUS)
+
+    state = isolated_vhci / "vhci_hcd"
+    state.mkdir()
+    (state / "port0").write_text("192.168.1.10 3240 1-1.1\n")
+    (state / "port8").write_text("pi-server 3240 2-2.1\n")
+
+    # /sys/bus/usb/devices links to the device beneath its vhci_hcd root hub
+    device = controller / "usb3" / "3-1"
+    device.mkdir(parents=True)
+    (isolated_vhci / "usb").mkdir()
+    (isolated_vhci / "usb" / "3-1").symlink_to(device)
+    (isolated_vhci / "usb" / "4-1").symlink_to(controller / "usb4" / "4-1")
+    for name, value in (
+        ("manufacturer", "Raspberry Pi"),
+        ("product", "Pico"),
+        ("idVendor", "2e8a"),
+        ("idProduct", "000a"),
+    ):
+        (device / name).write_text(f"{value}\n")
+    return isolated_vhci
+
+
+class TestVhciStatus:
+    """Test parsing the vhci_hcd sysfs status files."""
+
+    def test_no_vhci(self):
+        """Test None is returned when vhci_hcd is not loaded."""
+        assert read_vhci_status() is None
+
+    def test_ports_in_use(self, vhci):
+        """Test only ports with a device attached are returned."""
+        ports = read_vhci_status()
+
+        assert ports is not None
+        assert [p.port for p in ports] == [0, 8]
+        assert ports[0].local_busid == "3-1"
+        assert ports[0].devid == 0x00010002
+        assert ports[0].sockfd == 3
+
+    def test_old_kernel_format(self, isolated_vhci):
+        """Test the status format of kernels before 4.13."""
+        controller = isolated_vhci / "platform" / "vhci_hcd.0"
+        controller.mkdir(parents=True)
+        (controller / "status").write_text(STATUS_OLD)
+
+        ports = read_vhci_status()
+
+        assert ports is not None
+        assert [(p.port, p.local_busid) for p in ports] == [(0, "3-1")]
+
+    def test_record(self, vhci):
+        """Test the server and remote busid recorded by usbip attach."""
+        assert read_vhci_record(0) == ("192.168.1.10", "1-1.1")
+        assert read_vhci_record(1) is None
+
+    def test_unreadable_record(self, vhci):
+        """Test a record that cannot be read is not mistaken for a missing one."""
+        with (
+            patch.object(Path, "read_text", side_effect=PermissionError),
+            pytest.raises(PermissionError),
+        ):
+            read_vhci_record(0)
+
+
+class TestListPorts:
+    """Test listing ports from sysfs."""
+
+    def test_list_ports_from_sysfs(self, vhci):
+        """Test ports are read from sysfs without running usbip port."""
+        with patch("usb_remote.port.run_command") as mock_run:
+            ports = Port.list_ports()
+
+        mock_run.assert_not_called()
+        assert [(p.port_number, p.server, p.remote_busid) for p in ports] == [
+            (0, "192.168.1.10", "1-1.1"),
+            (8, "pi-server", "2-2.1"),
+        ]
+        assert ports[0].description == "Raspberry Pi : Pico (2e8a:000a)"
+
+    def test_get_port_by_remote_busid(self, vhci):
+        """Test finding the local port of a remote device from sysfs."""
+        with patch("usb_remote.port.run_command") as mock_run:
+            port = Port.get_port_by_remote_busid("2-2.1", "pi-server")
+
+        mock_run.assert_not_called()
+        assert port is not None
+        assert port.port_number == 8
+
+    def test_unreadable_record_falls_back_to_usbip_port(self, vhci):
+        """Test usbip port is used when the usbip records are root only."""
+        output = (
+            "Port 00: <Port in Use> at High Speed(480Mbps)\n"
+            "       Vendor : Product (1234:5678)\n"
+            "       3-1 -> usbip://192.168.1.10:3240/1-1.1\n"
+        )
+        with (
+            patch(
+                "usb_remote.port.read_vhci_record",
+                side_effect=PermissionError("Permission denied"),
+            ),
+            patch("usb_remote.port.run_command") as mock_run,
+            patch("usb_remote.port.pyudev.Context"),
+        ):
+            mock_run.return_value.returncode = 0
+            mock_run.return_value.stdout = output
+            ports = Port.list_ports()
+
+        mock_run.assert_called_once_with(["sudo", "usbip", "port"], check=False)
+        assert [(p.port_number, p.server, p.remote_busid) for p in ports] == [
+            (0, "192.168.1.10", "1-1.1")
+        ]
+
+    def test_falls_back_to_usbip_port(self):
+        """Test usbip port is used when vhci_hcd has no sysfs status."""
+        with patch("usb_remote.port.run_command") as mock_run:
+            mock_run.return_value.returncode = 0
+            mock_run.return_value.stdout = ""
+            assert Port.list_ports() == []
+
+        mock_run.assert_called_once_with(["sudo", "usbip", "port"], check=False)
+
+
+class TestReconcilePorts:
+    """Test detaching the stale ports of a server in one pass."""
+
+    def test_unexported_devices_detached(self, vhci):
+        """Test only the server's ports of devices it no longer exports detach."""
+        with (
+            patch.object(Port, "detach", autospec=True) as mock_detach,
+            patch("usb_remote.port.run_command") as mock_run,
+        ):
+            stale = reconcile_ports("192.168.1.10", {"1-1.2"})
+
+        mock_run.assert_not_called()
+        assert [p.port_number for p in stale] == [0]
+        mock_detach.assert_called_once_with(stale[0])
+
+    def test_exported_devices_kept(self, vhci):
+        """Test ports of devices the server still exports are kept."""
+        with patch.object(Port, "detach") as mock_detach:
+            assert reconcile_ports("192.168.1.10", {"1-1.1"}) == []
+
+        mock_detach.assert_not_called()
+
+    def test_failed_connection_detached(self, vhci):
+        """Test a port whose connection has failed is stale even if exported."""
+        status = vhci / "platform" / "vhci_hcd.0" / "status"
+        status.write_text(STATUS.replace("hs  0000 006", "hs  0000 007"))
+
+        with patch.object(Port, "detach"):
+            stale = reconcile_ports("192.168.1.10", {"1-1.1"})
+
+        assert [p.port_number for p in stale] == [0]
+
+    def test_given_ports_not_listed(self, vhci):
+        """Test the ports of a port table are used without listing them again."""
+        port = Port("03", "pi-server", "Test Device", "2-2.9")
+        with (
+            patch.object(Port, "list_ports") as mock_list,
+            patch.object(Port, "detach"),
+        ):
+            stale = reconcile_ports("pi-server", {"2-2.1"}, [port])
+
+        mock_list.assert_not_called()
+        assert stale == [port]
+
+
+class TestLocalDevices:
+    """Test local device files are only looked up when needed."""
+
+    def test_local_devices_lazy(self, vhci):
+        """Test listing and matching ports does not scan udev."""
+        with patch.object(
+            Port, "get_local_devices", return_value=["/dev/ttyACM0"]
+        ) as mock_get:
+            port = Port.get_port_by_remote_busid("1-1.1", "192.168.1.10")
+            mock_get.assert_not_called()
+
+            assert port is not None
+            assert port.local_devices == ["/dev/ttyACM0"]
+            assert port.local_devices == ["/dev/ttyACM0"]
+
+        mock_get.assert_called_once()
+
+
+def udev_device(sys_path, device_node=None, age=10.0, action=None):
+    """A fake pyudev Device initialized age seconds ago."""
+    return SimpleNamespace(
+        sys_path=sys_path,
+        device_node=device_node,
+        is_initialized=True,
+        time_since_initialized=timedelta(seconds=age),
+        action=action,
+    )
+
+
+class FakeMonitor:
+    """A udev monitor that delivers a list of (delay, event) pairs."""
+
+    def __init__(self, events):
+        self.events = list(events)
+
+    def start(self):
+        pass
+
+    def filter_by(self, subsystem):
+        pass
+
+    def poll(self, timeout: float):
+        if not self.events or self.events[0][0] > timeout:
+            time.sleep(timeout)
+            return None
+        delay, event = self.events.pop(0)
+        time.sleep(delay)
+        return event
+
+
+class TestFindDevFiles:
+    """Test waiting for the device files of an attached device to settle."""
+
+    def find_dev_files(self, children, events, base_age=10.0, **kwargs):
+        """Run _find_dev_files against fake udev devices and events."""
+        base = udev_device(VHCI_DEVICE, age=base_age)
+        context = Mock()
+        context.list_devices.return_value = children
+        port = Port("00", "server", "description", "1-1.1")
+        with (
+            patch("pyudev.Monitor.from_netlink", return_value=FakeMonitor(events)),
+            patch("pyudev.Devices.from_path", return_value=base),
+        ):
+            start = time.monotonic()
+            files = port._find_dev_files(context, Path(VHCI_DEVICE), **kwargs)
+            return sorted(files), time.monotonic() - start
+
+    def test_settled_device_returns_immediately(self):
+        """Test a device initialized long ago is not waited for."""
+        children = [udev_device(f"{VHCI_DEVICE}/tty/ttyACM0", "/dev/ttyACM0")]
+
+        files, elapsed = self.find_dev_files(children, [])
+
+        assert files == ["/dev/ttyACM0"]
+        assert elapsed < 0.1
+
+    def test_collects_add_events(self):
+        """Test device files added beneath the device are collected."""
+        events = [
+            (0.05, udev_device(f"{VHCI_DEVICE}/host0", action="add")),
+            (
+                0.05,
+                udev_device("/sys/devices/pci0000:00/other", "/dev/sdz", action="add"),
+            ),
+            # the device of another port whose number starts the same
+            (0.05, udev_device(f"{VHCI_DEVICE}0", "/dev/ttyACM9", action="add")),
+            (
+                0.05,
+                udev_device(f"{VHCI_DEVICE}/host0/block/sda", "/dev/sda", action="add"),
+            ),
+            (
+                0.05,
+                udev_device(
+                    f"{VHCI_DEVICE}/host0/block/sda/sda1", "/dev/sda1", action="add"
+                ),
+            ),
+        ]
+
+        files, _ = self.find_dev_files([], events, base_age=0.0, settle_quiet=0.2)
+
+        assert files == ["/dev/sda", "/dev/sda1"]
+
+    def test_deadline(self):
+        """Test a device that keeps changing is given up on at the deadline."""
+        events = [
+            (0.05, udev_device(f"{VHCI_DEVICE}/x{i}", f"/dev/x{i}", action="add"))
+            for i in range(100)
+        ]
+
+        _, elapsed = self.find_dev_files(
+            [], events, base_age=0.0, settle_quiet=0.2, settle_timeout=0.3
+        )
+
+        assert 0.3 <= elapsed < 0.5
+
+    def test_no_monitor(self):
+        """Test devices are still enumerated when udev cannot be monitored."""
+        children = [udev_device(f"{VHCI_DEVICE}/tty/ttyACM0", "/dev/ttyACM0", 0.0)]
+        port = Port("00", "server", "description", "1-1.1")
+        context = Mock()
+        context.list_devices.return_value = children
+        with (
+            patch("pyudev.Monitor.from_netlink", side_effect=OSError("no netlink")),
+            patch("pyudev.Devices.from_path", return_value=udev_device(VHCI_DEVICE)),
+        ):
+            files = port._find_dev_files(context, Path(VHCI_DEVICE))
+
+        assert files == ["/dev/ttyACM0"]
+
+
+class TestUdevLookup:
+    """Test ports find their local USB device without scanning udev each."""
+
+    def test_sysfs_ports_skip_udev_scan(self, vhci):
+        """Test ports read from sysfs know their device's sysfs path."""
+        with (
+            patch("usb_remote.port.pyudev.Context") as mock_context,
+            patch.object(Port, "_find_dev_files", return_value=["/dev/ttyACM0"]),
+        ):
+            ports = Port.list_ports()
+            assert [p.local_devices for p in ports] == [["/dev/ttyACM0"]] * 2
+
+        assert ports[0].sys_path == (vhci / "usb" / "3-1").resolve()
+        mock_context.return_value.list_devices.assert_not_called()
+
+    def test_usbip_port_ports_share_one_scan(self):
+        """Test ports parsed from usbip port share a single udev scan."""
+        output = "".join(
+            f"Port {n:02d}: <Port in Use> at High Speed(480Mbps)\n"
+            f"       Vendor : Product (1234:5678)\n"
+            f"       3-{n + 1} -> usbip://server:3240/1-1.{n + 1}\n"
+            for n in range(4)
+        )
+        usb_devices = [
+            Mock(
+                sys_path=f"/sys/devices/platform/vhci_hcd.0/usb3/3-{n + 1}",
+                attributes={"devpath": f"{n + 1}\n".encode()},
+            )
+            for n in range(4)
+        ]
+        with (
+            patch("usb_remote.port.run_command") as mock_run,
+            patch("usb_remote.port.pyudev.Context") as mock_context,
+        ):
+            mock_run.return_value.returncode = 0
+            mock_run.return_value.stdout = output
+            mock_context.return_value.list_devices.return_value = usb_devices
+            ports = Port.list_ports()
+
+        mock_context.return_value.list_devices.assert_called_once()
+        assert [p.sys_path for p in ports] == [Path(d.sys_path) for d in usb_devices]
+
+
+class TestWaitForPort:
+    """Test waiting for the port of an attached device."""
+
+    def test_found_on_udev_event(self):
+        """Test the port is checked again as soon as a vhci event arrives."""
+        port = Port("00", "server", "description", "1-1.1")
+        events = [
+            (0.05, udev_device("/sys/devices/pci0000:00/usb1/1-4", action="add")),
+            (0.05, udev_device(VHCI_DEVICE, action="add")),
+        ]
+        with (
+            patch("pyudev.Monitor.from_netlink", return_value=FakeMonitor(events)),
+            patch.object(
+                Port, "get_port_by_remote_busid", side_effect=[None, port]
+            ) as mock_get,
+        ):
+            start = time.monotonic()
+            found = Port.wait_for_port("1-1.1", "server")
+            elapsed = time.monotonic() - start
+
+        assert found is port
+        assert mock_get.call_count == 2
+        assert elapsed < 0.3
+
+    def test_timeout(self):
+        """Test None is returned if the port never appears."""
+        with (
+            patch("pyudev.Monitor.from_netlink", return_value=FakeMonitor([])),
+            patch.object(
+                Port, "get_port_by_remote_busid", return_value=None
+            ) as mock_get,
+        ):
+            start = time.monotonic()
+            found = Port.wait_for_port("1-1.1", "server", timeout=0.3)
+            elapsed = time.monotonic() - start
+
+        assert found is None
+        assert 0.3 <= elapsed < 0.5
+        # checked at the start and once more at the deadline
+        assert mock_get.call_count == 2
+
+
+class TestPortTable:
+    """Test the live table of local ports."""
+
+    @pytest.fixture
+    def table(self, vhci):
+        """A port table read from the fake vhci sysfs."""
+        with patch.object(Port, "get_local_devices", return_value=["/dev/ttyACM0"]):
+            table = PortTable()
+            table.reload()
+        return table
+
+    def test_lookups(self, table):
+        """Test ports and their device files are looked up from the table."""
+        assert [p.port_number for p in table.ports()] == [0, 8]
+        port = table.find("1-1.1", "192.168.1.10")
+        assert port is not None and port.port_number == 0
+        assert table.find("1-1.1", "pi-server") is None
+        assert table.local_devices(0) == ["/dev/ttyACM0"]
+
+    def test_device_node_events(self, table):
+        """Test device files appearing and disappearing beneath a port."""
+        port = table.find("1-1.1", "192.168.1.10")
+        assert port is not None and port.sys_path is not None
+        tty = udev_device(
+            f"{port.sys_path}/3-1:1.0/tty/ttyACM1", "/dev/ttyACM1", action="add"
+        )
+        tty.device_type = None
+
+        table._handle_event(tty)
+        assert table.local_devices(0) == ["/dev/ttyACM0", "/dev/ttyACM1"]
+
+        tty.action = "remove"
+        table._handle_event(tty)
+        assert table.local_devices(0) == ["/dev/ttyACM0"]
+
+    def test_device_node_of_other_port(self, table):
+        """Test a device file of port 3-10 is not taken as one of port 3-1."""
+        port = table.find("1-1.1", "192.168.1.10")
+        assert port is not None and port.sys_path is not None
+        event = udev_device(
+            f"{port.sys_path}0/3-10:1.0/tty/ttyACM9", "/dev/ttyACM9", action="add"
+        )
+        event.device_type = None
+
+        table._handle_event(event)
+
+        assert table.local_devices(0) == ["/dev/ttyACM0"]
+
+    def test_wait_for_devices(self, table):
+        """Test waiting for a port's device files to stop changing."""
+        port = table.find("1-1.1", "192.168.1.10")
+        assert port is not None and port.sys_path is not None
+        tty = udev_device(
+            f"{port.sys_path}/3-1:1.0/tty/ttyACM1", "/dev/ttyACM1", action="add"
+        )
+        tty.device_type = None
+        timer = threading.Timer(0.1, table._handle_event, [tty])
+        timer.start()
+
+        start = time.monotonic()
+        files = table.wait_for_devices(0, settle_quiet=0.2)
+        elapsed = time.monotonic() - start
+        timer.join()
+
+        assert files == ["/dev/ttyACM0", "/dev/ttyACM1"]
+        # settled 0.2 s after the file added at 0.1 s
+        assert 0.3 <= elapsed < 0.5
+
+    def test_reloads_serialized(self, table):
+        """Test concurrent reloads never list the ports at the same time."""
+        running = threading.Lock()
+        list_ports = Port.list_ports
+
+        def exclusive_list_ports():
+            assert running.acquire(blocking=False), "reloads overlapped"
+            time.sleep(0.05)
+            running.release()
+            return list_ports()
+
+        with patch.object(Port, "list_ports", side_effect=exclusive_list_ports):
+            threads = [threading.Thread(target=table.reload) for _ in range(3)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        assert [p.port_number for p in table.ports()] == [0, 8]
+
+    def test_port_detached_event(self, table, vhci):
+        """Test a port's device being removed reloads the ports."""
+        port = table.find("2-2.1", "pi-server")
+        assert port is not None and port.sys_path is not None
+        status = vhci / "platform" / "vhci_hcd.0" / "status"
+        status.write_text(STATUS.replace("ss  0008 006", "ss  0008 004"))
+        event = udev_device(str(port.sys_path), action="remove")
+        event.device_type = "usb_device"
+
+        table._handle_event(event)
+
+        assert [p.port_number for p in table.ports()] == [0]
+        assert table.local_devices(8) == []
+
+    def test_on_change(self, vhci):
+        """Test the first read reports each port, later reloads the changes."""
+        on_change = Mock()
+        table = PortTable(on_change=on_change)
+        with patch.object(Port, "get_local_devices", return_value=["/dev/ttyACM0"]):
+            table.reload()
+            assert [
+                (c.args[0], c.args[1].port_number) for c in on_change.mock_calls
+            ] == [
+                ("port", 0),
+                ("port", 8),
+            ]
+            on_change.reset_mock()
+
+            status = vhci / "platform" / "vhci_hcd.0" / "status"
+            status.write_text(STATUS.replace("ss  0008 006", "ss  0008 004"))
+            table.reload()
+            table.reload()
+
+        on_change.assert_called_once()
+        event, port, local_devices = on_change.call_args.args
+        assert (event, port.port_number, local_devices) == ("detached", 8, [])
+
+    def test_wait_for_attach(self, table, vhci):
+        """Test waiting for a port is woken by the udev event of its device."""
+        status = vhci / "platform" / "vhci_hcd.0" / "status"
+
+        def attach():
+            time.sleep(0.1)
+            status.write_text(STATUS.replace("hs  0001 004", "hs  0001 006"))
+            (vhci / "vhci_hcd" / "port1").write_text("192.168.1.10 3240 1-1.2\n")
+            event = udev_device(
+                str(vhci / "platform" / "vhci_hcd.0" / "usb3" / "3-2"), action="add"
+            )
+            event.device_type = "usb_device"
+            table._handle_event(event)
+
+        thread = threading.Thread(target=attach)
+        with patch.object(Port, "get_local_devices", return_value=[]):
+            thread.start()
+            start = time.monotonic()
+            port = table.wait_for("1-1.2", "192.168.1.10", timeout=2)
+            elapsed = time.monotonic() - start
+        thread.join()
+
+        assert port is not None and port.port_number == 1
+        # woken by the event rather than the periodic recheck
+        assert elapsed < 0.4
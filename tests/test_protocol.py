@@ -267,7 +267,7 @@ class TestClientServerIntegration:
         # Mock Port.get_port_by_remote_busid to return None to avoid run_command call
         with (
             patch("usb_remote.client.send_request") as mock_send,
-            patch("usb_remote.client.Port.get_port_by_remote_busid", return_value=None),
+            patch("usb_remote.port.Port.get_port_by_remote_busid", return_value=None),
         ):
             detach_device(bus_id="1-1.1", server_host="127.0.0.1")
             # Verify send_request was called with correct parameters
@@ -467,3 +467,165 @@ class TestErrorDifferentiation:
 
             finally:
                 server.stop()
+
+
+class TestDeviceLeases:
+    """Test attaching a device leases it to the client that attached it."""
+
+    @pytest.fixture
+    def leases(self, mock_get_device):
+        """A server whose commands and device status are mocked."""
+        with (
+            patch("usb_remote.server.run_command") as mock_run,
+            patch("usb_remote.server.read_usbip_status", return_value=None),
+        ):
+            server = CommandServer(host="127.0.0.1", port=0)
+            yield server, mock_run
+
+    def test_competing_attach_busy(self, leases):
+        """Test a second client is told who holds the device, not rebound."""
+        from usb_remote.usbdevice import DeviceBusyError
+
+        server, mock_run = leases
+        server.handle_device(DeviceRequest(command="attach", bus="1-1.1"), "10.0.0.1")
+        binds = mock_run.call_count
+
+        with pytest.raises(DeviceBusyError, match="10.0.0.1"):
+            server.handle_device(
+                DeviceRequest(command="attach", bus="1-1.1"), "10.0.0.2"
+            )
+        with pytest.raises(DeviceBusyError):
+            server.handle_device(
+                DeviceRequest(command="detach", bus="1-1.1"), "10.0.0.2"
+            )
+        assert mock_run.call_count == binds
+
+    def test_holder_reattaches(self, leases):
+        """Test the holder of a lease may attach the device again."""
+        server, _ = leases
+        request = DeviceRequest(command="attach", bus="1-1.1")
+        server.handle_device(request, "10.0.0.1")
+        server.handle_device(request, "10.0.0.1")
+
+    def test_detach_releases(self, leases):
+        """Test another client may attach a device once the holder detaches it."""
+        server, _ = leases
+        server.handle_device(DeviceRequest(command="attach", bus="1-1.1"), "10.0.0.1")
+        server.handle_device(DeviceRequest(command="detach", bus="1-1.1"), "10.0.0.1")
+        server.handle_device(DeviceRequest(command="attach", bus="1-1.1"), "10.0.0.2")
+
+    def test_lease_expires_unless_renewed(self, leases):
+        """Test a lease lapses if the holder does not renew it."""
+        from usb_remote.usbdevice import DeviceBusyError
+
+        server, _ = leases
+        server.lease_time = 0.2
+        attach = DeviceRequest(command="attach", bus="1-1.1")
+        server.handle_device(attach, "10.0.0.1")
+        time.sleep(0.12)
+        server.handle_device(DeviceRequest(command="renew", bus="1-1.1"), "10.0.0.1")
+        time.sleep(0.12)
+        with pytest.raises(DeviceBusyError):
+            server.handle_device(attach, "10.0.0.2")
+        time.sleep(0.25)
+        server.handle_device(attach, "10.0.0.2")
+
+    def test_bound_device_not_rebound(self, leases):
+        """Test a device usbip-host already exports is not unbound and bound."""
+        server, mock_run = leases
+        with patch("usb_remote.server.read_usbip_status", return_value=1):
+            server.handle_device(
+                DeviceRequest(command="attach", bus="1-1.1"), "10.0.0.1"
+            )
+        mock_run.assert_not_called()
+
+    def test_used_device_rebound(self, leases):
+        """Test a device still attached by a client without a lease is rebound."""
+        server, mock_run = leases
+        with patch("usb_remote.server.read_usbip_status", return_value=2):
+            server.handle_device(
+                DeviceRequest(command="attach", bus="1-1.1"), "10.0.0.1"
+            )
+        commands = [call.args[0][2] for call in mock_run.call_args_list]
+        assert commands == ["unbind", "bind"]
+
+    def test_busy_over_socket(self, server):
+        """Test a busy device is reported to the client as DeviceBusyError."""
+        from usb_remote.client import send_request
+        from usb_remote.usbdevice import DeviceBusyError
+
+        request = DeviceRequest(command="attach", bus="1-1.1")
+        server.handle_device(request, "10.0.0.9")
+        with pytest.raises(DeviceBusyError, match="10.0.0.9"):
+            send_request(request, "127.0.0.1", server.port)
+
+
+class TestIdleSweeper:
+    """Test the server moves bound devices no client is using to the idle state."""
+
+    @pytest.fixture
+    def sweeper(self):
+        """Patch the bound devices and their usbip status."""
+        status = {"1-1.1": 1, "1-1.2": 2}
+        with (
+            patch("usb_remote.server.run_command") as mock_run,
+            patch("usb_remote.server.bound_devices", side_effect=lambda: list(status)),
+            patch("usb_remote.server.read_usbip_status", side_effect=status.get),
+        ):
+            yield status, mock_run
+
+    def test_idle_device_released(self, sweeper):
+        """Test an unused device is unbound once it has been idle long enough."""
+        _, mock_run = sweeper
+        server = CommandServer(port=0, idle_state="released", idle_timeout=0.1)
+
+        server.sweep()
+        mock_run.assert_not_called()
+        time.sleep(0.15)
+        server.sweep()
+
+        mock_run.assert_called_once()
+        assert mock_run.call_args.args[0] == ["sudo", "usbip", "unbind", "-b", "1-1.1"]
+        assert server.generation == 1
+
+    def test_used_device_kept(self, sweeper):
+        """Test the idle time of a device restarts while a client uses it."""
+        status, mock_run = sweeper
+        server = CommandServer(port=0, idle_state="released", idle_timeout=0.1)
+
+        server.sweep()
+        time.sleep(0.15)
+        status["1-1.1"] = 2
+        server.sweep()
+        status["1-1.1"] = 1
+        server.sweep()
+
+        mock_run.assert_not_called()
+
+    def test_leased_device_kept(self, sweeper, mock_get_device):
+        """Test an idle device is not released while a client holds its lease."""
+        _, mock_run = sweeper
+        server = CommandServer(port=0, idle_state="released", idle_timeout=0)
+        server.handle_device(DeviceRequest(command="attach", bus="1-1.1"), "10.0.0.1")
+
+        server.sweep()
+
+        mock_run.assert_not_called()
+
+    def test_bound_state(self, sweeper, mock_get_device):
+        """Test idle devices stay bound and failed ones are bound again."""
+        status, mock_run = sweeper
+        server = CommandServer(port=0, idle_state="bound", idle_timeout=0)
+        server.handle_device(DeviceRequest(command="detach", bus="1-1.1"), "10.0.0.1")
+        server.sweep()
+        mock_run.assert_not_called()
+
+        status["1-1.2"] = 3
+        server.sweep()
+        commands = [call.args[0][2:] for call in mock_run.call_args_list]
+        assert commands == [["unbind", "-b", "1-1.2"], ["bind", "-b", "1-1.2"]]
+
+    def test_invalid_idle_state(self):
+        """Test an unknown idle state is rejected."""
+        with pytest.raises(ValueError, match="Idle state"):
+            CommandServer(port=0, idle_state="asleep")
@@ -0,0 +1,161 @@
+"""Unit tests for the registry that answers list and find for a fleet of servers."""
+
+import random
+import socket
+import threading
+import time
+from unittest.mock import Mock, patch
+
+import pytest
+
+from usb_remote.api import DeviceRequest
+from usb_remote.client import (
+    registry_find_device,
+    registry_list_devices,
+    send_registry_request,
+)
+from usb_remote.client_api import ClientDeviceRequest
+from usb_remote.client_service import ClientService
+from usb_remote.config import UsbRemoteConfig
+from usb_remote.registry import Registry
+from usb_remote.usbdevice import DeviceNotFoundError, MultipleDevicesError
+
+
+@pytest.fixture
+def fleet(mock_usb_devices):
+    """Two servers, each with one of the mock devices."""
+    return {"pi1": [mock_usb_devices[0]], "pi2": [mock_usb_devices[1]]}
+
+
+@pytest.fixture
+def mock_list(fleet):
+    """Mock listing the devices of the servers in the fleet."""
+    with (
+        patch("usb_remote.registry.get_host_list", return_value=list(fleet)),
+        patch(
+            "usb_remote.registry.list_devices",
+            side_effect=lambda servers: {server: fleet[server] for server in servers},
+        ) as mock_list,
+    ):
+        yield mock_list
+
+
+@pytest.fixture
+def registry(mock_list):
+    """A registry following the fleet."""
+    return Registry(
+        host="127.0.0.1", port=random.randint(10000, 60000), beacon_address=""
+    )
+
+
+@pytest.fixture
+def running(registry):
+    """Start the registry and configure clients to use it."""
+    thread = threading.Thread(target=registry.start, daemon=True)
+    thread.start()
+    time.sleep(0.1)
+    config = UsbRemoteConfig(
+        registry="127.0.0.1", registry_port=registry.port, timeout=0.5
+    )
+    with patch("usb_remote.config.get_config", return_value=config):
+        yield registry
+    registry.stop()
+
+
+class TestRegistry:
+    """Test the registry keeps and searches the inventory of the fleet."""
+
+    def test_refresh_merges_servers(self, registry, fleet):
+        """Test the devices of every server are listed and merged."""
+        registry.refresh()
+        assert registry.inventory() == fleet
+
+    def test_find_by_id(self, registry, mock_usb_devices):
+        """Test a device is found on the server that owns it."""
+        registry.refresh()
+        device, server = registry.find(DeviceRequest(command="find", id="ABCD:EF01"))
+        assert (device, server) == (mock_usb_devices[1], "pi2")
+
+        device, server = registry.find(DeviceRequest(command="find", desc="*1"))
+        assert server == "pi1"
+
+    def test_find_errors(self, registry):
+        """Test finds match no device or several devices as servers report."""
+        registry.refresh()
+        with pytest.raises(DeviceNotFoundError, match="across 2 servers"):
+            registry.find(DeviceRequest(command="find", id="0000:0000"))
+        with pytest.raises(MultipleDevicesError, match="pi1"):
+            registry.find(DeviceRequest(command="find", desc="Test Device"))
+        _, server = registry.find(
+            DeviceRequest(command="find", desc="Test Device", first=True)
+        )
+        assert server == "pi1"
+
+    def test_beacon_servers_listed_on_change(self, registry, mock_list):
+        """Test servers that send beacons are listed again only when they change."""
+        registry.beacons = Mock()
+        registry.beacons.live_servers.return_value = []
+        registry.beacons.generation.return_value = 3
+
+        registry.refresh()
+        registry.refresh()
+        assert mock_list.call_count == 1
+
+        registry.beacons.generation.return_value = 4
+        registry.refresh()
+        assert mock_list.call_count == 2
+
+    def test_servers_without_beacons_polled(self, registry, mock_list):
+        """Test servers that send no beacons are listed at every refresh."""
+        registry.refresh()
+        registry.refresh()
+        assert mock_list.call_count == 2
+
+
+class TestRegistryClient:
+    """Test clients ask the registry and fall back to the servers."""
+
+    def test_list_and_find(self, running, fleet, mock_usb_devices):
+        """Test list and find are answered for the whole fleet in one request."""
+        running.refresh()
+        assert registry_list_devices() == fleet
+        assert registry_find_device(id="1234:5678") == (mock_usb_devices[0], "pi1")
+        with pytest.raises(DeviceNotFoundError):
+            registry_find_device(serial="NONE", desc="Other")
+
+    def test_attach_refused(self, running):
+        """Test the registry sends attach to the server that owns the device."""
+        request = DeviceRequest(command="attach", id="1234:5678")
+        with pytest.raises(RuntimeError, match="only answers list and find"):
+            send_registry_request(request, ("127.0.0.1", running.port))
+
+    def test_unreachable_registry(self):
+        """Test an unreachable registry leaves the client to ask the servers."""
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        config = UsbRemoteConfig(registry="127.0.0.1", registry_port=port)
+        with patch("usb_remote.config.get_config", return_value=config):
+            assert registry_list_devices() is None
+            assert registry_find_device(id="1234:5678") is None
+
+    def test_no_registry(self, mock_config):
+        """Test the registry is not used unless one is configured."""
+        assert registry_list_devices() is None
+
+    def test_client_service_uses_registry(self, mock_usb_devices):
+        """Test the client service asks the registry instead of every server."""
+        service = ClientService(socket_path="unused.sock")
+        with (
+            patch(
+                "usb_remote.client_service.registry_find_device",
+                return_value=(mock_usb_devices[1], "pi2"),
+            ),
+            patch("usb_remote.client_service.find_device") as mock_find,
+        ):
+            response = service.handle_device_command(
+                ClientDeviceRequest(command="find", id="abcd:ef01")
+            )
+
+        mock_find.assert_not_called()
+        assert response.server == "pi2"
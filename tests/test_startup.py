@@ -0,0 +1,97 @@
+"""Startup time budget for CLI subcommands, measured with ``python -X importtime``.
+
+The budgets are deliberately generous so that only a regression such as an
+eager import of a heavy dependency fails. Set USB_REMOTE_IMPORT_BUDGET_SCALE to
+scale them on unusually slow machines.
+"""
+
+import os
+import socket
+import subprocess
+import sys
+
+import pytest
+
+BUDGET_SCALE = float(os.environ.get("USB_REMOTE_IMPORT_BUDGET_SCALE", "1.0"))
+
+# subcommand arguments -> import time budget in seconds
+IMPORT_BUDGETS = {
+    ("--version",): 0.4,
+    ("--help",): 0.4,
+    ("list", "--help"): 0.4,
+    ("attach", "--help"): 0.4,
+    ("ports", "--help"): 0.4,
+    ("server", "--help"): 0.4,
+    ("config", "show"): 1.0,
+    # real commands, run against a server port that refuses connections
+    ("list", "--host", "127.0.0.1"): 1.0,
+    ("list",): 1.0,
+    ("find", "--bus", "1-1.1", "--host", "127.0.0.1"): 1.0,
+}
+
+# modules that only specific commands need
+HEAVY_MODULES = {
+    "pyudev",
+    "usb.core",
+    "usb_remote.client_service",
+    "usb_remote.port",
+    "usb_remote.server",
+}
+
+
+def import_times(args: tuple[str, ...], cwd) -> dict[str, tuple[float, bool]]:
+    """
+    Run the CLI under ``-X importtime``.
+
+    Returns:
+        Mapping of each imported module to its cumulative import time in seconds
+        and whether it was imported at the top level (not by another module)
+    """
+    # nothing listens on a port just released by a closed socket
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    (cwd / ".usb-remote.config").write_text(
+        f"servers: [127.0.0.1]\nserver_port: {port}\ntimeout: 0.5\n"
+    )
+    env = dict(
+        os.environ,
+        USB_REMOTE_CONFIG_PATH="",
+        USB_REMOTE_CLIENT_SOCKET=str(cwd / "no-client-service.sock"),
+        HOME=str(cwd),
+    )
+    # the commands report that the server is unreachable, which is not a failure
+    # of the import measurement
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "usb_remote", *args],
+        capture_output=True,
+        text=True,
+        cwd=cwd,
+        env=env,
+        stdin=subprocess.DEVNULL,
+        timeout=30,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        # nested imports are indented beyond the single leading space
+        times[name.strip()] = (int(cumulative) / 1e6, not name.startswith("  "))
+    return times
+
+
+@pytest.mark.parametrize("args", list(IMPORT_BUDGETS))
+def test_import_time_budget(args, tmp_path):
+    """Test that each subcommand imports within its time budget."""
+    times = import_times(args, tmp_path)
+    top_level = {name: t for name, (t, top) in times.items() if top}
+    total = sum(top_level.values())
+    budget = IMPORT_BUDGETS[args] * BUDGET_SCALE
+    slowest = sorted(top_level.items(), key=lambda item: -item[1])[:5]
+    assert total < budget, f"{' '.join(args)} imports took {total:.3f}s: {slowest}"
+    # commands that don't need them must not pay for pyudev, pyusb or services
+    assert not times.keys() & HEAVY_MODULES
+    if args[0] in ("list", "find") and "--help" not in args:
+        # the command ran, so the imports of its real code path were measured
+        assert "usb_remote.client" in times
@@ -5,8 +5,10 @@ These tests use the same subprocess mocks as test_system_integration
 but test the CLI commands directly.
 """
 
+import socket
 from unittest.mock import patch
 
+import pytest
 from typer.testing import CliRunner
 
 from usb_remote.__main__ import app
@@ -171,9 +173,9 @@ class TestSystemCLI:
 
         # Patch discover_config_path to return our temp file
         with patch(
-            "usb_remote.__main__.discover_config_path", return_value=str(config_file)
+            "usb_remote.config.discover_config_path", return_value=str(config_file)
         ):
-            with patch("usb_remote.__main__.get_config", return_value=test_config):
+            with patch("usb_remote.config.get_config", return_value=test_config):
                 result = runner.invoke(app, ["config", "show"])
 
         assert result.exit_code == 0, f"Command failed: {result.stdout}"
@@ -183,10 +185,8 @@ class TestSystemCLI:
 
     def test_config_show_no_config(self, mock_subprocess_run):
         """Test config show command with no config file."""
-        with patch("usb_remote.__main__.discover_config_path", return_value=None):
-            with patch(
-                "usb_remote.__main__.get_config", return_value=UsbRemoteConfig()
-            ):
+        with patch("usb_remote.config.discover_config_path", return_value=None):
+            with patch("usb_remote.config.get_config", return_value=UsbRemoteConfig()):
                 result = runner.invoke(app, ["config", "show"])
 
         assert result.exit_code == 0
@@ -199,10 +199,10 @@ class TestSystemCLI:
         test_config = UsbRemoteConfig(servers=["existing.server"])
 
         with patch(
-            "usb_remote.__main__.discover_config_path", return_value=str(config_file)
+            "usb_remote.config.discover_config_path", return_value=str(config_file)
         ):
-            with patch("usb_remote.__main__.get_config", return_value=test_config):
-                with patch("usb_remote.__main__.save_servers") as mock_save:
+            with patch("usb_remote.config.get_config", return_value=test_config):
+                with patch("usb_remote.config.save_servers") as mock_save:
                     result = runner.invoke(app, ["config", "add-server", "new.server"])
 
         assert result.exit_code == 0, f"Command failed: {result.stdout}"
@@ -219,9 +219,9 @@ class TestSystemCLI:
         test_config = UsbRemoteConfig(servers=["existing.server"])
 
         with patch(
-            "usb_remote.__main__.discover_config_path", return_value=str(config_file)
+            "usb_remote.config.discover_config_path", return_value=str(config_file)
         ):
-            with patch("usb_remote.__main__.get_config", return_value=test_config):
+            with patch("usb_remote.config.get_config", return_value=test_config):
                 result = runner.invoke(app, ["config", "add-server", "existing.server"])
 
         assert result.exit_code == 1
@@ -234,10 +234,10 @@ class TestSystemCLI:
         test_config = UsbRemoteConfig(servers=["server1", "server2"])
 
         with patch(
-            "usb_remote.__main__.discover_config_path", return_value=str(config_file)
+            "usb_remote.config.discover_config_path", return_value=str(config_file)
         ):
-            with patch("usb_remote.__main__.get_config", return_value=test_config):
-                with patch("usb_remote.__main__.save_servers") as mock_save:
+            with patch("usb_remote.config.get_config", return_value=test_config):
+                with patch("usb_remote.config.save_servers") as mock_save:
                     result = runner.invoke(app, ["config", "rm-server", "server1"])
 
         assert result.exit_code == 0, f"Command failed: {result.stdout}"
@@ -254,9 +254,9 @@ class TestSystemCLI:
         test_config = UsbRemoteConfig(servers=["server1"])
 
         with patch(
-            "usb_remote.__main__.discover_config_path", return_value=str(config_file)
+            "usb_remote.config.discover_config_path", return_value=str(config_file)
         ):
-            with patch("usb_remote.__main__.get_config", return_value=test_config):
+            with patch("usb_remote.config.get_config", return_value=test_config):
                 result = runner.invoke(app, ["config", "rm-server", "server2"])
 
         assert result.exit_code == 1
@@ -264,7 +264,7 @@ class TestSystemCLI:
 
     def test_config_rm_server_no_config_file(self, mock_subprocess_run):
         """Test config rm-server command when no config file exists."""
-        with patch("usb_remote.__main__.discover_config_path", return_value=None):
+        with patch("usb_remote.config.discover_config_path", return_value=None):
             result = runner.invoke(app, ["config", "rm-server", "server1"])
 
         assert result.exit_code == 1
@@ -276,22 +276,27 @@ class TestSystemCLI:
         test_config = UsbRemoteConfig(timeout=1.0)
 
         with patch(
-            "usb_remote.__main__.discover_config_path", return_value=str(config_file)
+            "usb_remote.config.discover_config_path", return_value=str(config_file)
         ):
-            with patch("usb_remote.__main__.get_config", return_value=test_config):
+            with patch("usb_remote.config.get_config", return_value=test_config):
                 # Mock the to_file method on the config module, not the instance
-                with patch("usb_remote.config.UsbRemoteConfig.to_file") as mock_to_file:
+                with patch(
+                    "usb_remote.config.UsbRemoteConfig.to_file", autospec=True
+                ) as mock_to_file:
                     result = runner.invoke(app, ["config", "set-timeout", "10.5"])
 
         assert result.exit_code == 0, f"Command failed: {result.stdout}"
         assert "Set timeout to 10.5s" in result.stdout
-        assert test_config.timeout == 10.5
         mock_to_file.assert_called_once()
+        # a copy is saved, the cached config is not changed
+        (saved,) = mock_to_file.call_args.args
+        assert saved.timeout == 10.5
+        assert test_config.timeout == 1.0
 
     def test_config_set_timeout_invalid(self, mock_subprocess_run):
         """Test config set-timeout command with invalid value."""
         test_config = UsbRemoteConfig(timeout=1.0)
-        with patch("usb_remote.__main__.get_config", return_value=test_config):
+        with patch("usb_remote.config.get_config", return_value=test_config):
             result = runner.invoke(app, ["config", "set-timeout", "0"])
 
         assert result.exit_code == 1
@@ -300,7 +305,7 @@ class TestSystemCLI:
     def test_config_set_timeout_negative(self, mock_subprocess_run):
         """Test config set-timeout command with negative value."""
         test_config = UsbRemoteConfig(timeout=1.0)
-        with patch("usb_remote.__main__.get_config", return_value=test_config):
+        with patch("usb_remote.config.get_config", return_value=test_config):
             result = runner.invoke(app, ["config", "set-timeout", "-1.5"])
 
         # Typer returns exit code 2 for invalid arg types (negative parsed as option)
@@ -372,3 +377,93 @@ class TestSystemCLI:
         assert result.exit_code == 0
         # Debug flag should enable logging but not break functionality
         assert "2e8a:000a" in result.stdout
+
+
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+class TestClientServiceForwarding:
+    """Test CLI commands forwarding to a running client service."""
+
+    @pytest.fixture(autouse=True)
+    def service_config(self, test_config):
+        """Give the service the config that the CLI is patched to use."""
+        with patch("usb_remote.client_service.get_config", return_value=test_config):
+            yield test_config
+
+    def test_list_forwarded(self, client_service_instance, monkeypatch):
+        """Test list is answered by the client service when it is running."""
+        monkeypatch.setenv(
+            "USB_REMOTE_CLIENT_SOCKET", client_service_instance.socket_path
+        )
+        with patch("usb_remote.client.list_devices") as mock_list:
+            result = runner.invoke(app, ["list", "--host", "127.0.0.1"])
+
+        assert result.exit_code == 0, f"Command failed: {result.stdout}"
+        mock_list.assert_not_called()
+        assert "=== 127.0.0.1 ===" in result.stdout
+        assert "2e8a:000a" in result.stdout
+
+    def test_find_forwarded(self, client_service_instance, monkeypatch):
+        """Test find is answered by the client service when it is running."""
+        monkeypatch.setenv(
+            "USB_REMOTE_CLIENT_SOCKET", client_service_instance.socket_path
+        )
+        with patch("usb_remote.__main__._find_device") as mock_find:
+            result = runner.invoke(
+                app, ["find", "--bus", "1-1.1", "--host", "127.0.0.1"]
+            )
+
+        assert result.exit_code == 0, f"Command failed: {result.stdout}"
+        mock_find.assert_not_called()
+        assert "Found device on 127.0.0.1" in result.stdout
+
+    def test_find_forwarded_not_found(self, client_service_instance, monkeypatch):
+        """Test client service errors are raised as the direct mode errors."""
+        from usb_remote.client_api import ClientDeviceRequest, send_client_request
+        from usb_remote.usbdevice import DeviceNotFoundError
+
+        request = ClientDeviceRequest(command="find", bus="9-9", host="127.0.0.1")
+        with pytest.raises(DeviceNotFoundError):
+            send_client_request(request, client_service_instance.socket_path)
+
+    def test_other_config_falls_back(self, client_service_instance):
+        """Test the service declines requests made with other servers."""
+        from usb_remote.client_api import ClientDeviceRequest, send_client_request
+
+        caller_config = UsbRemoteConfig(servers=["elsewhere.example.com"])
+        with patch(
+            "usb_remote.client_service.get_config", return_value=UsbRemoteConfig()
+        ):
+            request = ClientDeviceRequest(command="list", config=caller_config)
+            assert (
+                send_client_request(request, client_service_instance.socket_path)
+                is None
+            )
+
+            # the configured servers are not used for a single host
+            request = ClientDeviceRequest(
+                command="list", host="127.0.0.1", config=caller_config
+            )
+            assert send_client_request(request, client_service_instance.socket_path)
+
+    def test_opt_out(self, client_service_instance, monkeypatch):
+        """Test USB_REMOTE_NO_CLIENT_SERVICE stops the CLI forwarding."""
+        from usb_remote.client_api import ClientDeviceRequest, send_client_request
+
+        monkeypatch.setenv(
+            "USB_REMOTE_CLIENT_SOCKET", client_service_instance.socket_path
+        )
+        monkeypatch.setenv("USB_REMOTE_NO_CLIENT_SERVICE", "1")
+        request = ClientDeviceRequest(command="list", host="127.0.0.1")
+        assert send_client_request(request) is None
+
+    def test_stale_socket_falls_back(self, isolated_client_socket):
+        """Test a socket file with no client service behind it is ignored."""
+        from usb_remote.client_api import ClientDeviceRequest, send_client_request
+
+        # leave a socket file behind as a crashed client service would
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(str(isolated_client_socket))
+        sock.close()
+
+        request = ClientDeviceRequest(command="list")
+        assert send_client_request(request) is None
@@ -0,0 +1,186 @@
+"""Tests for the native usbip protocol client and vhci_hcd attach."""
+
+import errno
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from usb_remote.api import ListResponse
+from usb_remote.client import attach_device, list_devices
+from usb_remote.port import read_vhci_record, vhci_attach, vhci_detach
+from usb_remote.usbip import UsbipError, import_device, list_exported
+
+STATUS = """\
+hub port sta spd dev      sockfd local_busid
+hs  0000 006 002 00010002 000003 3-1
+hs  0001 004 000 00000000 000000 0-0
+ss  0002 004 000 00000000 000000 0-0
+"""
+
+
+@pytest.fixture
+def vhci(isolated_vhci):
+    """A fake vhci_hcd controller with port 0 in use."""
+    controller = isolated_vhci / "platform" / "vhci_hcd.0"
+    controller.mkdir(parents=True)
+    (controller / "status").write_text(STATUS)
+    (controller / "attach").touch()
+    (controller / "detach").touch()
+    return controller
+
+
+class TestImport:
+    """Test the OP_REQ_IMPORT handshake."""
+
+    def test_import_device(self, fake_usbipd):
+        """Test importing a device exported by usbipd."""
+        sock, device = import_device("127.0.0.1", "1-1.1", fake_usbipd.port)
+        sock.close()
+
+        assert device.busid == "1-1.1"
+        assert device.devid == (1 << 16) | device.devnum
+        assert fake_usbipd.imported == ["1-1.1"]
+
+    def test_import_unknown_device(self, fake_usbipd):
+        """Test usbipd refusing to export a device."""
+        with pytest.raises(UsbipError, match="status 1"):
+            import_device("127.0.0.1", "9-9", fake_usbipd.port)
+
+
+class TestVhciAttach:
+    """Test attaching and detaching through the vhci_hcd sysfs files."""
+
+    def test_attach_usb2(self, vhci, fake_usbipd):
+        """Test a USB 2 device is attached to the first free hs port."""
+        port = vhci_attach("127.0.0.1", "1-1.1", fake_usbipd.port)
+
+        assert port == 1
+        local_port, sockfd, devid, speed = (vhci / "attach").read_text().split()
+        assert (local_port, devid, speed) == ("1", str((1 << 16) | 4), "3")
+        assert int(sockfd) > 0
+        assert read_vhci_record(1) == ("127.0.0.1", "1-1.1")
+
+    def test_attach_usb3(self, vhci, fake_usbipd):
+        """Test a USB 3 device is attached to a free ss port."""
+        assert vhci_attach("127.0.0.1", "2-1", fake_usbipd.port) == 2
+
+    def test_no_free_port(self, vhci, fake_usbipd):
+        """Test attaching fails cleanly when every port is in use."""
+        (vhci / "status").write_text(STATUS.replace(" 004 ", " 006 "))
+
+        with pytest.raises(RuntimeError, match="No free vhci_hcd hs port"):
+            vhci_attach("127.0.0.1", "1-1.1", fake_usbipd.port)
+
+    def test_port_taken(self, vhci, fake_usbipd):
+        """Test a port taken by another process is skipped for the next."""
+        (vhci / "status").write_text(STATUS.replace("ss  0002", "hs  0002"))
+        write_text = Path.write_text
+
+        def attach_busy(path, data):
+            if path.name == "attach" and data.startswith("1 "):
+                raise OSError(errno.EBUSY, "Device or resource busy")
+            return write_text(path, data)
+
+        with patch.object(Path, "write_text", attach_busy):
+            assert vhci_attach("127.0.0.1", "1-1.1", fake_usbipd.port) == 2
+
+    def test_attach_error(self, vhci, fake_usbipd):
+        """Test a kernel error other than a taken port is raised."""
+
+        def attach_invalid(path, data):
+            raise OSError(errno.EINVAL, "Invalid argument")
+
+        with (
+            patch.object(Path, "write_text", attach_invalid),
+            pytest.raises(OSError, match="Invalid argument"),
+        ):
+            vhci_attach("127.0.0.1", "1-1.1", fake_usbipd.port)
+
+    def test_detach(self, vhci, fake_usbipd):
+        """Test detaching writes the port and removes its record."""
+        vhci_attach("127.0.0.1", "1-1.1", fake_usbipd.port)
+
+        vhci_detach(1)
+
+        assert (vhci / "detach").read_text() == "1"
+        assert read_vhci_record(1) is None
+
+    def test_attach_device_native(self, vhci, mock_config):
+        """Test attach_device uses vhci_hcd rather than running usbip."""
+        with (
+            patch("usb_remote.client.send_request"),
+            patch("usb_remote.client.run_command") as mock_run,
+            patch("usb_remote.port.vhci_available", return_value=True),
+            patch("usb_remote.port.vhci_attach") as mock_attach,
+        ):
+            attach_device("1-1.1", "localhost")
+
+        mock_run.assert_not_called()
+        mock_attach.assert_called_once_with("localhost", "1-1.1", timeout=0.1)
+
+
+class TestDevlist:
+    """Test listing the devices exported by usbipd (OP_REQ_DEVLIST)."""
+
+    def test_list_exported(self, fake_usbipd):
+        """Test devices and their interfaces are decoded."""
+        devices = list_exported("127.0.0.1", fake_usbipd.port)
+
+        assert [d.busid for d in devices] == ["1-1.1", "2-1"]
+        assert devices[0].interfaces == [(0x02, 0x02, 0x01), (0x0A, 0, 0)]
+        assert devices[1].speed == 5
+
+    def test_to_usb_device(self, fake_usbipd):
+        """Test exported devices convert to UsbDevice records."""
+        devices = list_exported("127.0.0.1", fake_usbipd.port)
+
+        device = devices[1].to_usb_device()
+
+        assert device.bus_id == "2-1"
+        assert (device.vendor_id, device.product_id) == ("0781", "5581")
+        assert device.bus == 2
+        assert device.port_numbers == (1,)
+        assert device.exported
+        assert device.interface_classes == (0x08,)
+
+    def test_list_devices_merges_exported(self, fake_usbipd, mock_usb_devices):
+        """Test list_devices marks the server's devices that usbipd exports."""
+        response = ListResponse(status="success", data=mock_usb_devices)
+        with (
+            patch("usb_remote.client._get_response", return_value=response),
+            patch(
+                "usb_remote.client.list_exported",
+                side_effect=lambda host, timeout: list_exported(
+                    host, fake_usbipd.port, timeout
+                ),
+            ),
+        ):
+            results = list_devices(["127.0.0.1"], timeout=1.0, exported=True)
+
+        devices = {d.bus_id: d for d in results["127.0.0.1"]}
+        # 1-1.1 is listed by the server and exported, 2-2.1 is not bound and
+        # 2-1 is exported but unknown to the server
+        assert devices["1-1.1"].exported
+        assert devices["1-1.1"].description == "Test Device 1"
+        assert devices["1-1.1"].interface_classes == (0x02, 0x0A)
+        assert not devices["2-2.1"].exported
+        assert devices["2-1"].exported
+
+    def test_list_devices_without_server(self, fake_usbipd):
+        """Test exported devices are listed when the usb-remote server is down."""
+        with (
+            patch(
+                "usb_remote.client._get_response",
+                side_effect=ConnectionRefusedError(),
+            ),
+            patch(
+                "usb_remote.client.list_exported",
+                side_effect=lambda host, timeout: list_exported(
+                    host, fake_usbipd.port, timeout
+                ),
+            ),
+        ):
+            results = list_devices(["127.0.0.1"], timeout=1.0, exported=True)
+
+        assert [d.bus_id for d in results["127.0.0.1"]] == ["1-1.1", "2-1"]
@@ -0,0 +1,390 @@
+"""Unit tests for utility helpers."""
+
+import socket
+import subprocess
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+from usb_remote.discovery import MAX_MISSED_SCANS, DiscoveryCache
+from usb_remote.utility import (
+    _parse_ip_range,
+    _scan_hosts,
+    _scan_ip_ranges,
+    command_stats,
+    get_host_list,
+    run_command,
+)
+
+
+@pytest.fixture
+def listeners():
+    """Listen on a free port at 127.0.0.2 and 127.0.0.4 (Linux loopback /8)."""
+    sockets = []
+    port = None
+    for address in ("127.0.0.4", "127.0.0.2"):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((address, port or 0))
+        sock.listen(5)
+        port = sock.getsockname()[1]
+        sockets.append(sock)
+    yield port
+    for sock in sockets:
+        sock.close()
+
+
+class TestScanIpRange:
+    """Test scanning of server_ranges."""
+
+    def test_scan_finds_listeners_in_address_order(self, listeners):
+        """Test that only listening addresses are returned, sorted by address."""
+        result = _scan_ip_ranges(["127.0.0.1-6"], listeners)
+        assert list(result) == ["127.0.0.2", "127.0.0.4"]
+
+    def test_scan_cidr_and_full_ranges(self, listeners):
+        """Test that CIDR and full start-end ranges are scanned."""
+        assert list(_scan_ip_ranges(["127.0.0.0/29"], listeners)) == [
+            "127.0.0.2",
+            "127.0.0.4",
+        ]
+        assert list(_scan_ip_ranges(["127.0.0.3-127.0.0.5"], listeners)) == [
+            "127.0.0.4"
+        ]
+
+    def test_scan_invalid_range(self, listeners):
+        """Test that invalid ranges are skipped and valid ones still scanned."""
+        result = _scan_ip_ranges(
+            ["127.0.0.0/8", "127.0.0.1-999", "127.0.0.1-2"], listeners
+        )
+        assert list(result) == ["127.0.0.2"]
+
+    def test_scan_rate_limit(self, listeners):
+        """Test that probes beyond the initial burst are paced by the rate."""
+        hosts = [f"127.0.0.{i}" for i in range(1, 65)]
+        start = time.monotonic()
+        result = _scan_hosts(hosts, listeners, rate=200)
+        # 32 probes in the burst, the remaining 32 take at least 0.15s at 200/s
+        assert time.monotonic() - start >= 0.15
+        assert list(result) == ["127.0.0.2", "127.0.0.4"]
+
+    def test_scan_respects_concurrency_cap(self, listeners):
+        """Test that a small concurrency cap still probes every host."""
+        hosts = [f"127.0.0.{i}" for i in range(1, 7)]
+        result = _scan_hosts(hosts, listeners, max_concurrency=2)
+        assert list(result) == ["127.0.0.2", "127.0.0.4"]
+
+    def test_scan_single_deadline(self):
+        """Test that unresponsive hosts are probed in parallel, not in sequence."""
+        # TEST-NET-1 addresses are never routed so connects hang until timeout
+        hosts = [f"192.0.2.{i}" for i in range(1, 51)]
+        start = time.monotonic()
+        result = _scan_hosts(hosts, 5055, timeout=0.2)
+        assert result == {}
+        assert time.monotonic() - start < 1.0
+
+    def test_scan_sends_request(self):
+        """Test that a request is sent on the probing connection."""
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.bind(("127.0.0.2", 0))
+        server.listen(1)
+        port = server.getsockname()[1]
+
+        def reply():
+            client, _ = server.accept()
+            with client:
+                client.sendall(b"reply to " + client.recv(1024))
+
+        thread = threading.Thread(target=reply)
+        thread.start()
+        try:
+            result = _scan_hosts(
+                ["127.0.0.1", "127.0.0.2"],
+                port,
+                request=b"list",
+                response_timeout=1.0,
+            )
+        finally:
+            thread.join()
+            server.close()
+
+        assert result == {"127.0.0.2": b"reply to list"}
+
+    def test_scan_slow_reply_still_found(self, listeners):
+        """Test that a server that does not reply in time is still returned."""
+        result = _scan_hosts(
+            ["127.0.0.2"], listeners, request=b"list", response_timeout=0.05
+        )
+        assert result == {"127.0.0.2": b""}
+
+    def test_get_host_list_reads_port_once(self, listeners):
+        """Test that the server port is looked up once for all ranges."""
+        with (
+            patch("usb_remote.utility.get_servers", return_value=[]),
+            patch(
+                "usb_remote.utility.get_server_ranges",
+                return_value=["127.0.0.1-3", "127.0.0.4-5"],
+            ),
+            patch(
+                "usb_remote.utility.get_server_port", return_value=listeners
+            ) as mock_port,
+        ):
+            servers = get_host_list(None)
+
+        assert servers == ["127.0.0.2", "127.0.0.4"]
+        mock_port.assert_called_once()
+
+
+class TestParseIpRange:
+    """Test parsing of server_ranges entries."""
+
+    @pytest.mark.parametrize(
+        "spec, first, last",
+        [
+            ("192.168.1.30-40", "192.168.1.30", "192.168.1.40"),
+            ("10.20.0.250-10.20.1.5", "10.20.0.250", "10.20.1.5"),
+            ("10.20.0.0/22", "10.20.0.1", "10.20.3.254"),
+            ("10.20.0.7/32", "10.20.0.7", "10.20.0.7"),
+        ],
+    )
+    def test_valid(self, spec, first, last):
+        """Test each supported range format."""
+        start_ip, end_ip = _parse_ip_range(spec)
+        assert (str(start_ip), str(end_ip)) == (first, last)
+
+    @pytest.mark.parametrize(
+        "spec",
+        ["10.0.0.0/8", "10.0.0.9-1", "10.0.0.1-::1", "10.0.0.1", "not-an-ip"],
+    )
+    def test_invalid(self, spec):
+        """Test rejection of malformed, reversed or oversized ranges."""
+        with pytest.raises(ValueError):
+            _parse_ip_range(spec)
+
+
+class TestDiscoveryCache:
+    """Test reuse of server_ranges scan results between invocations."""
+
+    ranges = ["10.0.0.1-10"]
+
+    @pytest.fixture(autouse=True)
+    def config(self):
+        with (
+            # a new list each call, as get_servers returns a copy
+            patch("usb_remote.utility.get_servers", side_effect=list),
+            patch("usb_remote.utility.get_server_ranges", return_value=self.ranges),
+            patch("usb_remote.utility.get_server_port", return_value=5055),
+            patch("usb_remote.utility.get_discovery_ttl", return_value=60.0),
+        ):
+            yield
+
+    def write_cache(self, path, age, servers=("10.0.0.5",), ranges=None):
+        cache = DiscoveryCache()
+        cache.update(ranges or self.ranges, 5055, list(servers))
+        cache.scanned_at -= age
+        cache.to_file(path)
+
+    def test_scan_populates_cache(self, isolated_cache):
+        """Test that a missing cache is filled by a scan."""
+        with patch(
+            "usb_remote.utility._scan_ip_ranges", return_value={"10.0.0.3": b""}
+        ) as scan:
+            assert get_host_list(None) == ["10.0.0.3"]
+
+        scan.assert_called_once_with(self.ranges, 5055, None)
+        cache = DiscoveryCache.from_file(isolated_cache)
+        assert list(cache.servers) == ["10.0.0.3"]
+        assert cache.is_fresh(60.0)
+
+    def test_fresh_cache_skips_scan(self, isolated_cache):
+        """Test that a fresh cache is used without scanning."""
+        self.write_cache(isolated_cache, age=10)
+        with patch("usb_remote.utility._scan_ip_ranges") as scan:
+            assert get_host_list(None) == ["10.0.0.5"]
+        scan.assert_not_called()
+
+    def test_stale_cache_refreshes_in_background(self, isolated_cache):
+        """Test that a stale cache is returned and refreshed afterwards."""
+        self.write_cache(isolated_cache, age=120)
+        with patch(
+            "usb_remote.utility._scan_ip_ranges", return_value={"10.0.0.7": b""}
+        ) as scan:
+            assert get_host_list(None) == ["10.0.0.5"]
+            for thread in threading.enumerate():
+                if thread.name == "discovery-refresh":
+                    thread.join()
+
+        scan.assert_called_once()
+        # the server that missed one scan is kept, with its own last-seen time
+        cache = DiscoveryCache.from_file(isolated_cache)
+        assert list(cache.servers) == ["10.0.0.5", "10.0.0.7"]
+        assert cache.servers["10.0.0.5"] < cache.servers["10.0.0.7"]
+
+    def test_missed_scan_still_listed(self, isolated_cache):
+        """Test a server that misses one scan is still listed."""
+        self.write_cache(isolated_cache, age=0, servers=("10.0.0.5", "10.0.0.7"))
+        with patch(
+            "usb_remote.utility._scan_ip_ranges", return_value={"10.0.0.7": b""}
+        ):
+            assert get_host_list(None, rescan=True) == ["10.0.0.5", "10.0.0.7"]
+
+    def test_server_forgotten_after_missed_scans(self, isolated_cache):
+        """Test a server is removed once it misses several scans in a row."""
+        self.write_cache(isolated_cache, age=0, servers=("10.0.0.5", "10.0.0.7"))
+        with patch(
+            "usb_remote.utility._scan_ip_ranges", return_value={"10.0.0.7": b""}
+        ):
+            for _ in range(MAX_MISSED_SCANS - 1):
+                assert "10.0.0.5" in get_host_list(None, rescan=True)
+            assert get_host_list(None, rescan=True) == ["10.0.0.7"]
+
+    def test_responding_resets_misses(self):
+        """Test only consecutive missed scans count towards removal."""
+        cache = DiscoveryCache()
+        cache.update(self.ranges, 5055, ["10.0.0.5"])
+        for _ in range(MAX_MISSED_SCANS - 1):
+            cache.update(self.ranges, 5055, [])
+        cache.update(self.ranges, 5055, ["10.0.0.5"])
+        for _ in range(MAX_MISSED_SCANS - 1):
+            cache.update(self.ranges, 5055, [])
+
+        assert list(cache.servers) == ["10.0.0.5"]
+
+    def test_rescan_ignores_fresh_cache(self, isolated_cache):
+        """Test that rescan=True always scans."""
+        self.write_cache(isolated_cache, age=0)
+        with patch("usb_remote.utility._scan_ip_ranges", return_value={}) as scan:
+            assert get_host_list(None, rescan=True) == ["10.0.0.5"]
+        scan.assert_called_once()
+
+    def test_changed_ranges_invalidate_cache(self, isolated_cache):
+        """Test that a cache built from other ranges is not used."""
+        self.write_cache(isolated_cache, age=0, ranges=["10.9.9.0/24"])
+        with patch(
+            "usb_remote.utility._scan_ip_ranges", return_value={"10.0.0.1": b""}
+        ) as scan:
+            assert get_host_list(None) == ["10.0.0.1"]
+        scan.assert_called_once()
+
+
+class TestRunCommand:
+    """Test the limits, caching and timing of commands."""
+
+    def test_timeout(self):
+        """Test a command that runs too long is killed."""
+        with (
+            patch(
+                "subprocess.run",
+                side_effect=subprocess.TimeoutExpired(["usbip", "port"], 0.1),
+            ) as mock_run,
+            pytest.raises(RuntimeError, match="timed out"),
+        ):
+            run_command(["usbip", "port"], timeout=0.1)
+
+        assert mock_run.call_args.kwargs["timeout"] == 0.1
+
+    def test_read_only_result_reused(self):
+        """Test a cached command runs once within its time to live."""
+        result = subprocess.CompletedProcess([], 0, "busid=1-1.1#", "")
+        with patch("subprocess.run", return_value=result) as mock_run:
+            first = run_command(["usbip", "list", "-pl"], cache_ttl=10)
+            second = run_command(["usbip", "list", "-pl"], cache_ttl=10)
+
+        assert mock_run.call_count == 1
+        assert first is second
+        assert command_stats()["usbip list"].cached >= 1
+
+    def test_result_expires(self):
+        """Test a cached command runs again once its result expires."""
+        result = subprocess.CompletedProcess([], 0, "", "")
+        with patch("subprocess.run", return_value=result) as mock_run:
+            run_command(["lsusb", "-s", "001:002"], cache_ttl=0.01)
+            time.sleep(0.02)
+            run_command(["lsusb", "-s", "001:002"], cache_ttl=0.01)
+
+        assert mock_run.call_count == 2
+
+    def test_other_command_clears_cache(self):
+        """Test a command that may change the devices forgets cached results."""
+        result = subprocess.CompletedProcess([], 0, "", "")
+        with patch("subprocess.run", return_value=result) as mock_run:
+            run_command(["usbip", "list", "-pl"], cache_ttl=10)
+            run_command(["sudo", "usbip", "bind", "-b", "1-1.1"])
+            run_command(["usbip", "list", "-pl"], cache_ttl=10)
+
+        assert mock_run.call_count == 3
+
+    def test_failure_not_cached(self):
+        """Test a failed read-only command is run again."""
+        result = subprocess.CompletedProcess([], 1, "", "")
+        with patch("subprocess.run", return_value=result) as mock_run:
+            run_command(["usbip", "list", "-pl"], check=False, cache_ttl=10)
+            run_command(["usbip", "list", "-pl"], check=False, cache_ttl=10)
+
+        assert mock_run.call_count == 2
+
+    def test_concurrent_calls_share_run(self):
+        """Test concurrent calls of a cached command wait for a single run."""
+
+        def slow_run(command, **kwargs):
+            time.sleep(0.1)
+            return subprocess.CompletedProcess(command, 0, "", "")
+
+        with patch("subprocess.run", side_effect=slow_run) as mock_run:
+            threads = [
+                threading.Thread(
+                    target=run_command,
+                    args=(["usbip", "list", "-pl"],),
+                    kwargs={"cache_ttl": 10},
+                )
+                for _ in range(4)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        assert mock_run.call_count == 1
+
+    def test_concurrency_cap(self):
+        """Test no more than the allowed number of commands run at once."""
+        running = []
+        peak = []
+        lock = threading.Lock()
+
+        def slow_run(command, **kwargs):
+            with lock:
+                running.append(command)
+                peak.append(len(running))
+            time.sleep(0.05)
+            with lock:
+                running.remove(command)
+            return subprocess.CompletedProcess(command, 0, "", "")
+
+        with (
+            patch("usb_remote.utility._command_slots", threading.BoundedSemaphore(2)),
+            patch("subprocess.run", side_effect=slow_run),
+        ):
+            threads = [
+                threading.Thread(target=run_command, args=(["true", str(i)],))
+                for i in range(6)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        assert max(peak) == 2
+
+    def test_stats(self):
+        """Test each run is timed under the command's name."""
+        before = command_stats().get("usbip port")
+        result = subprocess.CompletedProcess([], 0, "", "")
+        with patch("subprocess.run", return_value=result):
+            run_command(["sudo", "usbip", "port"], check=False)
+
+        stats = command_stats()["usbip port"]
+        assert stats.runs == (before.runs if before else 0) + 1
+        assert stats.max_seconds >= 0